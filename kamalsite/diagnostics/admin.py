@@ -0,0 +1,51 @@
+from django.contrib import admin
+from django.core.cache import cache
+from django.utils.html import format_html
+
+from shop.admin import admin_site
+
+from .models import ProfilingSwitch, RequestProfile
+from .profiling import SWITCH_KEY
+
+
+class ProfilingSwitchAdmin(admin.ModelAdmin):
+    list_display = ["__str__", "enabled", "path_prefix", "remaining"]
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        # Take effect right away rather than when the cached state expires.
+        cache.delete(SWITCH_KEY)
+
+
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = ["date_created", "method", "path", "status", "duration"]
+    list_filter = ["method", "status"]
+    search_fields = ["path"]
+    fields = [
+        "date_created",
+        "method",
+        "path",
+        "status",
+        "duration",
+        "top_functions",
+        "top_allocations",
+    ]
+    readonly_fields = fields
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description="top functions (cumulative time)")
+    def top_functions(self, obj):
+        return format_html("<pre>{}</pre>", obj.cpu_stats)
+
+    @admin.display(description="top allocation sites")
+    def top_allocations(self, obj):
+        return format_html("<pre>{}</pre>", obj.memory_stats)
+
+
+admin_site.register(ProfilingSwitch, ProfilingSwitchAdmin)
+admin_site.register(RequestProfile, RequestProfileAdmin)
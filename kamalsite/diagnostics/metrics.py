@@ -0,0 +1,149 @@
+"""
+Per-view request metrics kept in memory and exported in the Prometheus
+text format. Each worker process keeps its own numbers, so scrape every
+worker or run one worker per scrape target.
+"""
+import bisect
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import connections
+
+# Upper bounds of latency histogram buckets, in seconds.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class ViewStats:
+    def __init__(self):
+        self.count = 0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.duration = 0.0
+        self.queries = 0
+        self.db_duration = 0.0
+
+
+class Registry:
+    def __init__(self):
+        self.views = {}
+        self.lock = threading.Lock()
+
+    def observe(self, view, duration, queries, db_duration):
+        with self.lock:
+            stats = self.views.get(view)
+            if stats is None:
+                stats = self.views[view] = ViewStats()
+            stats.count += 1
+            stats.buckets[bisect.bisect_left(BUCKETS, duration)] += 1
+            stats.duration += duration
+            stats.queries += queries
+            stats.db_duration += db_duration
+
+    def export(self):
+        """
+        Return all metrics in the Prometheus text exposition format.
+        """
+        with self.lock:
+            views = sorted(self.views.items())
+            lines = [
+                "# HELP kamalsite_requests_total Requests handled per view.",
+                "# TYPE kamalsite_requests_total counter",
+            ]
+            lines += [
+                f'kamalsite_requests_total{{view="{view}"}} {stats.count}'
+                for view, stats in views
+            ]
+            lines += [
+                "# HELP kamalsite_request_duration_seconds Request latency.",
+                "# TYPE kamalsite_request_duration_seconds histogram",
+            ]
+            for view, stats in views:
+                name = "kamalsite_request_duration_seconds"
+                total = 0
+                bounds = [*map(str, BUCKETS), "+Inf"]
+                for bound, n in zip(bounds, stats.buckets):
+                    total += n
+                    lines.append(
+                        f'{name}_bucket{{view="{view}",le="{bound}"}} {total}'
+                    )
+                lines.append(f'{name}_sum{{view="{view}"}} {stats.duration}')
+                lines.append(f'{name}_count{{view="{view}"}} {stats.count}')
+            lines += [
+                "# HELP kamalsite_db_queries_total Database queries per view.",
+                "# TYPE kamalsite_db_queries_total counter",
+            ]
+            lines += [
+                f'kamalsite_db_queries_total{{view="{view}"}} {stats.queries}'
+                for view, stats in views
+            ]
+            lines += [
+                "# HELP kamalsite_db_duration_seconds_total Time spent in "
+                "database queries per view.",
+                "# TYPE kamalsite_db_duration_seconds_total counter",
+            ]
+            lines += [
+                f'kamalsite_db_duration_seconds_total{{view="{view}"}} '
+                f"{stats.db_duration}"
+                for view, stats in views
+            ]
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+class QueryCounter:
+    """
+    A database execute wrapper counting queries and the time they take.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.queries += 1
+
+
+class MetricsMiddleware:
+    """
+    Record count, latency, query count and query time of each request under
+    the name of the URL pattern it resolved to (e.g. "shop:catalog").
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with self.measure(request):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        with self.measure(request):
+            return await self.get_response(request)
+
+    @contextmanager
+    def measure(self, request):
+        counter = QueryCounter()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(counter))
+            yield
+        duration = time.perf_counter() - start
+        match = request.resolver_match
+        view = match.view_name if match else "unresolved"
+        registry.observe(view, duration, counter.queries, counter.duration)
@@ -0,0 +1,42 @@
+# Generated by Django 5.0.1 on 2026-10-19 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfilingSwitch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('enabled', models.BooleanField(default=False)),
+                ('path_prefix', models.CharField(blank=True, default='/', max_length=200)),
+                ('remaining', models.PositiveIntegerField(default=10, help_text='requests left to profile, switched off at 0')),
+            ],
+            options={
+                'verbose_name_plural': 'profiling switches',
+            },
+        ),
+        migrations.CreateModel(
+            name='RequestProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('method', models.CharField(max_length=10)),
+                ('path', models.CharField(max_length=2000)),
+                ('status', models.PositiveSmallIntegerField(null=True)),
+                ('duration', models.FloatField(help_text='seconds')),
+                ('cpu_stats', models.TextField()),
+                ('memory_stats', models.TextField()),
+            ],
+            options={
+                'ordering': ['-date_created'],
+            },
+        ),
+    ]
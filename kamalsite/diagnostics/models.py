@@ -0,0 +1,41 @@
+from django.db import models
+
+
+class ProfilingSwitch(models.Model):
+    """
+    Turns on profiling of the next `remaining` requests whose path starts
+    with `path_prefix`. Edited in kamaladmin, only the first one is used.
+    """
+    enabled = models.BooleanField(default=False)
+    path_prefix = models.CharField(max_length=200, default="/", blank=True)
+    remaining = models.PositiveIntegerField(
+        default=10,
+        help_text="requests left to profile, switched off at 0",
+    )
+
+    class Meta:
+        verbose_name_plural = "profiling switches"
+
+    def __str__(self):
+        state = "on" if self.enabled else "off"
+        return f"profiling {state} for {self.path_prefix}"
+
+
+class RequestProfile(models.Model):
+    """
+    CPU and memory profile of a single request.
+    """
+    date_created = models.DateTimeField(auto_now_add=True)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=2000)
+    status = models.PositiveSmallIntegerField(null=True)
+    duration = models.FloatField(help_text="seconds")
+    # Top entries of pstats and tracemalloc output.
+    cpu_stats = models.TextField()
+    memory_stats = models.TextField()
+
+    class Meta:
+        ordering = ["-date_created"]
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration:.3f}s)"
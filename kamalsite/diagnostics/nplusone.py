@@ -0,0 +1,168 @@
+"""
+Detect N+1 queries: statements of the same shape executed over and over
+within one request, typically from a loop in a view or a template.
+
+Use detect_n_plus_one() to collect queries in a block of code,
+assert_no_n_plus_one() in tests, or NPlusOneMiddleware to log offenders
+while developing.
+"""
+import logging
+import re
+import sys
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_THRESHOLD = 5
+
+_in_list = re.compile(r"IN \((?:%s, )*%s\)")
+_numbers = re.compile(r"\b\d+\b")
+_strings = re.compile(r"'(?:[^']|'')*'")
+_spaces = re.compile(r"\s+")
+
+_this_file = str(Path(__file__).resolve())
+
+
+def normalize(sql):
+    """
+    Reduce a statement to its shape: parameter lists of any length,
+    literals and whitespace are made uniform.
+    """
+    sql = _in_list.sub("IN (...)", sql)
+    sql = _strings.sub("?", sql)
+    sql = _numbers.sub("?", sql)
+    return _spaces.sub(" ", sql).strip()
+
+
+def find_origin(depth=3):
+    """
+    Return up to `depth` innermost project source lines, joined, and the
+    innermost template line, if any, on the current call stack.
+    """
+    code_lines = []
+    template_line = None
+    frame = sys._getframe(1)
+    while frame and not (len(code_lines) == depth and template_line):
+        if template_line is None and frame.f_code.co_name == "render_annotated":
+            node = frame.f_locals.get("self")
+            token = getattr(node, "token", None)
+            origin = getattr(node, "origin", None)
+            if token is not None and origin is not None:
+                template_line = f"{origin.name}:{token.lineno}"
+        filename = frame.f_code.co_filename
+        if (
+            len(code_lines) < depth
+            and filename.startswith(str(settings.BASE_DIR))
+            and filename != _this_file
+            and "-packages" not in filename
+        ):
+            code_lines.append(
+                f"{filename}:{frame.f_lineno} in {frame.f_code.co_name}"
+            )
+        frame = frame.f_back
+    return "\n    called from ".join(code_lines) or None, template_line
+
+
+class Detector:
+    """
+    A database execute wrapper that groups queries by shape.
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD):
+        self.threshold = threshold
+        self.counts = {}
+        self.origins = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        shape = normalize(sql)
+        self.counts[shape] = self.counts.get(shape, 0) + 1
+        if shape not in self.origins:
+            self.origins[shape] = find_origin()
+        return execute(sql, params, many, context)
+
+    def offenders(self):
+        """
+        Return (shape, count, code line, template line) of shapes executed
+        more than `threshold` times.
+        """
+        return [
+            (shape, count, *self.origins[shape])
+            for shape, count in self.counts.items()
+            if count > self.threshold
+        ]
+
+    def report(self):
+        lines = []
+        for shape, count, code_line, template_line in self.offenders():
+            lines.append(f"{count} x {shape}")
+            if code_line:
+                lines.append(f"    from {code_line}")
+            if template_line:
+                lines.append(f"    in template {template_line}")
+        return "\n".join(lines)
+
+
+@contextmanager
+def detect_n_plus_one(threshold=DEFAULT_THRESHOLD):
+    detector = Detector(threshold)
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(detector))
+        yield detector
+
+
+@contextmanager
+def assert_no_n_plus_one(threshold=DEFAULT_THRESHOLD):
+    """
+    Fail if any query shape runs more than `threshold` times in the block.
+    Works in unittest and pytest tests alike.
+    """
+    with detect_n_plus_one(threshold) as detector:
+        yield detector
+    if detector.offenders():
+        raise AssertionError(
+            "Repeated queries detected:\n" + detector.report()
+        )
+
+
+class NPlusOneMiddleware:
+    """
+    Log repeated queries of each request. Only active when DEBUG is on.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.DEBUG:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with detect_n_plus_one() as detector:
+            response = self.get_response(request)
+        self.log(request, detector)
+        return response
+
+    async def __acall__(self, request):
+        with detect_n_plus_one() as detector:
+            response = await self.get_response(request)
+        self.log(request, detector)
+        return response
+
+    def log(self, request, detector):
+        if detector.offenders():
+            logger.warning(
+                "Repeated queries in %s:\n%s",
+                request.path,
+                detector.report(),
+            )
@@ -0,0 +1,184 @@
+"""
+Profile selected requests with cProfile and tracemalloc and store the
+results as RequestProfile objects, browsable in kamaladmin.
+
+A request is profiled when either
+- a staff user sends it with the `X-Profile: 1` header, or
+- the ProfilingSwitch edited in kamaladmin is enabled, the path matches
+  its prefix and it has requests left to profile.
+
+Only one request per process is profiled at a time. cProfile and
+tracemalloc see the whole thread or process, so concurrent requests would
+end up in each other's profiles. Requests arriving meanwhile run as usual.
+"""
+import cProfile
+import io
+import pstats
+import threading
+import time
+import tracemalloc
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.core.cache import cache
+from django.db.models import F
+
+from .models import ProfilingSwitch, RequestProfile
+
+HEADER = "HTTP_X_PROFILE"
+SWITCH_KEY = "diagnostics:profiling-switch"
+SWITCH_TIMEOUT = 5
+TOP_FUNCTIONS = 30
+TOP_ALLOCATIONS = 20
+
+_lock = threading.Lock()
+
+
+def get_switch():
+    """
+    Return (pk, path prefix) of the enabled switch or None.
+    Cached briefly since it's looked up on every request.
+    """
+    switch = cache.get(SWITCH_KEY)
+    if switch is None:
+        found = (
+            ProfilingSwitch.objects.filter(enabled=True, remaining__gt=0)
+            .order_by("pk")
+            .values_list("pk", "path_prefix")
+            .first()
+        )
+        # Cache a miss as well, as False.
+        switch = found or False
+        cache.set(SWITCH_KEY, switch, SWITCH_TIMEOUT)
+    return switch or None
+
+
+def claim(switch_pk):
+    """
+    Take one request off the switch's budget. False if none is left.
+    """
+    claimed = ProfilingSwitch.objects.filter(
+        pk=switch_pk, enabled=True, remaining__gt=0,
+    ).update(remaining=F("remaining") - 1)
+    if not claimed:
+        cache.delete(SWITCH_KEY)
+    return bool(claimed)
+
+
+def is_requested(request):
+    if request.META.get(HEADER) == "1":
+        user = getattr(request, "user", None)
+        return user is not None and user.is_staff
+    return False
+
+
+def should_profile(request):
+    if is_requested(request):
+        return True
+    switch = get_switch()
+    return (
+        switch is not None
+        and request.path.startswith(switch[1])
+        and claim(switch[0])
+    )
+
+
+class Profile:
+    """
+    Collects CPU and memory statistics between start() and stop().
+    """
+
+    def start(self):
+        self.started_tracing = not tracemalloc.is_tracing()
+        if self.started_tracing:
+            tracemalloc.start()
+        self.snapshot = tracemalloc.take_snapshot()
+        self.profiler = cProfile.Profile()
+        self.start_time = time.perf_counter()
+        self.profiler.enable()
+
+    def stop(self):
+        self.profiler.disable()
+        self.duration = time.perf_counter() - self.start_time
+        snapshot = tracemalloc.take_snapshot()
+        if self.started_tracing:
+            tracemalloc.stop()
+        ignore = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        self.allocations = snapshot.filter_traces(ignore).compare_to(
+            self.snapshot.filter_traces(ignore), "lineno",
+        )[:TOP_ALLOCATIONS]
+
+    def cpu_stats(self):
+        out = io.StringIO()
+        stats = pstats.Stats(self.profiler, stream=out)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(TOP_FUNCTIONS)
+        return out.getvalue()
+
+    def memory_stats(self):
+        return "\n".join(str(stat) for stat in self.allocations)
+
+    def save(self, request, response):
+        return RequestProfile.objects.create(
+            method=request.method,
+            path=request.get_full_path()[:2000],
+            status=getattr(response, "status_code", None),
+            duration=self.duration,
+            cpu_stats=self.cpu_stats(),
+            memory_stats=self.memory_stats(),
+        )
+
+
+class ProfilingMiddleware:
+    """
+    Profile requests chosen by should_profile(). Must come after
+    AuthenticationMiddleware. A request profiled on the staff's demand gets
+    the id of its RequestProfile in the X-Profile-Id response header.
+
+    Under ASGI only code running on the event loop thread is profiled,
+    not sync views run in worker threads.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not should_profile(request) or not _lock.acquire(blocking=False):
+            return self.get_response(request)
+        try:
+            profile = Profile()
+            profile.start()
+            try:
+                response = self.get_response(request)
+            finally:
+                profile.stop()
+        finally:
+            _lock.release()
+        saved = profile.save(request, response)
+        return self.process_response(request, response, saved)
+
+    async def __acall__(self, request):
+        profiled = await sync_to_async(should_profile)(request)
+        if not profiled or not _lock.acquire(blocking=False):
+            return await self.get_response(request)
+        try:
+            profile = Profile()
+            profile.start()
+            try:
+                response = await self.get_response(request)
+            finally:
+                profile.stop()
+        finally:
+            _lock.release()
+        saved = await sync_to_async(profile.save)(request, response)
+        return self.process_response(request, response, saved)
+
+    def process_response(self, request, response, saved):
+        if is_requested(request):
+            response["X-Profile-Id"] = str(saved.pk)
+        return response
@@ -0,0 +1,172 @@
+import json
+import tempfile
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.template import Context, Template
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from shop.models import Product
+
+from .metrics import Registry, registry
+from .models import ProfilingSwitch, RequestProfile
+from .nplusone import assert_no_n_plus_one, detect_n_plus_one, normalize
+from .tracing import span
+
+
+class MetricsTests(TestCase):
+    def test_export_format(self):
+        registry = Registry()
+        registry.observe("shop:catalog", 0.02, 3, 0.004)
+        registry.observe("shop:catalog", 3, 5, 0.1)
+        text = registry.export()
+        self.assertIn('kamalsite_requests_total{view="shop:catalog"} 2', text)
+        self.assertIn(
+            'kamalsite_request_duration_seconds_bucket'
+            '{view="shop:catalog",le="0.025"} 1',
+            text,
+        )
+        self.assertIn(
+            'kamalsite_request_duration_seconds_bucket'
+            '{view="shop:catalog",le="+Inf"} 2',
+            text,
+        )
+        self.assertIn('kamalsite_db_queries_total{view="shop:catalog"} 8', text)
+
+    def test_requests_are_recorded_per_view(self):
+        self.client.get(reverse("shop:api-categories"))
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('view="shop:api-categories"', response.content.decode())
+        stats = registry.views["shop:api-categories"]
+        self.assertGreaterEqual(stats.queries, 1)
+
+    def test_forbidden_for_external_clients(self):
+        response = self.client.get(reverse("metrics"), REMOTE_ADDR="10.1.2.3")
+        self.assertEqual(response.status_code, 403)
+
+
+class NPlusOneTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(8):
+            Product(
+                name=f"Product {i}",
+                description="",
+                price=1,
+                min_order_quantity=1,
+            ).save()
+
+    def test_loop_is_reported_with_line(self):
+        with self.assertRaises(AssertionError) as cm:
+            with assert_no_n_plus_one():
+                for product in Product.objects.all():
+                    product.likes.qty()
+        report = str(cm.exception)
+        self.assertIn("8 x SELECT COUNT(*)", report)
+        self.assertIn("diagnostics/tests.py", report)
+
+    def test_template_line_is_reported(self):
+        template = Template(
+            "{% for p in products %}\n{{ p.likes.qty }}{% endfor %}"
+        )
+        context = Context({"products": Product.objects.all()})
+        with detect_n_plus_one() as detector:
+            template.render(context)
+        [(shape, count, code_line, template_line)] = detector.offenders()
+        self.assertEqual(count, 8)
+        self.assertEqual(template_line, "<unknown source>:2")
+
+    def test_normalize(self):
+        self.assertEqual(
+            normalize("SELECT 1 FROM t WHERE id IN (%s, %s)  LIMIT 21"),
+            normalize("SELECT 1 FROM t WHERE id IN (%s) LIMIT 5"),
+        )
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_staff_can_request_a_profile(self):
+        staff = get_user_model().objects.create_user(
+            "staff", password="secret", is_staff=True,
+        )
+        self.client.force_login(staff)
+        response = self.client.get(
+            reverse("shop:api-categories"), HTTP_X_PROFILE="1",
+        )
+        profile = RequestProfile.objects.get(pk=response["X-Profile-Id"])
+        self.assertEqual(profile.path, reverse("shop:api-categories"))
+        self.assertEqual(profile.status, 200)
+        self.assertIn("cumulative", profile.cpu_stats)
+
+    def test_header_is_ignored_for_other_users(self):
+        response = self.client.get(
+            reverse("shop:api-categories"), HTTP_X_PROFILE="1",
+        )
+        self.assertNotIn("X-Profile-Id", response)
+        self.assertFalse(RequestProfile.objects.exists())
+
+    def test_switch_profiles_matching_requests_until_used_up(self):
+        switch = ProfilingSwitch.objects.create(
+            enabled=True, path_prefix="/shop/api/", remaining=2,
+        )
+        self.client.get(reverse("metrics"))
+        for _ in range(3):
+            self.client.get(reverse("shop:api-categories"))
+        self.assertEqual(RequestProfile.objects.count(), 2)
+        switch.refresh_from_db()
+        self.assertEqual(switch.remaining, 0)
+
+
+class TracingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(3):
+            Product(
+                name=f"Product {i}",
+                description="",
+                price=1,
+                min_order_quantity=1,
+            ).save()
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.trace_file = Path(tmp.name) / "traces.jsonl"
+
+    def get_traces(self, sample_rate, path):
+        with override_settings(
+            TRACE_SAMPLE_RATE=sample_rate, TRACE_FILE=self.trace_file,
+        ):
+            # A new client loads middleware with the overridden settings.
+            Client().get(path)
+        if not self.trace_file.exists():
+            return []
+        return [json.loads(line) for line in self.trace_file.open()]
+
+    def test_catalog_request_is_broken_down(self):
+        [trace] = self.get_traces(1, reverse("shop:catalog", args=[1]))
+        root = trace["root"]
+        self.assertEqual(root["name"], "shop:catalog")
+        self.assertEqual(root["attrs"]["status"], 200)
+        self.assertLessEqual(
+            {"view", "db", "template", "form"}, trace["breakdown"].keys()
+        )
+
+        def kinds(span):
+            yield span["kind"]
+            for child in span.get("children", []):
+                yield from kinds(child)
+
+        self.assertIn("db", kinds(root))
+
+    def test_unsampled_requests_are_not_traced(self):
+        self.assertEqual(self.get_traces(0, reverse("shop:catalog", args=[1])), [])
+
+    def test_span_outside_of_trace_does_nothing(self):
+        with span("work") as current:
+            self.assertIsNone(current)
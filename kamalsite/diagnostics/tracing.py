@@ -0,0 +1,216 @@
+"""
+Per-request traces: a tree of timed spans for the view, each database
+query, each template render and each form's construction and cleaning.
+
+TracingMiddleware starts a trace for a settings.TRACE_SAMPLE_RATE share
+of requests and appends it as one JSON line to settings.TRACE_FILE. Each
+line holds the span tree and a breakdown of time per span kind, e.g.
+how much of a catalog request went to SQL and how much to templates.
+
+Use span() to add spans of your own. Outside of a sampled request it does
+nothing.
+"""
+import contextvars
+import functools
+import json
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+_current = contextvars.ContextVar("current_span", default=None)
+_write_lock = threading.Lock()
+_installed = False
+
+
+class Span:
+    def __init__(self, name, kind, parent=None, **attrs):
+        self.name = name
+        self.kind = kind
+        self.parent = parent
+        self.attrs = attrs
+        self.children = []
+        self.start = time.perf_counter()
+        self.end = None
+        if parent is not None:
+            self.trace_id = parent.trace_id
+            self.started_at = parent.started_at
+            parent.children.append(self)
+        else:
+            self.trace_id = uuid.uuid4().hex
+            self.started_at = self.start
+
+    @property
+    def duration(self):
+        return (self.end or time.perf_counter()) - self.start
+
+    def as_dict(self):
+        return {
+            "name": self.name,
+            "kind": self.kind,
+            "offset_ms": round((self.start - self.started_at) * 1000, 3),
+            "duration_ms": round(self.duration * 1000, 3),
+            **({"attrs": self.attrs} if self.attrs else {}),
+            **({"children": [c.as_dict() for c in self.children]}
+               if self.children else {}),
+        }
+
+    def breakdown(self):
+        """
+        Return milliseconds spent per span kind. Spans nested in a span of
+        the same kind, like included templates, aren't counted twice.
+        """
+        totals = {}
+
+        def visit(span, outer_kinds):
+            if span.kind not in outer_kinds:
+                totals[span.kind] = totals.get(span.kind, 0) + span.duration
+                outer_kinds = outer_kinds | {span.kind}
+            for child in span.children:
+                visit(child, outer_kinds)
+
+        visit(self, frozenset())
+        return {kind: round(t * 1000, 3) for kind, t in totals.items()}
+
+
+@contextmanager
+def span(name, kind="code", **attrs):
+    parent = _current.get()
+    if parent is None:
+        yield None
+        return
+    current = Span(name, kind, parent, **attrs)
+    token = _current.set(current)
+    try:
+        yield current
+    finally:
+        current.end = time.perf_counter()
+        _current.reset(token)
+
+
+def query_wrapper(execute, sql, params, many, context):
+    with span("query", "db", sql=sql, many=many):
+        return execute(sql, params, many, context)
+
+
+def add_query_wrapper(connection, **kwargs):
+    if query_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(query_wrapper)
+
+
+def traced(name, kind, describe):
+    """
+    Wrap a method so that it runs in a span named after describe(self).
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if _current.get() is None:
+                return method(self, *args, **kwargs)
+            with span(name, kind, target=describe(self)):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def install():
+    """
+    Hook tracing into the ORM, templates and forms. Hooks cost a context
+    variable lookup when no trace is active.
+    """
+    global _installed
+    if _installed:
+        return
+    _installed = True
+    from django import forms
+    from django.template import base
+
+    # Queries may run in other threads (sync_to_async), so every
+    # connection gets the wrapper rather than those of the current thread.
+    connection_created.connect(add_query_wrapper)
+    for connection in connections.all():
+        add_query_wrapper(connection)
+    base.Template.render = traced(
+        "render", "template", lambda t: t.origin.template_name or t.name,
+    )(base.Template.render)
+    forms.BaseForm.__init__ = traced(
+        "init", "form", lambda f: type(f).__name__,
+    )(forms.BaseForm.__init__)
+    forms.BaseForm.full_clean = traced(
+        "clean", "form", lambda f: type(f).__name__,
+    )(forms.BaseForm.full_clean)
+
+
+def export(root):
+    record = {
+        "trace_id": root.trace_id,
+        "timestamp": time.time(),
+        "breakdown": root.breakdown(),
+        "root": root.as_dict(),
+    }
+    line = json.dumps(record, default=str) + "\n"
+    with _write_lock:
+        with open(settings.TRACE_FILE, "a", encoding="utf-8") as f:
+            f.write(line)
+
+
+class TracingMiddleware:
+    """
+    Trace a sample of requests. Not used when the sample rate is 0.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.TRACE_SAMPLE_RATE:
+            raise MiddlewareNotUsed
+        install()
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+        root, token = self.start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.finish(request, root, response)
+        return response
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+        root, token = self.start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.finish(request, root, response)
+        return response
+
+    def sampled(self):
+        return random.random() < settings.TRACE_SAMPLE_RATE
+
+    def start(self, request):
+        root = Span("request", "view", method=request.method, path=request.path)
+        return root, _current.set(root)
+
+    def finish(self, request, root, response):
+        root.end = time.perf_counter()
+        match = request.resolver_match
+        root.name = match.view_name if match else "unresolved"
+        root.attrs["status"] = response.status_code
+        export(root)
@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+from shop import cache
+
+from .metrics import registry
+
+
+def is_internal(request):
+    return (
+        request.META.get("REMOTE_ADDR") in settings.INTERNAL_IPS
+        or request.user.is_staff
+    )
+
+
+def local_cache_metrics():
+    lines = []
+    for name, value in cache.local.stats().items():
+        if name in ("hits", "misses", "evictions", "clears"):
+            metric = f"kamalsite_local_cache_{name}_total"
+            lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+    return lines
+
+
+def metrics(request):
+    """
+    Expose metrics in the Prometheus text format to internal clients.
+    """
+    if not is_internal(request):
+        return HttpResponseForbidden()
+    body = registry.export() + "\n".join(local_cache_metrics()) + "\n"
+    return HttpResponse(
+        body,
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
@@ -0,0 +1,110 @@
+"""
+Database routing between the primary ("default") database and read-only
+replicas listed in settings.DATABASE_REPLICAS.
+
+Reads of catalog models go to a random replica, everything else goes to
+the primary. Reads after a write in the same request or inside a
+transaction go to the primary too, and a client that has just written
+something is pinned to the primary for settings.REPLICA_PIN_SECONDS so
+that it sees its own likes and cart items before replicas catch up.
+"""
+import contextvars
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_COOKIE = "pin_primary"
+
+_pinned = contextvars.ContextVar("pinned_to_primary", default=False)
+_wrote = contextvars.ContextVar("wrote_to_primary", default=False)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if (
+            replicas
+            and not _pinned.get()
+            and not _wrote.get()
+            # Replicas don't see uncommitted writes, and reads deciding
+            # writes of a transaction must see its own.
+            and not connections[DEFAULT_DB_ALIAS].in_atomic_block
+            and model._meta.label_lower in settings.REPLICA_READ_MODELS
+        ):
+            return random.choice(replicas)
+        return "default"
+
+    def db_for_write(self, model, **hints):
+        # Only writes to models read from replicas may go unseen. Others,
+        # like session updates on every catalog page, don't need pinning.
+        if model._meta.label_lower in settings.REPLICA_READ_MODELS:
+            _wrote.set(True)
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
+
+
+class PrimaryPinningMiddleware:
+    """
+    Pin clients to the primary database for a while after they write.
+    The deadline is kept in a cookie so it costs no session lookup.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        tokens = self.pin(request)
+        try:
+            response = self.get_response(request)
+            wrote = _wrote.get()
+        finally:
+            self.unpin(tokens)
+        return self.process_response(response, wrote)
+
+    async def __acall__(self, request):
+        tokens = self.pin(request)
+        try:
+            response = await self.get_response(request)
+            wrote = _wrote.get()
+        finally:
+            self.unpin(tokens)
+        return self.process_response(response, wrote)
+
+    def pin(self, request):
+        try:
+            pinned = float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+        except ValueError:
+            pinned = False
+        return _pinned.set(pinned), _wrote.set(False)
+
+    def unpin(self, tokens):
+        _pinned.reset(tokens[0])
+        _wrote.reset(tokens[1])
+
+    def process_response(self, response, wrote):
+        if wrote and settings.DATABASE_REPLICAS:
+            seconds = settings.REPLICA_PIN_SECONDS
+            response.set_cookie(
+                PIN_COOKIE,
+                str(time.time() + seconds),
+                max_age=seconds,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -27,6 +28,9 @@ DEBUG = True
 
 ALLOWED_HOSTS = []
 
+# Clients allowed to read internal endpoints such as metrics.
+INTERNAL_IPS = ['127.0.0.1']
+
 
 # Application definition
 
@@ -35,6 +39,7 @@ INSTALLED_APPS = [
     'myauth.apps.MyauthConfig',
     'production.apps.ProductionConfig',
     'communication.apps.CommunicationConfig',
+    'diagnostics.apps.DiagnosticsConfig',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -44,13 +49,18 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'diagnostics.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'kamalsite.routers.PrimaryPinningMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'diagnostics.profiling.ProfilingMiddleware',
+    'diagnostics.tracing.TracingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'diagnostics.nplusone.NPlusOneMiddleware',
 ]
 
 ROOT_URLCONF = 'kamalsite.urls'
@@ -66,6 +76,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'shop.context_processors.cart',
             ],
         },
     },
@@ -73,6 +84,15 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'kamalsite.wsgi.application'
 
+# Load URL patterns, templates and catalog caches when a WSGI/ASGI worker
+# starts rather than on its first requests.
+WARM_UP_ON_STARTUP = True
+
+# Share of requests traced by diagnostics.tracing.TracingMiddleware, from
+# 0 (off) to 1, and the JSON-lines file traces are appended to.
+TRACE_SAMPLE_RATE = 0
+TRACE_FILE = BASE_DIR / 'traces.jsonl'
+
 
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
@@ -87,6 +107,43 @@ DATABASES = {
     }
 }
 
+# Read-only replicas of the default database. Add each alias to DATABASES
+# too, e.g. with 'TEST': {'MIRROR': 'default'} to run tests against it.
+DATABASE_REPLICAS = []
+
+DATABASE_ROUTERS = ['kamalsite.routers.PrimaryReplicaRouter']
+
+# Models whose reads may be served by replicas.
+REPLICA_READ_MODELS = [
+    'shop.product',
+    'shop.category',
+    'shop.discount',
+    'shop.like',
+    'shop.catalogchange',
+]
+
+# How long a client keeps reading from the primary after a write.
+REPLICA_PIN_SECONDS = 5
+
+# How long stock reserved at checkout waits for payment before it's
+# released by the release_reservations command.
+STOCK_RESERVATION_MINUTES = 30
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/ref/settings/#caches
+
+# Cache tags (see shop.cache) are invalidated through the default cache, so
+# workers have to share it. Without REDIS_URL each process gets a local
+# memory cache, which only suits development (see the shop.W004 check).
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
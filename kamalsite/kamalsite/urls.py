@@ -16,9 +16,11 @@ Including another URLconf
 """
 from django.urls import path, include
 
+from diagnostics import views as diagnostics_views
 from shop.admin import admin_site
 
 urlpatterns = [
     path('shop/', include("shop.urls")),
     path('kamaladmin/', admin_site.urls),
+    path('internal/metrics/', diagnostics_views.metrics, name="metrics"),
 ]
@@ -0,0 +1,126 @@
+"""
+Prepare a worker to serve requests before it accepts traffic.
+
+Resolving URLs, compiling templates and filling catalog caches otherwise
+happens on the first requests a worker gets. Apps take part by defining
+a warm_up() method on their AppConfig.
+"""
+import importlib
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import django
+from django.apps import apps
+from django.conf import settings
+from django.db import connections
+from django.template import engines
+from django.urls import get_resolver
+
+logger = logging.getLogger(__name__)
+
+
+def load_url_patterns():
+    resolver = get_resolver()
+    # Accessing reverse_dict builds lookup tables for all namespaces.
+    resolver.reverse_dict
+    for namespace in resolver.namespace_dict.values():
+        namespace[1].reverse_dict
+
+
+def load_templates():
+    for engine in engines.all():
+        for directory in engine.template_dirs:
+            directory = Path(directory)
+            for path in directory.rglob("*.html"):
+                engine.get_template(path.relative_to(directory).as_posix())
+
+
+def warm_up():
+    """
+    Run warm-up steps and return a dict of step name to seconds taken.
+    A failing step is logged and skipped so that a worker still starts,
+    e.g. when the database isn't reachable yet.
+    """
+    steps = [
+        ("urls", load_url_patterns),
+        ("templates", load_templates),
+    ]
+    steps += [
+        (config.label, config.warm_up)
+        for config in apps.get_app_configs()
+        if hasattr(config, "warm_up")
+    ]
+    timings = {}
+    for name, step in steps:
+        start = time.perf_counter()
+        try:
+            step()
+        except Exception:
+            logger.exception("Warm-up step %s failed.", name)
+        timings[name] = time.perf_counter() - start
+    return timings
+
+
+def warm_up_on_startup():
+    if settings.WARM_UP_ON_STARTUP:
+        timings = warm_up()
+        logger.info(
+            "Warmed up in %.3fs: %s",
+            sum(timings.values()),
+            ", ".join(f"{name} {t:.3f}s" for name, t in timings.items()),
+        )
+
+
+def startup_report():
+    """
+    Set up Django and import the URLconf, with it every view, form and
+    model module, while database connections are blocked. Then warm up.
+    Meant to run in a fresh interpreter, see measure_startup().
+    """
+    report = {"import_db_io": None}
+    start = time.perf_counter()
+    django.setup()
+    report["setup"] = time.perf_counter() - start
+
+    def block(*args, **kwargs):
+        raise RuntimeError("Database access at import time.")
+
+    for connection in connections.all():
+        connection.ensure_connection = block
+    start = time.perf_counter()
+    try:
+        importlib.import_module(settings.ROOT_URLCONF)
+    except RuntimeError as e:
+        report["import_db_io"] = str(e)
+    report["import_urls"] = time.perf_counter() - start
+    for connection in connections.all():
+        del connection.ensure_connection
+    report["warm_up"] = warm_up()
+    return report
+
+
+def measure_startup():
+    """
+    Return startup_report() from a new Python process.
+    """
+    code = (
+        "import json; from kamalsite.warmup import startup_report; "
+        "print(json.dumps(startup_report()))"
+    )
+    env = {**os.environ, "DJANGO_SETTINGS_MODULE": os.environ.get(
+        "DJANGO_SETTINGS_MODULE", "kamalsite.settings"
+    )}
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        check=True,
+        cwd=settings.BASE_DIR,
+        env=env,
+        text=True,
+    )
+    return json.loads(result.stdout.splitlines()[-1])
@@ -1,6 +1,7 @@
 from django.contrib import admin
 
-from .models import Product
+from . import services
+from .models import Product, Stock, Warehouse
 
 
 class MyAdminSite(admin.AdminSite):
@@ -11,4 +12,28 @@ class MyAdminSite(admin.AdminSite):
 
 admin_site = MyAdminSite(name="kamaladmin")
 
-admin_site.register(Product)
+
+class StockInline(admin.TabularInline):
+    model = Stock
+    extra = 0
+
+
+class StockAdmin(admin.ModelAdmin):
+    """
+    Edit stock inline and set Product.quantity to the new totals.
+    """
+
+    inlines = [StockInline]
+
+    def save_formset(self, request, form, formset, change):
+        super().save_formset(request, form, formset, change)
+        if formset.model is Stock:
+            product_ids = {
+                stock_form.instance.product_id for stock_form in formset.forms
+            }
+            product_ids.discard(None)
+            services.sync_quantities(product_ids)
+
+
+admin_site.register(Product, StockAdmin)
+admin_site.register(Warehouse, StockAdmin)
@@ -0,0 +1,288 @@
+"""
+Read-only JSON API over the catalog.
+
+Objects are serialized straight from QuerySet.values() so that no model
+instances or forms are created per object. Lists are paginated with an
+opaque cursor built from the last primary key on a page.
+"""
+import base64
+import binascii
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.gzip import gzip_page
+
+from . import forms
+from . import models
+from . import pricing
+
+
+def encode_cursor(pk):
+    return base64.urlsafe_b64encode(str(pk).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        return int(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, ValueError):
+        raise ValueError("Invalid cursor.")
+
+
+class ApiError(Exception):
+    def __init__(self, errors, status=400):
+        super().__init__(errors)
+        self.errors = errors
+        self.status = status
+
+
+@method_decorator(gzip_page, name="dispatch")
+class ApiListView(View):
+    """
+    List objects of a model.
+    Query parameters:
+    `fields` - comma separated subset of `fields`,
+    `limit` - page size, at most `max_limit`,
+    `cursor` - value of `next` from the previous page.
+    """
+    model = None
+    fields = []
+    default_fields = None
+    default_limit = 50
+    max_limit = 200
+
+    def get(self, request, *args, **kwargs):
+        try:
+            self.requested_fields = fields = self.get_fields()
+            limit = self.get_limit()
+            after = self.get_cursor()
+            qs = self.get_queryset().order_by("pk")
+        except ApiError as e:
+            return JsonResponse({"errors": e.errors}, status=e.status)
+        if after is not None:
+            qs = qs.filter(pk__gt=after)
+        # Fetch one extra row to tell if there is a next page.
+        columns = self.get_columns(fields)
+        rows = list(qs.values("pk", *columns)[:limit + 1])
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1]["pk"])
+        rows = self.serialize(rows, fields)
+        for row in rows:
+            del row["pk"]
+        return JsonResponse(
+            {"results": rows, "next": next_cursor},
+            encoder=DjangoJSONEncoder,
+        )
+
+    def get_queryset(self):
+        return self.model.objects.all()
+
+    def get_fields(self):
+        if "fields" not in self.request.GET:
+            return list(self.default_fields or self.fields)
+        fields = [f for f in self.request.GET["fields"].split(",") if f]
+        unknown = [f for f in fields if f not in self.fields]
+        if unknown:
+            raise ApiError({"fields": [f"Unknown fields: {', '.join(unknown)}."]})
+        return fields
+
+    def get_columns(self, fields):
+        """Return names of fields that QuerySet.values() can fetch."""
+        return fields
+
+    def get_limit(self):
+        try:
+            limit = int(self.request.GET.get("limit", self.default_limit))
+        except ValueError:
+            raise ApiError({"limit": ["Enter a whole number."]})
+        return max(1, min(limit, self.max_limit))
+
+    def get_cursor(self):
+        if "cursor" not in self.request.GET:
+            return None
+        try:
+            return decode_cursor(self.request.GET["cursor"])
+        except ValueError as e:
+            raise ApiError({"cursor": [str(e)]})
+
+    def serialize(self, rows, fields):
+        return rows
+
+
+class ProductListApiView(ApiListView):
+    """
+    List products in production.
+    Accepts the same filters as CatalogFilterForm, with any price range.
+    """
+    model = models.Product
+    fields = [
+        "id",
+        "name",
+        "description",
+        "price",
+        "effective_price",
+        "unit_measure",
+        "quantity",
+        "min_order_quantity",
+        "date_created",
+        "discount",
+        "like_count",
+        "categories",
+    ]
+    default_fields = ["id", "name", "price", "unit_measure", "like_count"]
+    filter_form = forms.ApiFilterForm
+
+    def get_queryset(self):
+        group = pricing.customer_group(self.request.user)
+        qs = models.Product.objects.filter(in_production=True)
+        qs = qs.with_effective_price(group)
+        form = self.filter_form(self.request.GET, group=group)
+        if not form.is_valid():
+            raise ApiError(form.errors)
+        conditions = form.get_query_conditions()
+        for cond in conditions:
+            qs = qs.filter(cond)
+        if conditions:
+            # Filtering on categories may yield duplicates.
+            qs = qs.distinct()
+        if "like_count" in self.requested_fields:
+            qs = qs.with_like_count()
+        return qs
+
+    def get_columns(self, fields):
+        # Categories are fetched separately in serialize().
+        return [f for f in fields if f != "categories"]
+
+    def serialize(self, rows, fields):
+        if "categories" not in fields:
+            return rows
+        # One query for the whole page instead of one per product.
+        through = models.Category.products.through
+        categories = {row["pk"]: [] for row in rows}
+        pairs = through.objects.filter(
+            product_id__in=categories,
+        ).values_list("product_id", "category_id")
+        for product_id, category_id in pairs:
+            categories[product_id].append(category_id)
+        for row in rows:
+            row["categories"] = categories[row["pk"]]
+        return rows
+
+
+class CategoryListApiView(ApiListView):
+    model = models.Category
+    fields = ["id", "name", "value", "parent"]
+
+
+class DiscountListApiView(ApiListView):
+    model = models.Discount
+    fields = ["id", "reason", "percent", "seasonal", "start", "end", "group"]
+
+
+@method_decorator(gzip_page, name="dispatch")
+class ChangeListApiView(View):
+    """
+    List catalog changes made after change `since` (0 by default).
+    Several changes to the same object within a page are collapsed into the
+    latest one, which carries the current data of the object, or null for
+    deletions. Pass `next` as `since` to get the following page.
+    """
+    default_limit = 200
+    max_limit = 1000
+    sync_fields = {
+        "product": [
+            "id",
+            "name",
+            "description",
+            "price",
+            "unit_measure",
+            "quantity",
+            "min_order_quantity",
+            "date_created",
+            "in_production",
+            "discount",
+        ],
+        "category": CategoryListApiView.fields,
+        "discount": DiscountListApiView.fields,
+    }
+    model_classes = {
+        "product": models.Product,
+        "category": models.Category,
+        "discount": models.Discount,
+    }
+
+    def get(self, request, *args, **kwargs):
+        errors = {}
+        try:
+            since = int(request.GET.get("since", 0))
+        except ValueError:
+            errors["since"] = ["Enter a whole number."]
+        try:
+            limit = int(request.GET.get("limit", self.default_limit))
+        except ValueError:
+            errors["limit"] = ["Enter a whole number."]
+        if errors:
+            return JsonResponse({"errors": errors}, status=400)
+        limit = max(1, min(limit, self.max_limit))
+        # Changes are recorded once their writes commit and one
+        # transaction at a time (see signals.save_changes()), so a change
+        # never shows up after one with a higher seq.
+        changes = list(
+            models.CatalogChange.objects.filter(seq__gt=since)
+            .order_by("seq")[:limit + 1]
+        )
+        has_more = len(changes) > limit
+        changes = changes[:limit]
+        latest = {}
+        for change in changes:
+            latest[change.model, change.object_id] = change
+        data = self.get_data(latest.values())
+        results = [
+            {
+                "seq": change.seq,
+                "model": change.model,
+                "id": change.object_id,
+                "operation": change.operation,
+                "data": data.get((change.model, change.object_id)),
+            }
+            for change in sorted(latest.values(), key=lambda c: c.seq)
+        ]
+        return JsonResponse(
+            {
+                "results": results,
+                "next": changes[-1].seq if changes else since,
+                "has_more": has_more,
+            },
+            encoder=DjangoJSONEncoder,
+        )
+
+    def get_data(self, changes):
+        """
+        Fetch current data of saved objects with one query per model.
+        """
+        ids = {}
+        for change in changes:
+            if change.operation == models.CatalogChange.Operation.SAVE:
+                ids.setdefault(change.model, []).append(change.object_id)
+        data = {}
+        for name, object_ids in ids.items():
+            rows = self.model_classes[name].objects.filter(pk__in=object_ids).values(
+                *self.sync_fields[name]
+            )
+            for row in rows:
+                data[name, row["id"]] = row
+        if "product" in ids:
+            through = models.Category.products.through
+            pairs = through.objects.filter(
+                product_id__in=ids["product"],
+            ).values_list("product_id", "category_id")
+            for (name, _), row in data.items():
+                if name == "product":
+                    row["categories"] = []
+            for product_id, category_id in pairs:
+                if ("product", product_id) in data:
+                    data["product", product_id]["categories"].append(category_id)
+        return data
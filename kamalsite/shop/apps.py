@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class ShopConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'shop'
+
+    def ready(self):
+        from . import checks, signals
+
+    def warm_up(self):
+        from .forms import get_category_types, get_price_extremes
+
+        get_category_types()
+        get_price_extremes()
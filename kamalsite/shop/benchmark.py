@@ -0,0 +1,151 @@
+"""
+Benchmark catalog views through the test client on seeded data.
+
+Each scenario is requested `repeat` times after a warm-up request and is
+reported with latency percentiles, queries per request and memory
+allocated at peak per request. See the `benchmark` management command.
+"""
+import itertools
+import random
+import statistics
+import time
+import tracemalloc
+
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .loadtest import percentile
+from .models import Category, Product
+
+
+class Scenario:
+    def __init__(self, name, method, url_name, kwargs=None, data=None,
+                 product_kwarg=None):
+        self.name = name
+        self.method = method
+        self.url_name = url_name
+        self.kwargs = kwargs or {}
+        self.data = data or {}
+        # Name of the URL argument taking a product id, if any.
+        self.product_kwarg = product_kwarg
+
+    def request(self, product_id):
+        """
+        Return the path and data of a request about `product_id`.
+        """
+        kwargs = dict(self.kwargs)
+        data = dict(self.data)
+        if self.product_kwarg:
+            kwargs[self.product_kwarg] = product_id
+            if self.method == "post":
+                data["product"] = product_id
+        return reverse(f"shop:{self.url_name}", kwargs=kwargs), data
+
+
+def sample_product_ids(count, seed):
+    """
+    Return ids of up to `count` products in production, picked with `seed`
+    unlike ORDER BY RANDOM(), so that runs to compare request the same
+    products.
+    """
+    product_ids = list(
+        Product.objects.filter(in_production=True)
+        .order_by("pk")
+        .values_list("pk", flat=True)
+    )
+    return random.Random(seed).sample(product_ids, min(count, len(product_ids)))
+
+
+def get_scenarios():
+    category = Category.objects.order_by("pk").first()
+    filters = {"action": "filter_catalog", "price_min": 10, "price_max": 500}
+    if category is not None:
+        filters[category.name] = category.value
+    return [
+        Scenario("catalog", "get", "catalog", kwargs={"page": 1}),
+        Scenario("catalog-filter", "get", "catalog-filter", data=filters),
+        Scenario("product-detail", "get", "product-detail", product_kwarg="pk"),
+        Scenario(
+            "like",
+            "post",
+            "product-card-like",
+            data={"action": "like"},
+            product_kwarg="product_id",
+        ),
+        Scenario(
+            "add",
+            "post",
+            "product-card-add",
+            data={"action": "addition"},
+            product_kwarg="product_id",
+        ),
+    ]
+
+
+def measure(client, method, path, data):
+    """
+    Make one request and return (seconds, queries, status).
+    """
+    with CaptureQueriesContext(connection) as queries:
+        start = time.perf_counter()
+        response = getattr(client, method)(path, data)
+        seconds = time.perf_counter() - start
+    return seconds, len(queries), response.status_code
+
+
+def measure_allocation(client, method, path, data):
+    """
+    Return bytes allocated at peak while making one request.
+    """
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        getattr(client, method)(path, data)
+        return tracemalloc.get_traced_memory()[1] - before
+    finally:
+        if started:
+            tracemalloc.stop()
+
+
+def run_scenarios(user, product_ids, repeat=20, allocation_repeat=3):
+    """
+    Run every scenario as `user` and return results keyed by scenario name.
+    Products are taken from `product_ids` in turn.
+    """
+    client = Client()
+    client.force_login(user)
+    results = {}
+    for scenario in get_scenarios():
+        products = itertools.cycle(product_ids)
+        # The first request fills caches and is not counted.
+        measure(client, scenario.method, *scenario.request(next(products)))
+        latencies, query_counts, errors = [], [], 0
+        for _ in range(repeat):
+            seconds, queries, status = measure(
+                client, scenario.method, *scenario.request(next(products))
+            )
+            latencies.append(seconds)
+            query_counts.append(queries)
+            errors += status >= 400
+        allocations = [
+            measure_allocation(
+                client, scenario.method, *scenario.request(next(products))
+            )
+            for _ in range(allocation_repeat)
+        ]
+        latencies.sort()
+        results[scenario.name] = {
+            "requests": repeat,
+            "errors": errors,
+            "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+            "mean_ms": round(statistics.mean(latencies) * 1000, 2),
+            "queries": max(query_counts),
+            "peak_alloc_kb": round(statistics.median(allocations) / 1024, 1),
+        }
+    return results
@@ -0,0 +1,240 @@
+"""
+Cache entries tagged with the names of the models they were built from.
+
+Each tag has a version number in the cache. An entry remembers the
+versions of its tags at the time it was stored and is ignored once any of
+them changes, so invalidating a tag is a single increment. Nothing has to
+be scanned or deleted.
+
+Tags are bumped from model signals (see signals.py) and by
+CacheTagQuerySet for bulk writes that send no signals.
+
+`local` is a small per-process cache in front of the shared one for hot
+objects. It is dropped whenever the global version, bumped along with
+tags of models it holds, changes.
+"""
+import collections
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+VERSION_KEY = "shop:tag:{}"
+GLOBAL_TAG = "*"
+DEFAULT_TIMEOUT = 60 * 15
+
+
+class LocalCache:
+    """
+    A bounded in-process LRU cache with per-entry TTL.
+    The global tag version is read from the shared cache at most once per
+    `check_interval` seconds, which bounds how long another process'
+    writes may go unnoticed.
+    """
+
+    def __init__(self, maxsize=1024, ttl=60, check_interval=1):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked_at = 0
+        self.hits = self.misses = self.evictions = self.clears = 0
+
+    def validate(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        version = get_tag_versions([GLOBAL_TAG])[GLOBAL_TAG]
+        with self._lock:
+            self._checked_at = now
+            if version != self._version:
+                self._version = version
+                self._clear()
+
+    def get(self, key, default=None):
+        self.validate()
+        with self._lock:
+            try:
+                value, expires = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            if expires < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        self.validate()
+        with self._lock:
+            self._data[key] = value, time.monotonic() + self.ttl
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_set(self, key, compute):
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+            # Read the global version on the next lookup, which is bumped
+            # along with local clears, rather than clearing entries rebuilt
+            # meanwhile once it's checked again.
+            self._checked_at = 0
+
+    def _clear(self):
+        if self._data:
+            self.clears += 1
+        self._data.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else None,
+            "evictions": self.evictions,
+            "clears": self.clears,
+        }
+
+
+def get_tag_versions(tags):
+    keys = {VERSION_KEY.format(tag): tag for tag in tags}
+    found = cache.get_many(keys)
+    for key in keys.keys() - found.keys():
+        # Start from a fresh number rather than 0 so that entries stored
+        # before the version key was evicted don't become valid again.
+        cache.add(key, time.time_ns(), None)
+        found[key] = cache.get(key)
+    return {tag: found[key] for key, tag in keys.items()}
+
+
+def bump(tag):
+    key = VERSION_KEY.format(tag)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
+
+
+def invalidate(*tags, local_entries=True):
+    """
+    Make entries tagged with any of `tags` stale.
+    Tags are bumped right away and once more when the current transaction
+    commits, so that an entry rebuilt from uncommitted-to-others data in
+    between doesn't survive.
+
+    Pass local_entries=False for tags never used by entries of the local
+    cache, such as per-cart ones or those of likes, to leave the local
+    caches alone.
+    """
+    if local_entries:
+        tags = (*tags, GLOBAL_TAG)
+
+    def bump_all():
+        for tag in tags:
+            bump(tag)
+        if local_entries:
+            local.clear()
+
+    bump_all()
+    transaction.on_commit(bump_all)
+
+
+def get_tagged(key, default=None):
+    entry = cache.get(key)
+    if entry is None:
+        return default
+    value, versions = entry
+    if get_tag_versions(versions) != versions:
+        return default
+    return value
+
+
+def set_tagged(key, value, tags, timeout=DEFAULT_TIMEOUT):
+    cache.set(key, (value, get_tag_versions(tags)), timeout)
+
+
+def get_or_set_tagged(key, compute, tags, timeout=DEFAULT_TIMEOUT):
+    """
+    Return the cached value for `key` or store and return compute().
+    """
+    missing = object()
+    value = get_tagged(key, missing)
+    if value is missing:
+        # Take tag versions before computing so that a write made during
+        # the computation leaves the entry stale.
+        versions = get_tag_versions(tags)
+        value = compute()
+        cache.set(key, (value, versions), timeout)
+    return value
+
+
+def get_or_recompute(key, compute, tags, timeout=DEFAULT_TIMEOUT,
+                     stale_timeout=DEFAULT_TIMEOUT, lock_timeout=30, wait=10):
+    """
+    Like get_or_set_tagged() but for values that are expensive to compute.
+    Only one caller at a time, across processes, calls compute() for `key`.
+    While it does, others get the previous (stale) value if there is one,
+    or wait up to `wait` seconds for the new one. Values are kept for
+    `stale_timeout` seconds after they go stale.
+    """
+    lock_key = f"{key}:lock"
+    deadline = time.monotonic() + wait
+    while True:
+        entry = cache.get(key)
+        if entry is not None:
+            value, versions, fresh_until = entry
+            if (
+                time.time() < fresh_until
+                and get_tag_versions(versions) == versions
+            ):
+                return value
+        if cache.add(lock_key, True, lock_timeout):
+            try:
+                versions = get_tag_versions(tags)
+                value = compute()
+                cache.set(
+                    key,
+                    (value, versions, time.time() + timeout),
+                    timeout + stale_timeout,
+                )
+                return value
+            finally:
+                cache.delete(lock_key)
+        if entry is not None:
+            return value  # Stale while another caller recomputes it.
+        if time.monotonic() > deadline:
+            # The recomputing caller is probably gone. Don't wait forever.
+            return compute()
+        time.sleep(0.05)
+
+
+# Objects from here are shared between threads of a worker. Don't modify
+# them.
+local = LocalCache()
+
+
+def get_local(key, compute, tags):
+    """
+    Look up `key` in the local cache, then in the shared cache, and only
+    then call compute().
+    """
+    return local.get_or_set(
+        key,
+        lambda: get_or_set_tagged(key, compute, tags),
+    )
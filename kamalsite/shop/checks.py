@@ -0,0 +1,312 @@
+"""
+System checks for performance pitfalls, run by `manage.py check`.
+They read the source of project apps and settings, so nothing is imported
+or queried.
+
+shop.W001  a view filters or orders by a model field that has no index.
+shop.W002  a query runs when a module is imported, e.g. in a form class
+           body.
+shop.W003  functools.cache or lru_cache(maxsize=None) wraps ORM calls. The
+           results are never invalidated and may grow without bounds.
+shop.W004  the default cache is local to each process, so cache tags
+           invalidated by one worker stay valid in others. Deployment
+           checks only (`--deploy`).
+
+All are tagged "performance". Enforce them in CI with
+`manage.py check --tag performance --fail-level WARNING`. Silence a single
+line with a `# noqa: shop.W001` comment.
+"""
+import ast
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.core.checks import Warning, register
+from django.db import models
+
+TAG = "performance"
+PROCESS_LOCAL_CACHES = {"django.core.cache.backends.locmem.LocMemCache"}
+VIEW_MODULES = ("views.py", "api.py")
+FILTER_METHODS = {"filter", "exclude", "get", "order_by"}
+# Calls that run a query right away.
+EVALUATING_METHODS = {
+    "get",
+    "first",
+    "last",
+    "count",
+    "exists",
+    "aggregate",
+    "get_or_create",
+    "update_or_create",
+    "in_bulk",
+    "earliest",
+    "latest",
+}
+
+
+def project_modules():
+    """
+    Yield (app config, path) of modules of apps inside the project,
+    skipping migrations and tests.
+    """
+    base_dir = Path(settings.BASE_DIR).resolve()
+    for app_config in apps.get_app_configs():
+        app_dir = Path(app_config.path).resolve()
+        if base_dir not in app_dir.parents:
+            continue
+        for path in sorted(app_dir.rglob("*.py")):
+            parts = path.relative_to(app_dir).parts
+            if "migrations" in parts or path.name.startswith("test"):
+                continue
+            yield app_config, path
+
+
+def parse(path):
+    source = path.read_text(encoding="utf-8")
+    return ast.parse(source, str(path)), source.splitlines()
+
+
+def is_silenced(lines, node, check_id):
+    return f"noqa: {check_id}" in lines[node.lineno - 1]
+
+
+def location(path, node):
+    try:
+        path = path.relative_to(settings.BASE_DIR)
+    except ValueError:
+        pass
+    return f"{path}:{node.lineno}"
+
+
+def attribute_chain(node):
+    """
+    Return names along a call chain, e.g. ["models", "Product", "objects",
+    "filter", "first"] for models.Product.objects.filter(...).first().
+    """
+    names = []
+    while True:
+        if isinstance(node, ast.Call):
+            node = node.func
+        elif isinstance(node, ast.Attribute):
+            names.append(node.attr)
+            node = node.value
+        elif isinstance(node, ast.Name):
+            names.append(node.id)
+            return names[::-1]
+        else:
+            return names[::-1]
+
+
+def queried_model(chain):
+    """
+    Return the model name in front of `.objects` in a chain, if any.
+    """
+    if "objects" in chain:
+        index = chain.index("objects")
+        if index > 0:
+            return chain[index - 1]
+    return None
+
+
+def lookups(call):
+    """
+    Yield lookups used by a filter() or order_by() call, including those
+    in Q objects.
+    """
+    for keyword in call.keywords:
+        if keyword.arg:
+            yield keyword.arg
+    for arg in call.args:
+        if isinstance(arg, ast.Constant) and isinstance(arg.value, str):
+            yield arg.value.lstrip("-")
+        elif isinstance(arg, (ast.Call, ast.BinOp, ast.UnaryOp)):
+            for node in ast.walk(arg):
+                if (
+                    isinstance(node, ast.Call)
+                    and attribute_chain(node)[-1:] == ["Q"]
+                ):
+                    yield from lookups(node)
+
+
+def indexed_fields(model):
+    """
+    Return names of fields that lead an index of `model`.
+    """
+    names = set()
+    for field in model._meta.concrete_fields:
+        if field.primary_key or field.unique or field.db_index:
+            names.add(field.name)
+    opts = model._meta
+    for index in opts.indexes:
+        if index.fields:
+            names.add(index.fields[0].lstrip("-"))
+    for constraint in opts.constraints:
+        fields = getattr(constraint, "fields", ())
+        if isinstance(constraint, models.UniqueConstraint) and fields:
+            names.add(fields[0])
+    for fields in opts.unique_together:
+        names.add(fields[0])
+    return names
+
+
+def unindexed_field(model, lookup):
+    """
+    Return the field the lookup starts with if it's a plain column of
+    `model` without an index. Boolean columns are too unselective to be
+    worth an index and are left alone.
+    """
+    name = lookup.split("__")[0]
+    if name in ("pk", "?"):
+        return None
+    try:
+        field = model._meta.get_field(name)
+    except Exception:
+        return None  # Annotations, reverse relations, typos.
+    if (
+        not getattr(field, "concrete", False)
+        or field.is_relation
+        or isinstance(field, models.BooleanField)
+        or field.name in indexed_fields(model)
+    ):
+        return None
+    return field
+
+
+@register(TAG)
+def check_unindexed_lookups(app_configs=None, **kwargs):
+    errors = []
+    for app_config, path in project_modules():
+        if path.name not in VIEW_MODULES:
+            continue
+        app_models = {m.__name__: m for m in app_config.get_models()}
+        tree, lines = parse(path)
+        for node in ast.walk(tree):
+            if not (
+                isinstance(node, ast.Call)
+                and isinstance(node.func, ast.Attribute)
+                and node.func.attr in FILTER_METHODS
+            ):
+                continue
+            chain = attribute_chain(node.func.value)
+            model = app_models.get(queried_model(chain))
+            if model is None or is_silenced(lines, node, "shop.W001"):
+                continue
+            for lookup in lookups(node):
+                field = unindexed_field(model, lookup)
+                if field is not None:
+                    errors.append(Warning(
+                        f"{model.__name__}.{field.name} is used in "
+                        f"{node.func.attr}() without an index.",
+                        hint="Add db_index=True or a Meta.indexes entry.",
+                        obj=location(path, node),
+                        id="shop.W001",
+                    ))
+    return errors
+
+
+def import_time_nodes(tree):
+    """
+    Yield nodes evaluated on import: module and class bodies, but not
+    function bodies.
+    """
+    stack = list(tree.body)
+    while stack:
+        node = stack.pop()
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda)):
+            # Decorators and default values run on import, bodies don't.
+            stack.extend(getattr(node, "decorator_list", []))
+            defaults = node.args.defaults + node.args.kw_defaults
+            stack.extend(d for d in defaults if d is not None)
+            continue
+        yield node
+        stack.extend(ast.iter_child_nodes(node))
+
+
+def uses_orm(function):
+    return any(
+        isinstance(node, ast.Attribute) and node.attr == "objects"
+        for node in ast.walk(function)
+    )
+
+
+@register(TAG)
+def check_import_time_queries(app_configs=None, **kwargs):
+    errors = []
+    for app_config, path in project_modules():
+        tree, lines = parse(path)
+        querying_functions = {
+            node.name
+            for node in tree.body
+            if isinstance(node, ast.FunctionDef) and uses_orm(node)
+        }
+        for node in import_time_nodes(tree):
+            if (
+                not isinstance(node, ast.Call)
+                or is_silenced(lines, node, "shop.W002")
+            ):
+                continue
+            chain = attribute_chain(node.func)
+            direct = queried_model(chain) and chain[-1] in EVALUATING_METHODS
+            indirect = (
+                isinstance(node.func, ast.Name)
+                and node.func.id in querying_functions
+            )
+            if direct or indirect:
+                errors.append(Warning(
+                    f"{'.'.join(chain)}() queries the database on import.",
+                    hint="Run the query lazily, e.g. in __init__() or a "
+                         "callable passed as initial/choices.",
+                    obj=location(path, node),
+                    id="shop.W002",
+                ))
+    return errors
+
+
+def is_unbounded_cache(decorator):
+    if isinstance(decorator, ast.Call):
+        name = attribute_chain(decorator.func)[-1:]
+        if name != ["lru_cache"]:
+            return False
+        maxsize = [k.value for k in decorator.keywords if k.arg == "maxsize"]
+        maxsize += decorator.args[:1]
+        return any(
+            isinstance(v, ast.Constant) and v.value is None for v in maxsize
+        )
+    return attribute_chain(decorator)[-1:] == ["cache"]
+
+
+@register(TAG)
+def check_unbounded_orm_caches(app_configs=None, **kwargs):
+    errors = []
+    for app_config, path in project_modules():
+        tree, lines = parse(path)
+        for node in ast.walk(tree):
+            if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                continue
+            if (
+                any(is_unbounded_cache(d) for d in node.decorator_list)
+                and uses_orm(node)
+                and not is_silenced(lines, node, "shop.W003")
+            ):
+                errors.append(Warning(
+                    f"{node.name}() caches ORM results without bounds and "
+                    f"never sees changes to them.",
+                    hint="Use shop.cache with tags of the models queried.",
+                    obj=location(path, node),
+                    id="shop.W003",
+                ))
+    return errors
+
+
+@register(TAG, deploy=True)
+def check_shared_cache(app_configs=None, **kwargs):
+    backend = settings.CACHES["default"]["BACKEND"]
+    if backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [Warning(
+        "The default cache is local to each process, so invalidating cache "
+        "tags in one worker leaves stale entries in the others.",
+        hint="Set REDIS_URL or configure CACHES with a shared backend.",
+        obj="settings.CACHES",
+        id="shop.W004",
+    )]
@@ -0,0 +1,20 @@
+from django.utils.functional import SimpleLazyObject
+
+from .models import Cart
+from .pricing import customer_group
+from .views import get_cart_id
+
+
+def cart(request):
+    """
+    Add `cart_summary` with the number of products in the request's cart
+    and their amount. It's looked up in the cache only when a template
+    uses it.
+    """
+    def get_summary():
+        cart_id = get_cart_id(request)
+        if cart_id is None:
+            return {"items": 0, "amount": 0}
+        return Cart.get_summary(cart_id, customer_group(request.user))
+
+    return {"cart_summary": SimpleLazyObject(get_summary)}
@@ -1,19 +1,17 @@
-import functools
-
 from django import forms
 from django.contrib.postgres.forms.ranges import IntegerRangeField
 from django.core.exceptions import ValidationError
 from django.core.validators import RegexValidator
-from django.db import DatabaseError
-from django.db.models import F, Min, Max, TextChoices
+from django.db.models import F, Min, Max, Q, TextChoices
 from django.utils.translation import gettext_lazy as _
 
+from . import cache
+from . import services
 from .models import (
     Addition,
     Category,
     Like,
     Order,
-    OrderDetail,
     Product,
     Shipment,
 )
@@ -31,17 +29,27 @@ class RangeWidget(forms.MultiWidget):
         return value if value else [None, None]
 
 
-def get_price_extremes():
-    extremes = Product.objects.filter(in_production=True).aggregate(
-        min=Min("price"),
-        max=Max("price"),
+def get_price_extremes(group=""):
+    """
+    Return the lowest and the highest price customers of discount `group`
+    pay for products in production.
+    """
+    def compute():
+        extremes = (
+            Product.objects.filter(in_production=True)
+            .with_effective_price(group)
+            .aggregate(min=Min("effective_price"), max=Max("effective_price"))
+        )
+        return extremes["min"], extremes["max"]
+
+    return cache.get_or_recompute(
+        f"shop:price-extremes:{group}",
+        compute,
+        ["product", "effectiveprice"],
     )
-    return extremes["min"], extremes["max"]
 
-def get_initial_price_range():
-    return 0, Product.objects.filter(in_production=True).aggregate(
-        max=Max("price")
-    )["max"]
+def get_initial_price_range(group=""):
+    return 0, get_price_extremes(group)[1]
 
 
 class PriceRangeField(forms.MultiValueField):
@@ -54,25 +62,35 @@ class PriceRangeField(forms.MultiValueField):
     # the input to a simple tuple, not some fancy psycopg Range instance.
     # It's yet to see if it proves to be sufficient this way.
 
-    def __init__(self, **kwargs):
-        lo, hi = get_initial_price_range()
-        fields = (
+    # Bounds are set per form instance with set_bounds() rather than here,
+    # because this field is created when the form class is defined and
+    # querying the database at import time slows down worker startup.
+    def __init__(self, lo=None, hi=None, **kwargs):
+        super().__init__(
+            fields=self.make_fields(lo, hi),
+            require_all_fields=False,
+            required=False,
+            widget=RangeWidget,
+            **kwargs,
+        )
+
+    def make_fields(self, lo, hi):
+        # Each of min and max price lies within the bounds.
+        return (
             forms.IntegerField(
                 min_value=lo,
+                max_value=hi,
                 required=False,
             ),
             forms.IntegerField(
+                min_value=lo,
                 max_value=hi,
                 required=False,
             ),
         )
-        super().__init__(
-            fields=fields,
-            require_all_fields=False,
-            required=False,
-            widget=RangeWidget,
-            **kwargs,
-        )
+
+    def set_bounds(self, lo, hi):
+        self.fields = self.make_fields(lo, hi)
 
     def compress(self, data_list):
         try:
@@ -87,24 +105,10 @@ class PriceRangeField(forms.MultiValueField):
             return
 
 
-@functools.cache
 def get_category_types():
-    try:
-        return list(Category.objects.values_list("name", flat=True).distinct("name"))
-    except (TypeError, DatabaseError, Exception):
-        # distinct() accepts field names only when working with PostgreSQL.
-        # Not sure what exact exception will be raised in case of another db.
-        names = list(Category.objects.values_list("name", flat=True))
-        processed = {}
-
-        def keep_as_distinct(item):
-            try:
-                return not processed[item]
-            except KeyError:
-                processed[item] = True
-                return True
-
-        return list(filter(keep_as_distinct, names))
+    # Categories are ordered by name, so this keeps the order of names.
+    names = (category.name for category in Category.objects.all_cached())
+    return list(dict.fromkeys(names))
 
 
 class CatalogFilterForm(forms.Form):
@@ -120,10 +124,11 @@ class CatalogFilterForm(forms.Form):
         required=False,
     )
     # TODO: Provide initial from the view to account for current filters.
-    price = PriceRangeField(initial=get_initial_price_range)
+    price = PriceRangeField()
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, group="", **kwargs):
         super().__init__(*args, **kwargs)
+        self.set_price_bounds(group)
         # Categories may change any time. Hence, it makes more sense to attach
         # the result of get_category_types() to an instance.
         self.categories = get_category_types()
@@ -135,9 +140,53 @@ class CatalogFilterForm(forms.Form):
                 widget=forms.CheckboxSelectMultiple,
             )
 
+    def set_price_bounds(self, group):
+        # Prices are those customers of discount `group` pay.
+        price_range = get_initial_price_range(group)
+        self.fields["price"].initial = price_range
+        self.fields["price"].set_bounds(*price_range)
+
     def category_fields(self):
         return [self[ctg] for ctg in self.categories]
 
+    def get_query_conditions(self):
+        """
+        Return a list of Q objects to filter Product instances with.
+        Call on a valid form only.
+        """
+        data = self.cleaned_data
+        conditions = [
+            Q(category__in=data[ctg])
+            for ctg in self.categories
+            if data[ctg].exists()
+        ]
+        if data["retail"]:
+            conditions.append(
+                Q(min_order_quantity__lte=F("quantity")) & Q(quantity__gt=0)
+            )
+        # Prices are what the customer pays, so filter a queryset
+        # annotated with_effective_price().
+        lo, hi = data["price"] or (None, None)
+        if lo is not None:
+            conditions.append(Q(effective_price__gte=lo))
+        if hi is not None:
+            conditions.append(Q(effective_price__lte=hi))
+        return conditions
+
+
+class ApiFilterForm(CatalogFilterForm):
+    """
+    CatalogFilterForm for the API. Prices may be any non-negative range,
+    since clients keep filters while prices change.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields["action"].required = False
+
+    def set_price_bounds(self, group):
+        self.fields["price"].set_bounds(0, None)
+
 
 class CatalogSortForm(forms.Form):
     """
@@ -181,16 +230,48 @@ class LikeForm(forms.ModelForm):
         return like
 
 
+class CachedModelChoiceField(forms.ModelChoiceField):
+    """
+    A ModelChoiceField that looks the chosen object up with get_cached()
+    rather than with a query each time. The object must not be modified,
+    and filters of `queryset` aren't applied.
+    """
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        model = self.queryset.model
+        try:
+            return model.objects.get_cached(int(value))
+        except (TypeError, ValueError, model.DoesNotExist):
+            raise ValidationError(
+                self.error_messages["invalid_choice"],
+                code="invalid_choice",
+                params={"value": value},
+            )
+
+
 class AdditionForm(forms.ModelForm):
     action = forms.CharField(initial="addition", widget=forms.HiddenInput)
 
     class Meta:
         model = Addition
         fields = ["product"]
+        field_classes = {
+            # Products are added to carts from every catalog page.
+            "product": CachedModelChoiceField,
+        }
         widgets = {
             "product": forms.HiddenInput,
         }
 
+    def _get_validation_exclusions(self):
+        # The field found the product already, so spare the query with
+        # which ForeignKey.validate() checks it exists.
+        exclude = super()._get_validation_exclusions()
+        exclude.add("product")
+        return exclude
+
 
 class CreateAdditionForm(AdditionForm):
     """
@@ -221,6 +302,8 @@ class AdditionQuantityForm(AdditionForm):
         super().clean()
         qty = self.cleaned_data["quantity"]
         product = self.instance.product
+        # Read without a lock to advise the customer. Checkout checks stock
+        # again with the product rows locked.
         available = product.quantity
         minimum = product.min_order_quantity
         params = {
@@ -313,29 +396,15 @@ class CreateOrderForm(forms.ModelForm):
                 )
                 self.add_error("quantity", error)
 
-    def save(self, commit=True):
+    def save(self):
+        # The order can't be left unsaved: it's saved along with its
+        # details and stock reservations in one transaction.
         order = super().save(commit=False)
-        order.save()
-        cart = order.user.cart.products.all()
         if self["from_cart"].value():
-            order_now = Addition.objects.filter(product__in=cart, order_now=True)
-            OrderDetail.objects.bulk_create(
-                [
-                    OrderDetail(
-                        order=order,
-                        product=a.product,
-                        quantity=a.quantity,
-                    )
-                    for a in order_now
-                ]
-            )
-        else:
-            OrderDetail.objects.create(
-                order=order,
-                product=self.product,
-                quantity=self.cleaned_data["quantity"],
-            )
-        return order
+            return services.checkout(order.user.cart, order)
+        return services.order_product(
+            order, self.product, self.cleaned_data["quantity"]
+        )
 
 
 class FullNameWidget(forms.MultiWidget):
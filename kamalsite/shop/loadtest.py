@@ -0,0 +1,368 @@
+"""
+Drive an ASGI application in-process, or a local server over HTTP, with
+concurrent requests and report throughput and latency percentiles.
+
+Scenarios turn a random generator and LoadData into a request, or into
+a coroutine function making several requests with `send`. run_mix()
+sends requests of scenarios picked by weight, e.g. mostly catalog
+browsing with some liking and adding to cart.
+"""
+import asyncio
+import random
+import secrets
+import time
+import urllib.parse
+
+from django.urls import reverse
+
+
+def csrf_headers():
+    """
+    Return headers that pass CsrfViewMiddleware: the same secret in the
+    CSRF cookie and in the X-CSRFToken header.
+    """
+    secret = secrets.token_hex(16)
+    return [
+        (b"cookie", f"csrftoken={secret}".encode()),
+        (b"x-csrftoken", secret.encode()),
+    ]
+
+
+def cookie_headers(headers, cookies):
+    """
+    Add `cookies` to the cookie header in `headers`.
+    """
+    if not cookies:
+        return list(headers)
+    values = [v.decode() for k, v in headers if k == b"cookie"]
+    values += [f"{name}={value}" for name, value in cookies.items()]
+    return [
+        *((k, v) for k, v in headers if k != b"cookie"),
+        (b"cookie", "; ".join(values).encode()),
+    ]
+
+
+def store_cookies(cookies, set_cookie_values):
+    for value in set_cookie_values:
+        name, _, rest = value.partition("=")
+        cookies[name.strip()] = rest.split(";", 1)[0]
+
+
+async def asgi_request(app, method, path, query_string="", body=b"",
+                       headers=(), cookies=None):
+    """
+    Send a single HTTP request to an ASGI app and return the status code.
+    `cookies`, a dict, is sent along and updated from the response like a
+    browser's cookie jar would be.
+    """
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query_string.encode(),
+        "root_path": "",
+        "headers": [(b"host", b"localhost"), *cookie_headers(headers, cookies)],
+        "client": ("127.0.0.1", 0),
+        "server": ("localhost", 80),
+    }
+    if body:
+        scope["headers"] += [
+            (b"content-type", b"application/x-www-form-urlencoded"),
+            (b"content-length", str(len(body)).encode()),
+        ]
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    disconnected = asyncio.Event()
+    status = None
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        # Django listens for a disconnect while handling the request.
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+            if cookies is not None:
+                store_cookies(cookies, [
+                    v.decode() for k, v in message["headers"]
+                    if k.lower() == b"set-cookie"
+                ])
+
+    await app(scope, receive, send)
+    disconnected.set()
+    return status
+
+
+def percentile(ordered, p):
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, round(p / 100 * (len(ordered) - 1)))
+    return ordered[index]
+
+
+def summarize(latencies, elapsed, errors):
+    ordered = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "throughput": round(len(latencies) / elapsed, 1) if elapsed else None,
+        "p50_ms": round(percentile(ordered, 50) * 1000, 2) if ordered else None,
+        "p95_ms": round(percentile(ordered, 95) * 1000, 2) if ordered else None,
+        "p99_ms": round(percentile(ordered, 99) * 1000, 2) if ordered else None,
+    }
+
+
+async def run_load(send_request, total, concurrency, label=None):
+    """
+    Call `send_request(i)` `total` times with at most `concurrency` calls
+    in flight. send_request must return a coroutine resolving to an HTTP
+    status code. Responses with status >= 400 count as errors.
+    If `label(i)` is given, results are also summarized per label under
+    "labels".
+    """
+    latencies = {}
+    errors = {}
+    counter = iter(range(total))
+
+    async def worker():
+        for i in counter:
+            key = label(i) if label else None
+            start = time.perf_counter()
+            try:
+                status = await send_request(i)
+            except Exception:
+                status = None
+            latencies.setdefault(key, []).append(time.perf_counter() - start)
+            if status is None or status >= 400:
+                errors[key] = errors.get(key, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    result = summarize(
+        [t for times in latencies.values() for t in times],
+        elapsed,
+        sum(errors.values()),
+    )
+    if label:
+        result["labels"] = {
+            key: summarize(times, elapsed, errors.get(key, 0))
+            for key, times in sorted(latencies.items())
+        }
+    return result
+
+
+def asgi_target(app):
+    """
+    Return a function sending a request to an ASGI app in-process.
+    """
+    def send(method, path, query_string="", body=b"", headers=(),
+             cookies=None):
+        return asgi_request(
+            app, method, path, query_string, body, headers, cookies
+        )
+    return send
+
+
+def http_target(base_url):
+    """
+    Return a function sending a request to a server at `base_url`, e.g.
+    "http://localhost:8000", over a new HTTP/1.1 connection.
+    """
+    url = urllib.parse.urlsplit(base_url)
+    port = url.port or 80
+
+    async def send(method, path, query_string="", body=b"", headers=(),
+                   cookies=None):
+        reader, writer = await asyncio.open_connection(url.hostname, port)
+        target = f"{path}?{query_string}" if query_string else path
+        lines = [
+            f"{method} {target} HTTP/1.1",
+            f"Host: {url.netloc}",
+            "Connection: close",
+            f"Content-Length: {len(body)}",
+        ]
+        if body:
+            lines.append("Content-Type: application/x-www-form-urlencoded")
+        lines += [
+            f"{k.decode()}: {v.decode()}"
+            for k, v in cookie_headers(headers, cookies)
+        ]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode() + body)
+        await writer.drain()
+        try:
+            status_line = await reader.readline()
+            # Read the rest so that the whole response counts in latency.
+            head, _, _ = (await reader.read()).partition(b"\r\n\r\n")
+        finally:
+            writer.close()
+        if cookies is not None:
+            store_cookies(cookies, [
+                line.split(b":", 1)[1].decode()
+                for line in head.split(b"\r\n")
+                if line.lower().startswith(b"set-cookie:")
+            ])
+        return int(status_line.split()[1])
+
+    return send
+
+
+class LoadData:
+    """
+    Existing objects that scenarios make requests about.
+    """
+
+    def __init__(self, product_ids, pages, filters, price_range=None):
+        self.product_ids = product_ids
+        self.pages = pages
+        # (category name, value) pairs.
+        self.filters = filters
+        # Bounds of prices the catalog filter accepts, or None if there are
+        # no products.
+        self.price_range = price_range
+
+    @classmethod
+    def load(cls, products=500):
+        from .forms import get_initial_price_range
+        from .models import Category, Product
+        from .views import CatalogView
+
+        qs = Product.objects.filter(in_production=True)
+        count = qs.count()
+        # Visitors are anonymous and see prices for everyone.
+        lo, hi = get_initial_price_range()
+        return cls(
+            product_ids=list(
+                qs.order_by("?").values_list("pk", flat=True)[:products]
+            ),
+            pages=max(1, -(-count // CatalogView.paginate_by)),
+            filters=list(Category.objects.values_list("name", "value")),
+            price_range=None if hi is None else (lo, int(hi)),
+        )
+
+
+def browse(rng, data):
+    page = min(data.pages, int(rng.paretovariate(1.5)))
+    return "GET", reverse("shop:catalog", kwargs={"page": page}), "", b""
+
+
+def view_product(rng, data):
+    pk = rng.choice(data.product_ids)
+    return "GET", reverse("shop:product-detail", kwargs={"pk": pk}), "", b""
+
+
+def filter_catalog(rng, data):
+    query = [("action", "filter_catalog")]
+    if data.filters:
+        query += rng.sample(data.filters, min(2, len(data.filters)))
+    if data.price_range and rng.random() < 0.5:
+        # Prices out of the range the form accepts make the view fail.
+        lo, hi = data.price_range
+        price_min = rng.randint(lo, (lo + hi) // 2)
+        query += [
+            ("price_min", price_min),
+            ("price_max", rng.randint(price_min, hi)),
+        ]
+    path = reverse("shop:catalog-filter")
+    return "GET", path, urllib.parse.urlencode(query), b""
+
+
+def like(rng, data):
+    pk = rng.choice(data.product_ids)
+    path = reverse("shop:product-card-like", kwargs={"product_id": pk})
+    return "POST", path, "", b"action=like"
+
+
+def add_to_cart(rng, data):
+    pk = rng.choice(data.product_ids)
+    path = reverse("shop:product-card-add", kwargs={"product_id": pk})
+    return "POST", path, "", f"action=addition&product={pk}".encode()
+
+
+def checkout(rng, data):
+    """
+    Add a product to a new visitor's cart and order it. Both requests
+    count in the latency of the scenario.
+    """
+    method, add_path, _, body = add_to_cart(rng, data)
+
+    async def run(send):
+        secret = secrets.token_hex(16)
+        cookies = {"csrftoken": secret}
+        headers = [(b"x-csrftoken", secret.encode())]
+        status = await send(method, add_path, "", body, headers, cookies)
+        if status >= 400:
+            return status
+        return await send(
+            "POST", reverse("shop:checkout"), "", b"", headers, cookies
+        )
+
+    return run
+
+
+SCENARIOS = {
+    "browse": browse,
+    "product": view_product,
+    "filter": filter_catalog,
+    "like": like,
+    "add": add_to_cart,
+    "checkout": checkout,
+}
+DEFAULT_MIX = {
+    "browse": 50,
+    "product": 20,
+    "filter": 15,
+    "like": 5,
+    "add": 7,
+    "checkout": 3,
+}
+
+
+def parse_mix(text):
+    """
+    Parse "browse=50,like=10" into {"browse": 50, "like": 10}.
+    """
+    mix = {}
+    for part in filter(None, text.split(",")):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise ValueError(
+                f"Unknown scenario {name!r}. Choose from {', '.join(SCENARIOS)}."
+            )
+        try:
+            mix[name] = float(weight or 1)
+        except ValueError:
+            raise ValueError(f"Invalid weight of {name!r}: {weight!r}.")
+    if not mix or sum(mix.values()) <= 0:
+        raise ValueError("Give at least one scenario a positive weight.")
+    return mix
+
+
+async def run_mix(send, data, mix, total, concurrency, seed=None):
+    """
+    Send `total` requests of scenarios picked from `mix` by weight with
+    `send` (see asgi_target() and http_target()).
+    """
+    rng = random.Random(seed)
+    names = rng.choices(list(mix), weights=list(mix.values()), k=total)
+    requests = [SCENARIOS[name](rng, data) for name in names]
+
+    def send_request(i):
+        if callable(requests[i]):
+            return requests[i](send)
+        method, path, query_string, body = requests[i]
+        headers = csrf_headers() if method == "POST" else []
+        return send(method, path, query_string, body, headers)
+
+    return await run_load(
+        send_request, total, concurrency, label=names.__getitem__,
+    )
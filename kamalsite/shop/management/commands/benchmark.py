@@ -0,0 +1,98 @@
+import json
+import platform
+import subprocess
+
+import django
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.test.utils import (
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+    teardown_test_environment,
+)
+
+from shop.benchmark import run_scenarios, sample_product_ids
+from shop.seeding import Seeder
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed catalogs of the given sizes into a test database and benchmark "
+        "the catalog, filter, product page, like and add-to-cart views. "
+        "Latency, queries and allocations per scenario are written as JSON "
+        "for comparison between commits."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            nargs="+",
+            type=int,
+            default=[1000, 10000, 100000],
+            help="Numbers of products to benchmark with.",
+        )
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", default="benchmark.json")
+        parser.add_argument(
+            "--label",
+            default="",
+            help="A name to tell this run apart, e.g. a branch name.",
+        )
+
+    def handle(self, *args, **options):
+        report = {
+            "label": options["label"],
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "repeat": options["repeat"],
+            "sizes": {},
+        }
+        # Never touch the real database. Work in a fresh test database.
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            for size in options["sizes"]:
+                self.stdout.write(f"Seeding {size} products...")
+                report["sizes"][size] = self.benchmark(size, options)
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+        with open(options["output"], "w") as f:
+            json.dump(report, f, indent=2)
+        self.stdout.write(f"Results written to {options['output']}.")
+
+    def benchmark(self, size, options):
+        call_command("flush", interactive=False, verbosity=0)
+        cache.clear()
+        Seeder(seed=options["seed"]).seed_catalog(size)
+        user = get_user_model().objects.order_by("pk").first()
+        product_ids = sample_product_ids(100, options["seed"])
+        results = run_scenarios(user, product_ids, repeat=options["repeat"])
+        self.stdout.write(
+            f"{'scenario':<16}{'p50 ms':>10}{'p95 ms':>10}{'queries':>9}"
+            f"{'alloc kB':>10}{'errors':>8}"
+        )
+        for name, stats in results.items():
+            self.stdout.write(
+                f"{name:<16}{stats['p50_ms']:>10}{stats['p95_ms']:>10}"
+                f"{stats['queries']:>9}{stats['peak_alloc_kb']:>10}"
+                f"{stats['errors']:>8}"
+            )
+        return results
@@ -0,0 +1,78 @@
+import asyncio
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from shop.loadtest import asgi_request, csrf_headers, run_load
+from shop.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Load the sync and async versions of the catalog, product page, like "
+        "and add-to-cart views through the ASGI application with the same "
+        "concurrency and compare throughput and latency percentiles."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument("--concurrency", type=int, default=20)
+        parser.add_argument(
+            "--json",
+            action="store_true",
+            help="Print results as JSON.",
+        )
+
+    def handle(self, *args, **options):
+        product = Product.objects.filter(in_production=True).first()
+        if product is None:
+            raise CommandError("Create some products first (see seed_data).")
+        pairs = [
+            ("catalog", "GET", "catalog", {"page": 1}),
+            ("detail", "GET", "product-detail", {"pk": product.pk}),
+            ("like", "POST", "product-card-like", {"product_id": product.pk}),
+            ("add", "POST", "product-card-add", {"product_id": product.pk}),
+        ]
+        bodies = {
+            "like": b"action=like",
+            "add": f"action=addition&product={product.pk}".encode(),
+        }
+        results = asyncio.run(
+            self.compare(pairs, bodies, options["requests"], options["concurrency"])
+        )
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(
+            f"{'view':<16}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}"
+            f"{'p99 ms':>10}{'errors':>8}"
+        )
+        for name, stats in results.items():
+            self.stdout.write(
+                f"{name:<16}{stats['throughput']:>10}{stats['p50_ms']:>10}"
+                f"{stats['p95_ms']:>10}{stats['p99_ms']:>10}{stats['errors']:>8}"
+            )
+
+    async def compare(self, pairs, bodies, total, concurrency):
+        from kamalsite.asgi import application
+
+        results = {}
+        for name, method, url_name, kwargs in pairs:
+            for prefix in ("", "async-"):
+                path = reverse(f"shop:{prefix}{url_name}", kwargs=kwargs)
+                body = bodies.get(name, b"")
+                headers = csrf_headers() if method == "POST" else []
+
+                def send_request(i, path=path, body=body, headers=headers):
+                    return asgi_request(
+                        application,
+                        method,
+                        path,
+                        body=body,
+                        headers=headers,
+                    )
+
+                label = f"{name} ({'async' if prefix else 'sync'})"
+                results[label] = await run_load(send_request, total, concurrency)
+        return results
@@ -0,0 +1,79 @@
+import asyncio
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.loadtest import (
+    DEFAULT_MIX,
+    LoadData,
+    asgi_target,
+    http_target,
+    parse_mix,
+    run_mix,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate load with a mix of catalog browsing, product pages, "
+        "filtering, liking, adding to cart and checkout, and report "
+        "throughput and p50/p95/p99 latencies overall and per scenario. "
+        "Requests go to the ASGI application in-process unless --url is "
+        "given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=1000)
+        parser.add_argument("--concurrency", type=int, default=50)
+        parser.add_argument(
+            "--mix",
+            default=",".join(f"{k}={v}" for k, v in DEFAULT_MIX.items()),
+            help="Scenario weights, e.g. browse=70,like=30.",
+        )
+        parser.add_argument(
+            "--url",
+            help="Base URL of a running server, e.g. http://localhost:8000.",
+        )
+        parser.add_argument("--seed", type=int)
+        parser.add_argument(
+            "--json",
+            action="store_true",
+            help="Print results as JSON.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            mix = parse_mix(options["mix"])
+        except ValueError as e:
+            raise CommandError(e)
+        data = LoadData.load()
+        if not data.product_ids:
+            raise CommandError("Create some products first (see seed_data).")
+        if options["url"]:
+            send = http_target(options["url"])
+        else:
+            from kamalsite.asgi import application
+
+            send = asgi_target(application)
+        results = asyncio.run(run_mix(
+            send,
+            data,
+            mix,
+            options["requests"],
+            options["concurrency"],
+            seed=options["seed"],
+        ))
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(
+            f"{'scenario':<12}{'requests':>10}{'req/s':>10}{'p50 ms':>10}"
+            f"{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}"
+        )
+        rows = [*results.pop("labels").items(), ("total", results)]
+        for name, stats in rows:
+            self.stdout.write(
+                f"{name:<12}{stats['requests']:>10}{stats['throughput']:>10}"
+                f"{stats['p50_ms']:>10}{stats['p95_ms']:>10}"
+                f"{stats['p99_ms']:>10}{stats['errors']:>8}"
+            )
@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_databases, teardown_databases
+
+from shop import queryplans
+from shop.seeding import Seeder
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a test database, EXPLAIN the critical queries registered in "
+        "shop.queryplans and fail on sequential scans of large tables or "
+        "costs well above the stored baseline. PostgreSQL only."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--products", type=int, default=queryplans.BASELINE_PRODUCTS
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--cost-ratio", type=float, default=2.0)
+        parser.add_argument("--large-table-rows", type=int, default=10000)
+        parser.add_argument(
+            "--update-baseline",
+            action="store_true",
+            help=f"Write current plans to {queryplans.BASELINE_FILE.name}.",
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("Query plans are only checked on PostgreSQL.")
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            seeder = Seeder(seed=options["seed"])
+            seeder.seed_catalog(options["products"])
+            seeder.seed_orders()
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+            if options["update_baseline"]:
+                queryplans.save_baseline(queryplans.capture_plans())
+                self.stdout.write(
+                    f"Baseline written to {queryplans.BASELINE_FILE}."
+                )
+                return
+            problems = queryplans.check_plans(
+                cost_ratio=options["cost_ratio"],
+                large_table_rows=options["large_table_rows"],
+            )
+        finally:
+            teardown_databases(old_config, verbosity=0)
+        if problems:
+            raise CommandError("\n".join(problems))
+        self.stdout.write(self.style.SUCCESS("Query plans are fine."))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from shop import pricing
+
+
+class Command(BaseCommand):
+    help = (
+        "Resolve effective prices again for products whose discounts "
+        "started or ended. Run it daily shortly after midnight, or with "
+        "--all to rebuild every price."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true")
+
+    def handle(self, *args, **options):
+        if options["all"]:
+            count = pricing.refresh()
+        else:
+            count = pricing.refresh_expired()
+        self.stdout.write(f"Refreshed {count} prices.")
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from shop.services import release_reservations
+
+
+class Command(BaseCommand):
+    help = (
+        "Return stock reserved by cancelled orders and by orders not paid "
+        "within STOCK_RESERVATION_MINUTES, and drop reservations of paid "
+        "orders. Run it periodically, e.g. from cron."
+    )
+
+    def handle(self, *args, **options):
+        released = release_reservations()
+        self.stdout.write(f"Released {released} reservations.")
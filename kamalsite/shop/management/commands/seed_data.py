@@ -0,0 +1,52 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop.seeding import Seeder
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the database with synthetic, referentially valid products, "
+        "categories, discounts, users, likes, carts, orders, supplies and "
+        "production processes. The same --seed gives the same data."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=100000)
+        parser.add_argument(
+            "--users",
+            type=int,
+            help="Number of users, a tenth of products by default.",
+        )
+        parser.add_argument("--likes-per-user", type=int, default=20)
+        parser.add_argument("--cart-share", type=float, default=0.5)
+        parser.add_argument("--order-share", type=float, default=0.3)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument(
+            "--copy",
+            action="store_true",
+            help="Insert with COPY instead of INSERT on PostgreSQL.",
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        seeder = Seeder(
+            seed=options["seed"],
+            batch_size=options["batch_size"],
+            use_copy=options["copy"],
+            log=self.stdout.write,
+        )
+        seeder.seed_catalog(
+            options["products"],
+            users=options["users"],
+            likes_per_user=options["likes_per_user"],
+            cart_share=options["cart_share"],
+        )
+        seeder.seed_orders(share=options["order_share"])
+        seeder.seed_production()
+        total = sum(seeder.counts.values())
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {total} rows in {time.perf_counter() - start:.1f} s."
+        ))
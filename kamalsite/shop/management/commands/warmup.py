@@ -0,0 +1,26 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from kamalsite.warmup import measure_startup, warm_up
+
+
+class Command(BaseCommand):
+    help = (
+        "Load URL patterns, templates and catalog caches. With --startup, "
+        "measure setup, import and warm-up times of a fresh process and "
+        "check that imports don't touch the database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--startup", action="store_true")
+
+    def handle(self, *args, **options):
+        if not options["startup"]:
+            for name, seconds in warm_up().items():
+                self.stdout.write(f"{name:<16}{seconds * 1000:>10.1f} ms")
+            return
+        report = measure_startup()
+        self.stdout.write(json.dumps(report, indent=2))
+        if report["import_db_io"]:
+            raise CommandError(report["import_db_io"])
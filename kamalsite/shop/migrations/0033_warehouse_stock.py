@@ -0,0 +1,67 @@
+# Generated by Django 5.0.1 on 2026-10-19 16:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def stock_main_warehouse(apps, schema_editor):
+    """
+    Move existing stock and reservations to a single warehouse.
+    """
+    Product = apps.get_model("shop", "Product")
+    Reservation = apps.get_model("shop", "Reservation")
+    Stock = apps.get_model("shop", "Stock")
+    Warehouse = apps.get_model("shop", "Warehouse")
+    products = Product.objects.filter(quantity__gt=0)
+    if not products.exists() and not Reservation.objects.exists():
+        return
+    main = Warehouse.objects.create(name="Main")
+    Stock.objects.bulk_create(
+        Stock(warehouse=main, product_id=pk, quantity=quantity)
+        for pk, quantity in products.values_list("pk", "quantity").iterator()
+    )
+    Reservation.objects.update(warehouse=main)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0032_reservation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Warehouse',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=75, unique=True)),
+                ('address', models.CharField(blank=True, max_length=300)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='quantity',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12, verbose_name='available quantity'),
+        ),
+        migrations.CreateModel(
+            name='Stock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stocks', to='shop.product')),
+                ('warehouse', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='stocks', to='shop.warehouse')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('product', 'warehouse'), name='unique_product_warehouse'), models.CheckConstraint(check=models.Q(('quantity__gte', 0)), name='stock_quantity_not_negative')],
+            },
+        ),
+        migrations.AddField(
+            model_name='reservation',
+            name='warehouse',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, to='shop.warehouse'),
+        ),
+        # Last, as PostgreSQL can't alter tables with the deferred foreign key
+        # checks of the inserted rows pending. Reservation.warehouse is made
+        # required in the next migration.
+        migrations.RunPython(stock_main_warehouse, migrations.RunPython.noop),
+    ]
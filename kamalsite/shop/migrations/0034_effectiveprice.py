@@ -0,0 +1,39 @@
+# Generated by Django 5.0.1 on 2026-10-19 16:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def resolve_prices(apps, schema_editor):
+    from shop import pricing
+
+    pricing.refresh(apps=apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0033_warehouse_stock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EffectivePrice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('group', models.CharField(blank=True, max_length=50)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('valid_until', models.DateField(db_index=True, null=True)),
+                ('discount', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='shop.discount')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='effective_prices', to='shop.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['group', 'price'], name='shop_price_group_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='effectiveprice',
+            constraint=models.UniqueConstraint(fields=('product', 'group'), name='unique_product_group'),
+        ),
+        migrations.RunPython(resolve_prices, migrations.RunPython.noop),
+    ]
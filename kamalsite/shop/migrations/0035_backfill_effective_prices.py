@@ -0,0 +1,35 @@
+from django.db import migrations, models
+
+
+def resolve_missing_prices(apps, schema_editor):
+    """
+    Resolve prices of products missing a row of any discount group, e.g.
+    created in bulk before bulk creation resolved them.
+    """
+    from shop import pricing
+
+    Discount = apps.get_model("shop", "Discount")
+    Product = apps.get_model("shop", "Product")
+    groups = {""} | set(Discount.objects.values_list("group", flat=True))
+    product_ids = set(
+        Product.objects.annotate(
+            groups=models.Count(
+                "effective_prices",
+                filter=models.Q(effective_prices__group__in=groups),
+            )
+        )
+        .filter(groups__lt=len(groups))
+        .values_list("pk", flat=True)
+    )
+    pricing.refresh(product_ids, apps=apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0034_effectiveprice'),
+    ]
+
+    operations = [
+        migrations.RunPython(resolve_missing_prices, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.14 on 2026-10-19 18:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0035_backfill_effective_prices'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='reservation',
+            name='warehouse',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='shop.warehouse'),
+        ),
+    ]
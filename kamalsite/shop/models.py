@@ -3,8 +3,11 @@ import datetime
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.sessions.models import Session
-from django.db import models
+from django.db import models, transaction
 from django.db.models import ObjectDoesNotExist
+from django.utils import timezone
+
+from . import cache
 
 # TODO:
 #   -   Track popularity of products based on number of visits of product
@@ -15,17 +18,177 @@ def get_sentinel_user():
     return get_user_model().objects.get_or_create(username="deleted")[0]
 
 
+class CacheTagQuerySet(models.QuerySet):
+    """
+    Invalidate cache entries tagged with the model name on bulk writes,
+    which don't send model signals.
+    """
+
+    # False for models no entries of the local cache are built from, so
+    # that writes leave local caches alone.
+    local_entries = True
+    # Fields updated too often to drop local caches for. Local entries may
+    # show them up to LocalCache.ttl seconds old.
+    volatile_fields = frozenset()
+    # True for catalog models, whose bulk writes are recorded as
+    # CatalogChange for mirrors. Takes a query for primary keys on update().
+    records_changes = False
+
+    def update(self, **kwargs):
+        if self.records_changes:
+            with transaction.atomic(savepoint=False):
+                object_ids = set(self.values_list("pk", flat=True))
+                rows = super().update(**kwargs)
+                self.rows_written(object_ids, kwargs.keys())
+        else:
+            rows = super().update(**kwargs)
+        cache.invalidate(
+            self.model._meta.model_name,
+            local_entries=(
+                self.local_entries
+                and not kwargs.keys() <= self.volatile_fields
+            ),
+        )
+        return rows
+
+    update.alters_data = True
+
+    def bulk_create(self, *args, **kwargs):
+        with transaction.atomic(savepoint=False):
+            objs = super().bulk_create(*args, **kwargs)
+            if self.records_changes:
+                # Primary keys are unknown for rows skipped on conflicts.
+                self.rows_written(
+                    {obj.pk for obj in objs if obj.pk is not None}
+                )
+        cache.invalidate(
+            self.model._meta.model_name, local_entries=self.local_entries
+        )
+        return objs
+
+    bulk_create.alters_data = True
+
+    def rows_written(self, object_ids, fields=None):
+        """
+        Handle a bulk write of `fields` (all if None) of the rows with
+        `object_ids`, in its transaction.
+        """
+        from .signals import record_changes
+
+        record_changes(self.model, object_ids)
+
+    def get_cached(self, pk):
+        """
+        Return the object with the given pk from the local or shared cache.
+        The object must not be modified.
+        """
+        name = self.model._meta.model_name
+        return cache.get_local(
+            f"shop:{name}:{pk}",
+            lambda: self.get(pk=pk),
+            [name],
+        )
+
+    def all_cached(self):
+        """
+        Return a list of all objects of the model from the local or shared
+        cache. Meant for small tables like categories.
+        """
+        name = self.model._meta.model_name
+        return cache.get_local(
+            f"shop:{name}:all",
+            lambda: list(self.model._default_manager.all()),
+            [name],
+        )
+
+
+class CatalogQuerySet(CacheTagQuerySet):
+    records_changes = True
+
+
+class ProductQuerySet(CatalogQuerySet):
+    # Stock changes with every order.
+    volatile_fields = frozenset({"quantity"})
+    # Fields effective prices are resolved from.
+    price_fields = frozenset({"price", "discount", "discount_id"})
+
+    def rows_written(self, object_ids, fields=None):
+        from . import pricing
+
+        super().rows_written(object_ids, fields)
+        # Bulk writes send no signals, so resolve effective prices here to
+        # keep a row of every group for every product.
+        if fields is None or fields & self.price_fields:
+            pricing.refresh(object_ids)
+
+    def with_like_count(self):
+        # distinct=True keeps the count right when other multi-valued
+        # relations (e.g. categories) are joined in the same query.
+        return self.annotate(
+            like_count=models.Count(
+                "likes",
+                filter=models.Q(likes__liked=True),
+                distinct=True,
+            ),
+        )
+
+    def for_detail_page(self):
+        """
+        Load products along with their discount, like count and categories
+        in two queries regardless of how many products are fetched.
+        """
+        return (
+            self.select_related("discount")
+            .with_like_count()
+            .prefetch_related(
+                models.Prefetch(
+                    "category_set",
+                    queryset=Category.objects.all(),
+                    to_attr="categories",
+                )
+            )
+        )
+
+    def with_effective_price(self, group=""):
+        """
+        Annotate effective_price, the price customers of discount `group`
+        pay, and effective_discount_id, the discount taken off, from
+        EffectivePrice. Every product has a row of every group, so this
+        is an inner join, and ordering and filtering by the price can use
+        the (group, price) index.
+        """
+        return self.filter(effective_prices__group=group).annotate(
+            effective_price=models.F("effective_prices__price"),
+            effective_discount_id=models.F("effective_prices__discount"),
+        )
+
+    def related_to(self, product, limit=4):
+        """
+        Return up to `limit` products sharing categories with `product`,
+        most similar first.
+        """
+        return (
+            self.filter(category__products=product)
+            .exclude(pk=product.pk)
+            .annotate(shared=models.Count("category", distinct=True))
+            .order_by("-shared", "name")[:limit]
+        )
+
+
 class Product(models.Model):
     name = models.CharField(max_length=75)
     description = models.TextField()
 
     price = models.DecimalField(max_digits=12, decimal_places=2)
     unit_measure = models.CharField(max_length=30, default="units")
+    # Total of Stock.quantity over warehouses, kept up to date by
+    # shop.services along with the stock of each warehouse.
     quantity = models.DecimalField(
         "available quantity",
         default=0,
         max_digits=12,
         decimal_places=2,
+        editable=False,
     )
     min_order_quantity = models.DecimalField(max_digits=12, decimal_places=2)
 
@@ -42,6 +205,8 @@ class Product(models.Model):
         null=True,
     )
 
+    objects = ProductQuerySet.as_manager()
+
     def save(self, *args, **kwargs):
         if self.min_order_quantity is None:
             return  # Can't save without specifying min_order
@@ -54,11 +219,22 @@ class Product(models.Model):
     def min_order_amount(self):
         return self.min_order_quantity * self.price
 
+    def active_discount(self):
+        """
+        Return the discount if it currently applies, otherwise None.
+        Use with select_related("discount") to avoid an extra query.
+        """
+        if self.discount_id and self.discount.is_active():
+            return self.discount
+        return None
+
     def __str__(self):
         return f"{self.name}"
 
 
-class TrueLikesQuerySet(models.QuerySet):
+class TrueLikesQuerySet(CacheTagQuerySet):
+    local_entries = False
+
     def qty(self):
         return self.filter(liked=True).count()
 
@@ -105,6 +281,8 @@ class Category(models.Model):
     )
     products = models.ManyToManyField(Product)
 
+    objects = CatalogQuerySet.as_manager()
+
     class Meta:
         ordering = ["name", "value"]
 
@@ -131,9 +309,59 @@ class Discount(models.Model):
 
     category = models.ManyToManyField(Category)
 
+    objects = CatalogQuerySet.as_manager()
+
     def within_range(self):
         return 0 <= self.percent <= 70
 
+    def is_active(self, date=None):
+        date = date or datetime.date.today()
+        return self.within_range() and self.start <= date <= self.end
+
+
+class EffectivePriceQuerySet(CacheTagQuerySet):
+    local_entries = False
+
+
+class EffectivePrice(models.Model):
+    """
+    Price of a product for customers of a discount group ("" for everyone)
+    with the best of its active discounts taken off. Maintained by
+    shop.pricing for every product and group.
+    """
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name="effective_prices",
+    )
+    group = models.CharField(max_length=50, blank=True)
+    price = models.DecimalField(max_digits=12, decimal_places=2)
+    discount = models.ForeignKey(
+        Discount,
+        null=True,
+        on_delete=models.SET_NULL,
+        related_name="+",
+    )
+    # When a discount of the product starts or ends, after which the price
+    # has to be resolved again.
+    valid_until = models.DateField(null=True, db_index=True)
+
+    objects = EffectivePriceQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["product", "group"],
+                name="unique_product_group",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["group", "price"], name="shop_price_group_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.price} for {self.product_id} in group {self.group!r}"
+
 
 class Cart(models.Model):
     session = models.ForeignKey(
@@ -148,19 +376,56 @@ class Cart(models.Model):
     )
     products = models.ManyToManyField(Product, through="Addition")
 
-    def amount(self):
-        total = 0
-        for p, qty in (
-                self.addition_set.filter(order_now=True)
-                        .values_list("product__price", "quantity")
-        ):
-            total += p * qty
-        return total
+    def amount(self, group=""):
+        """
+        Return the price of products to be ordered now for customers of
+        discount `group`.
+        """
+        return self.summary(group)["amount"]
+
+    def summary(self, group=""):
+        """
+        Return the number of products in the cart and amount() from the
+        cache. Entries are invalidated on writes to the cart's additions
+        and on changes to products and their effective prices.
+        """
+        return self.get_summary(self.pk, group)
+
+    @staticmethod
+    def get_summary(pk, group=""):
+        def compute():
+            additions = Addition.objects.filter(cart_id=pk)
+            summary = additions.aggregate(items=models.Count("pk"))
+            summary.update(
+                additions.filter(
+                    order_now=True,
+                    product__effective_prices__group=group,
+                ).aggregate(
+                    amount=models.Sum(
+                        models.F("quantity")
+                        * models.F("product__effective_prices__price"),
+                        default=0,
+                        output_field=models.DecimalField(
+                            max_digits=14, decimal_places=2
+                        ),
+                    ),
+                )
+            )
+            return summary
+
+        return cache.get_or_set_tagged(
+            f"shop:cart:{pk}:summary:{group}",
+            compute,
+            [Cart.cache_tag(pk), "product", "effectiveprice"],
+        )
+
+    @staticmethod
+    def cache_tag(pk):
+        return f"cart:{pk}"
 
     def __str__(self):
         if self.pk:
-            products = list(self.products.values_list("name", flat=True))
-            return f"{products}"
+            return f"Cart #{self.pk}"
         else:
             return "incomplete"
 
@@ -328,3 +593,94 @@ class Shipment(models.Model):
             return f"to {city}"
         except ValueError:
             return "unsaved"
+
+
+class CatalogChange(models.Model):
+    """
+    A record of a write to a Product, Category or Discount.
+    seq grows with every change and lets catalog mirrors ask for changes
+    made after the last one they have seen.
+    """
+
+    class Operation(models.TextChoices):
+        SAVE = "save"
+        DELETE = "delete"
+
+    seq = models.BigAutoField(primary_key=True)
+    model = models.CharField(max_length=20)
+    object_id = models.BigIntegerField()
+    operation = models.CharField(max_length=6, choices=Operation)
+    date_created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"#{self.seq} {self.operation} {self.model} {self.object_id}"
+
+
+class Warehouse(models.Model):
+    """
+    A location goods are stored at and shipped from.
+    """
+    name = models.CharField(max_length=75, unique=True)
+    address = models.CharField(max_length=300, blank=True)
+
+    def __str__(self):
+        return self.name
+
+
+class Stock(models.Model):
+    """
+    Available quantity of a product at a warehouse. Change it with
+    shop.services.move_stock() so that Product.quantity follows.
+    """
+    warehouse = models.ForeignKey(
+        Warehouse,
+        on_delete=models.PROTECT,
+        related_name="stocks",
+    )
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name="stocks",
+    )
+    quantity = models.DecimalField(default=0, max_digits=12, decimal_places=2)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["product", "warehouse"],
+                name="unique_product_warehouse",
+            ),
+            models.CheckConstraint(
+                check=models.Q(quantity__gte=0),
+                name="stock_quantity_not_negative",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} of {self.product_id} at {self.warehouse_id}"
+
+
+def reservation_expiry():
+    return timezone.now() + datetime.timedelta(
+        minutes=settings.STOCK_RESERVATION_MINUTES
+    )
+
+
+class Reservation(models.Model):
+    """
+    Stock of a product set aside for an order at the warehouse it will be
+    shipped from. The quantity is already subtracted from the stock and is
+    given back if the order isn't paid for before the reservation expires.
+    """
+    order = models.ForeignKey(
+        Order,
+        on_delete=models.CASCADE,
+        related_name="reservations",
+    )
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.PROTECT)
+    quantity = models.DecimalField(max_digits=12, decimal_places=2)
+    expires = models.DateTimeField(default=reservation_expiry, db_index=True)
+
+    def __str__(self):
+        return f"{self.quantity} of {self.product_id} for Order#{self.order_id}"
@@ -0,0 +1,227 @@
+"""
+Resolve what customers pay for products and keep it in EffectivePrice.
+
+A discount applies to a product it's set on (Product.discount) and to
+products of its categories. It applies to customers of its group, or to
+everyone if the group is empty, while it's active (Discount.is_active()).
+Discounts don't add up: the biggest one applicable wins.
+
+Rows are stored for every product and every group discounts are given to,
+plus "" for customers outside of them, so that catalog queries can join
+them instead of falling back to list prices. They are refreshed from
+signals for the products a change of products, categories or discounts
+affects, on bulk creation and updates of products, and by the
+refresh_prices command once a day for discounts that start or end.
+"""
+import datetime
+import decimal
+import itertools
+
+from django.apps import apps as global_apps
+from django.db import transaction
+
+from . import cache
+from .models import Category, Discount, EffectivePrice, Product
+
+CENT = decimal.Decimal("0.01")
+
+
+def discounted(price, percent):
+    return (price * (100 - percent) / 100).quantize(CENT, decimal.ROUND_HALF_UP)
+
+
+def resolve(price, discounts, group, date):
+    """
+    Return (effective price, discount) of a product with `price` linked
+    to `discounts` for customers of `group` on `date`.
+    """
+    applicable = [
+        d for d in discounts if d.group in ("", group) and d.is_active(date)
+    ]
+    if not applicable:
+        return price, None
+    best = max(applicable, key=lambda d: (d.percent, -d.pk))
+    return discounted(price, best.percent), best
+
+
+def valid_until(discounts, date):
+    """
+    Return the first day after `date` on which any of `discounts` starts or
+    ends, or None.
+    """
+    days = []
+    for discount in discounts:
+        if not discount.within_range():
+            continue
+        if discount.start > date:
+            days.append(discount.start)
+        elif discount.end >= date:
+            days.append(discount.end + datetime.timedelta(days=1))
+    return min(days, default=None)
+
+
+def refresh(product_ids=None, date=None, batch_size=1000, apps=global_apps):
+    """
+    Resolve effective prices of products with `product_ids`, or of all
+    products, and replace their rows. Return the number of rows written.
+    `apps` lets migrations pass their historical models.
+    """
+    Category_ = apps.get_model("shop", "Category")
+    Discount_ = apps.get_model("shop", "Discount")
+    EffectivePrice_ = apps.get_model("shop", "EffectivePrice")
+    Product_ = apps.get_model("shop", "Product")
+    date = date or datetime.date.today()
+    if product_ids is not None and not product_ids:
+        return 0
+    # Discounts are few, unlike products. Unsaved instances of the current
+    # model provide is_active() to historical rows too.
+    fields = ["pk", "percent", "start", "end", "group"]
+    discounts = {
+        values[0]: Discount(**dict(zip(fields, values)))
+        for values in Discount_.objects.values_list(*fields)
+    }
+    groups = sorted({""} | {d.group for d in discounts.values()})
+    category_discounts = {}
+    for category_id, discount_id in (
+        Discount_.category.through.objects.values_list(
+            "category_id", "discount_id"
+        )
+    ):
+        category_discounts.setdefault(category_id, []).append(
+            discounts[discount_id]
+        )
+    products = Product_.objects.order_by("pk")
+    links = Category_.products.through.objects.all()
+    if product_ids is not None:
+        products = products.filter(pk__in=product_ids)
+        links = links.filter(product_id__in=product_ids)
+    product_discounts = {}
+    for product_id, category_id in links.values_list("product_id", "category_id"):
+        product_discounts.setdefault(product_id, set()).update(
+            category_discounts.get(category_id, ())
+        )
+
+    def generate():
+        for pk, price, discount_id in products.values_list(
+            "pk", "price", "discount_id"
+        ).iterator():
+            linked = product_discounts.get(pk, set())
+            if discount_id:
+                linked.add(discounts[discount_id])
+            until = valid_until(linked, date)
+            for group in groups:
+                effective, discount = resolve(price, linked, group, date)
+                yield EffectivePrice_(
+                    product_id=pk,
+                    group=group,
+                    price=effective,
+                    discount_id=discount.pk if discount else None,
+                    valid_until=until,
+                )
+
+    count = 0
+    with transaction.atomic():
+        rows = EffectivePrice_.objects.all()
+        if product_ids is not None:
+            rows = rows.filter(product_id__in=product_ids)
+        rows.delete()
+        rows = generate()
+        while batch := list(itertools.islice(rows, batch_size)):
+            EffectivePrice_.objects.bulk_create(batch)
+            count += len(batch)
+    return count
+
+
+def refresh_expired(date=None):
+    """
+    Refresh prices of products one of whose discounts started or ended by
+    `date`.
+    """
+    date = date or datetime.date.today()
+    product_ids = set(
+        EffectivePrice.objects.filter(valid_until__lte=date)
+        .values_list("product_id", flat=True)
+    )
+    return refresh(product_ids, date)
+
+
+def discount_product_ids(discount):
+    """
+    Return pks of products `discount` is set on or applies to through its
+    categories.
+    """
+    return set(
+        Product.objects.filter(discount=discount).values_list("pk", flat=True)
+    ) | category_product_ids(discount.category.values_list("pk", flat=True))
+
+
+def category_product_ids(category_ids):
+    return set(
+        Category.products.through.objects.filter(category_id__in=category_ids)
+        .values_list("product_id", flat=True)
+    )
+
+
+def add_group(group, batch_size=1000):
+    """
+    Give every product a row of `group` unless the group has rows already,
+    i.e. when discounts are first given to it. Return the number of rows
+    written.
+    Rows are copies of those for everyone: until prices of products its
+    discounts apply to are refreshed, customers of the group pay what
+    everyone pays.
+    """
+    if not group or EffectivePrice.objects.filter(group=group).exists():
+        return 0
+    rows = (
+        EffectivePrice(
+            product_id=product_id,
+            group=group,
+            price=price,
+            discount_id=discount_id,
+            valid_until=until,
+        )
+        for product_id, price, discount_id, until in (
+            EffectivePrice.objects.filter(group="")
+            .values_list("product_id", "price", "discount_id", "valid_until")
+            .iterator(chunk_size=batch_size)
+        )
+    )
+    count = 0
+    with transaction.atomic():
+        while batch := list(itertools.islice(rows, batch_size)):
+            EffectivePrice.objects.bulk_create(batch)
+            count += len(batch)
+    return count
+
+
+def drop_unused_groups(*groups):
+    """
+    Delete rows of `groups` that discounts are no longer given to, so that
+    they don't come back to life should the group get discounts again.
+    """
+    unused = {group for group in groups if group} - set(
+        Discount.objects.values_list("group", flat=True)
+    )
+    if unused:
+        EffectivePrice.objects.filter(group__in=unused).delete()
+
+
+def customer_group(user):
+    """
+    Return the discount group whose prices `user` sees: the first in
+    alphabetical order of their auth groups discounts are given to, or "".
+    """
+    if not user.is_authenticated:
+        return ""
+    groups = {d.group for d in Discount.objects.all_cached()} - {""}
+    if not groups:
+        return ""
+    return cache.get_or_set_tagged(
+        f"shop:user:{user.pk}:price-group",
+        lambda: user.groups.filter(name__in=groups)
+        .order_by("name")
+        .values_list("name", flat=True)
+        .first() or "",
+        ["discount", "user-groups"],
+    )
@@ -0,0 +1,191 @@
+"""
+Guard query plans of critical queries against regressions.
+
+Queries are registered by name with @critical_query. check_plans() runs
+EXPLAIN (FORMAT JSON) for each of them and reports
+- sequential scans of tables with more than `large_table_rows` rows,
+  unless allowed for that query,
+- estimated costs more than `cost_ratio` times those in the baseline.
+
+Plans depend on data, so run it on a seeded and analyzed database (see
+the query_plans command). PostgreSQL only.
+"""
+import json
+from pathlib import Path
+
+from django.db import connection
+
+from .models import Addition, Cart, Category, OrderDetail, Product
+
+BASELINE_FILE = Path(__file__).resolve().parent / "query_plans.json"
+# Products seeded for the baseline, and by tests comparing plans with it.
+BASELINE_PRODUCTS = 12000
+
+registry = {}
+
+
+class CriticalQuery:
+    def __init__(self, name, get_queryset, allow_seq_scans=()):
+        self.name = name
+        self.get_queryset = get_queryset
+        # Tables a sequential scan of is expected, e.g. when every row is
+        # aggregated anyway.
+        self.allow_seq_scans = set(allow_seq_scans)
+
+
+def critical_query(name, allow_seq_scans=()):
+    def decorator(get_queryset):
+        registry[name] = CriticalQuery(name, get_queryset, allow_seq_scans)
+        return get_queryset
+    return decorator
+
+
+def explain(queryset):
+    """
+    Return the root node of the plan of `queryset`.
+    """
+    return json.loads(queryset.explain(format="json"))[0]["Plan"]
+
+
+def walk(plan):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from walk(child)
+
+
+def table_sizes(tables):
+    """
+    Return estimated row counts of `tables` from the planner statistics.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT relname, reltuples FROM pg_class WHERE relname = ANY(%s)",
+            [list(tables)],
+        )
+        return dict(cursor.fetchall())
+
+
+def summarize_plan(plan):
+    return {
+        "cost": plan["Total Cost"],
+        "seq_scans": sorted({
+            node["Relation Name"]
+            for node in walk(plan)
+            if node["Node Type"] == "Seq Scan"
+        }),
+    }
+
+
+def capture_plans(queries=None):
+    """
+    Return {name: {"cost": ..., "seq_scans": [...]}} for registered queries.
+    """
+    queries = queries or registry.values()
+    return {q.name: summarize_plan(explain(q.get_queryset())) for q in queries}
+
+
+def load_baseline(path=BASELINE_FILE):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_baseline(plans, path=BASELINE_FILE):
+    with open(path, "w") as f:
+        json.dump(plans, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def check_plans(baseline=None, cost_ratio=2.0, large_table_rows=10000,
+                queries=None):
+    """
+    Return a list of problems with the current plans of registered queries.
+    """
+    baseline = load_baseline() if baseline is None else baseline
+    queries = list(queries or registry.values())
+    plans = capture_plans(queries)
+    sizes = table_sizes({t for p in plans.values() for t in p["seq_scans"]})
+    problems = []
+    for query in queries:
+        plan = plans[query.name]
+        for table in plan["seq_scans"]:
+            if (
+                table not in query.allow_seq_scans
+                and sizes.get(table, 0) > large_table_rows
+            ):
+                problems.append(
+                    f"{query.name}: sequential scan on {table} "
+                    f"(~{int(sizes[table])} rows)"
+                )
+        old = baseline.get(query.name)
+        if old and plan["cost"] > old["cost"] * cost_ratio:
+            problems.append(
+                f"{query.name}: estimated cost {plan['cost']:.0f} is more "
+                f"than {cost_ratio} times the baseline {old['cost']:.0f}"
+            )
+    return problems
+
+
+def sample(model):
+    return model.objects.order_by("pk").first()
+
+
+@critical_query("catalog", allow_seq_scans=["shop_product", "shop_like"])
+def catalog_page():
+    # Every product's likes are counted to order the page.
+    return (
+        Product.objects.filter(in_production=True)
+        .with_like_count()
+        .order_by("-like_count", "pk")[:4]
+    )
+
+
+@critical_query("catalog-by-price")
+def catalog_by_price():
+    return (
+        Product.objects.filter(in_production=True)
+        .with_effective_price()
+        .order_by("effective_price", "pk")[:4]
+    )
+
+
+# A category holds about a tenth of all products, and hashing those against
+# all products is as cheap as looking each of them up by primary key.
+@critical_query("catalog-filter", allow_seq_scans=["shop_product"])
+def catalog_filter():
+    category = sample(Category)
+    return (
+        Product.objects.filter(in_production=True, category=category)
+        .with_effective_price()
+        .filter(effective_price__gte=10, effective_price__lte=500)
+        .order_by("name")[:4]
+    )
+
+
+@critical_query("product-detail")
+def product_detail():
+    return Product.objects.for_detail_page().filter(pk=sample(Product).pk)
+
+
+# Products sharing a category with the product are a sizeable fraction of
+# all, as above.
+@critical_query("related-products", allow_seq_scans=["shop_product"])
+def related_products():
+    product = sample(Product)
+    return Product.objects.filter(in_production=True).related_to(product)
+
+
+@critical_query("cart")
+def cart_items():
+    return Addition.objects.filter(cart=sample(Cart)).select_related("product")
+
+
+@critical_query("orders")
+def order_items():
+    detail = sample(OrderDetail)
+    user_id = detail.order.user_id if detail else None
+    return OrderDetail.objects.filter(order__user_id=user_id).select_related(
+        "product"
+    )
@@ -0,0 +1,450 @@
+"""
+Generate synthetic shop data quickly and reproducibly.
+
+Rows are inserted with bulk_create() in batches, or with COPY on
+PostgreSQL if asked to, so model save() methods and signals are skipped.
+Cache tags are still invalidated. The same seed always produces the same
+data.
+"""
+import datetime
+import decimal
+import itertools
+import random
+
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import connection, models, transaction
+
+from . import cache, pricing
+from .models import (
+    Addition,
+    Cart,
+    Category,
+    Discount,
+    Like,
+    Order,
+    OrderDetail,
+    Product,
+    Stock,
+    Warehouse,
+)
+
+CATEGORIES = {
+    "colour": ["white", "black", "grey", "beige", "brown", "green", "blue"],
+    "material": ["oak", "pine", "birch", "metal", "glass", "fabric"],
+    "type": ["table", "chair", "bed", "wardrobe", "shelf", "sofa", "desk"],
+    "size": ["S", "M", "L", "XL"],
+}
+UNIT_MEASURES = ["units", "sets", "m", "m2"]
+DISCOUNT_REASONS = ["Black Friday", "New Year", "Clearance", "Loyalty"]
+WAREHOUSES = ["North", "South", "East"]
+COMPONENTS = ["board", "screw", "hinge", "handle", "glue", "varnish", "foam"]
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+class Seeder:
+    """
+    Creates related rows step by step and remembers the primary keys
+    of what it created for the following steps.
+    """
+
+    def __init__(self, seed=0, batch_size=5000, use_copy=False, log=None):
+        self.random = random.Random(seed)
+        self.batch_size = batch_size
+        self.use_copy = use_copy and connection.vendor == "postgresql"
+        self.log = log or (lambda message: None)
+        self.products = []  # (pk, price, min_order_quantity)
+        self.category_ids = {}
+        self.discount_ids = []
+        self.warehouse_ids = []
+        self.user_ids = []
+        self.counts = {}
+
+    def insert(self, model, objects, fetch_pks=True):
+        """
+        Insert objects in batches and return primary keys of the new rows
+        unless `fetch_pks` is false.
+        """
+        if fetch_pks:
+            last = model.objects.order_by("-pk").values_list("pk", flat=True).first()
+        count = 0
+        for batch in batched(objects, self.batch_size):
+            with transaction.atomic():
+                if self.use_copy:
+                    self.copy(model, batch)
+                else:
+                    model.objects.bulk_create(batch)
+            count += len(batch)
+        if self.use_copy:
+            cache.invalidate(model._meta.model_name)
+        name = model._meta.label
+        self.counts[name] = self.counts.get(name, 0) + count
+        self.log(f"{name}: {count}")
+        if not fetch_pks:
+            return None
+        # Some backends don't return primary keys from bulk_create().
+        return list(
+            model.objects.filter(pk__gt=last or 0)
+            .order_by("pk")
+            .values_list("pk", flat=True)
+        )
+
+    def copy(self, model, objects):
+        """
+        Insert objects with COPY, which is several times faster than
+        INSERT for large batches. PostgreSQL only.
+        """
+        fields = [
+            f for f in model._meta.concrete_fields
+            if not isinstance(f, models.AutoField)
+        ]
+        quote = connection.ops.quote_name
+        table = quote(model._meta.db_table)
+        columns = ", ".join(quote(f.column) for f in fields)
+        with connection.cursor() as cursor:
+            with cursor.copy(f"COPY {table} ({columns}) FROM STDIN") as copy:
+                for obj in objects:
+                    copy.write_row([
+                        f.get_db_prep_save(f.pre_save(obj, True), connection)
+                        for f in fields
+                    ])
+
+    def money(self, lo, hi):
+        return decimal.Decimal(self.random.randint(lo * 100, hi * 100)) / 100
+
+    def seed_catalog(self, products, users=None, likes_per_user=20,
+                     cart_share=0.5, cart_size=3):
+        """
+        Create categories, `products` products with one to three categories
+        and stock in warehouses each, users (a tenth of products by default)
+        with likes and carts.
+        """
+        self.seed_categories()
+        self.seed_discounts()
+        self.seed_warehouses()
+        self.seed_products(products)
+        self.seed_users(users if users is not None else max(10, products // 10))
+        self.seed_likes(likes_per_user)
+        self.seed_carts(cart_share, cart_size)
+        return self.counts
+
+    def seed_categories(self):
+        objects = [
+            Category(name=name, value=value)
+            for name, values in CATEGORIES.items()
+            for value in values
+        ]
+        pks = self.insert(Category, objects)
+        for obj, pk in zip(objects, pks):
+            self.category_ids.setdefault(obj.name, []).append(pk)
+
+    def seed_discounts(self):
+        today = datetime.date.today()
+        objects = []
+        for reason in DISCOUNT_REASONS:
+            start = today - datetime.timedelta(days=self.random.randint(0, 30))
+            objects.append(Discount(
+                reason=reason,
+                percent=self.random.choice([5, 10, 15, 20, 30]),
+                seasonal=self.random.random() < 0.5,
+                start=start,
+                end=start + datetime.timedelta(days=self.random.randint(7, 60)),
+                group=self.random.choice(["", "", "wholesale"]),
+            ))
+        self.discount_ids = self.insert(Discount, objects)
+        through = Discount.category.through
+        category_ids = [pk for pks in self.category_ids.values() for pk in pks]
+        self.insert(
+            through,
+            (
+                through(discount_id=discount_id, category_id=category_id)
+                for discount_id in self.discount_ids
+                for category_id in self.random.sample(category_ids, 2)
+            ),
+            fetch_pks=False,
+        )
+
+    def seed_warehouses(self):
+        # Names are unique, so only create those missing on a second run.
+        existing = set(Warehouse.objects.values_list("name", flat=True))
+        self.insert(
+            Warehouse,
+            [
+                Warehouse(name=name, address=f"{i + 1} Warehouse street")
+                for i, name in enumerate(WAREHOUSES)
+                if name not in existing
+            ],
+            fetch_pks=False,
+        )
+        self.warehouse_ids = list(
+            Warehouse.objects.order_by("pk").values_list("pk", flat=True)
+        )
+
+    def seed_products(self, n):
+        today = datetime.date.today()
+        rows = []
+        stocks = []
+
+        def generate():
+            for i in range(n):
+                price = self.money(5, 2000)
+                min_order_quantity = decimal.Decimal(
+                    self.random.choice([1, 1, 1, 2, 5, 10])
+                )
+                rows.append((price, min_order_quantity))
+                # Product.quantity is the total of its stocks.
+                stock = {
+                    warehouse_id: self.random.randint(0, 100)
+                    for warehouse_id in self.random.sample(
+                        self.warehouse_ids,
+                        self.random.randint(0, len(self.warehouse_ids)),
+                    )
+                }
+                stocks.append(stock)
+                yield Product(
+                    name=f"Product {i}",
+                    description=f"Synthetic product number {i}.",
+                    price=price,
+                    unit_measure=self.random.choice(UNIT_MEASURES),
+                    quantity=sum(stock.values()),
+                    min_order_quantity=min_order_quantity,
+                    date_created=today - datetime.timedelta(
+                        days=self.random.randint(0, 1000)
+                    ),
+                    in_production=self.random.random() < 0.95,
+                    discount_id=(
+                        self.random.choice(self.discount_ids)
+                        if self.discount_ids and self.random.random() < 0.1
+                        else None
+                    ),
+                )
+
+        pks = self.insert(Product, generate())
+        self.products = [(pk, *row) for pk, row in zip(pks, rows)]
+        self.insert(
+            Stock,
+            (
+                Stock(product_id=pk, warehouse_id=warehouse_id, quantity=qty)
+                for pk, stock in zip(pks, stocks)
+                for warehouse_id, qty in stock.items()
+            ),
+            fetch_pks=False,
+        )
+        through = Category.products.through
+
+        def categorize():
+            names = list(self.category_ids)
+            for pk, *_ in self.products:
+                for name in self.random.sample(names, self.random.randint(1, 3)):
+                    yield through(
+                        product_id=pk,
+                        category_id=self.random.choice(self.category_ids[name]),
+                    )
+
+        self.insert(through, categorize(), fetch_pks=False)
+        # Categories were linked in bulk, which sends no signals to resolve
+        # prices from, and COPY skips Product.objects.bulk_create().
+        count = pricing.refresh(batch_size=self.batch_size)
+        self.counts["shop.EffectivePrice"] = count
+        self.log(f"shop.EffectivePrice: {count}")
+
+    def seed_users(self, n):
+        User = get_user_model()
+        # Hashing a password per user would take most of the time.
+        password = make_password(None)
+        start = User.objects.count()
+        self.user_ids = self.insert(
+            User,
+            (
+                User(
+                    username=f"seed{start + i}",
+                    email=f"seed{start + i}@example.com",
+                    password=password,
+                )
+                for i in range(n)
+            ),
+        )
+
+    def seed_likes(self, per_user):
+        per_user = min(per_user, len(self.products))
+
+        def generate():
+            for user_id in self.user_ids:
+                for pk, *_ in self.random.sample(self.products, per_user):
+                    yield Like(
+                        user_id=user_id,
+                        product_id=pk,
+                        liked=self.random.random() < 0.8,
+                    )
+
+        self.insert(Like, generate(), fetch_pks=False)
+
+    def seed_carts(self, share, size):
+        owners = [u for u in self.user_ids if self.random.random() < share]
+        cart_ids = self.insert(Cart, (Cart(user_id=u) for u in owners))
+        size = min(size, len(self.products))
+
+        def generate():
+            for cart_id in cart_ids:
+                for pk, price, min_order_quantity in self.random.sample(
+                    self.products, self.random.randint(1, size)
+                ):
+                    yield Addition(
+                        cart_id=cart_id,
+                        product_id=pk,
+                        quantity=min_order_quantity * self.random.randint(1, 3),
+                    )
+
+        self.insert(Addition, generate(), fetch_pks=False)
+
+    def seed_orders(self, share=0.3, size=3):
+        """
+        Create an order of one to `size` products for a `share` of users.
+        """
+        customers = [u for u in self.user_ids if self.random.random() < share]
+        order_ids = self.insert(
+            Order,
+            (
+                Order(
+                    user_id=user_id,
+                    purchaser=f"Customer {user_id}",
+                    purchaser_email=f"customer{user_id}@example.com",
+                    receiver=f"Customer {user_id}",
+                    receiver_phone=f"+7900{user_id:07d}",
+                    as_individual=self.random.random() < 0.7,
+                    confirmed=self.random.random() < 0.8,
+                )
+                for user_id in customers
+            ),
+        )
+        size = min(size, len(self.products))
+
+        def generate():
+            for order_id in order_ids:
+                for pk, price, min_order_quantity in self.random.sample(
+                    self.products, self.random.randint(1, size)
+                ):
+                    yield OrderDetail(
+                        order_id=order_id,
+                        product_id=pk,
+                        quantity=min_order_quantity * self.random.randint(1, 3),
+                    )
+
+        self.insert(OrderDetail, generate(), fetch_pks=False)
+
+    def seed_production(self, productions=None):
+        """
+        Create components, suppliers, supplies and production processes
+        making the seeded products. Does nothing unless the production app
+        is installed.
+        """
+        if not apps.is_installed("production"):
+            return
+        from production.models import (
+            Component,
+            MaterialsUsed,
+            Production,
+            ProductsMade,
+            Supplier,
+            Supplies,
+        )
+
+        component_ids = self.insert(
+            Component,
+            [
+                Component(name=f"{name} {i}", unit_measure="units")
+                for name in COMPONENTS
+                for i in range(max(1, len(self.products) // 1000))
+            ],
+        )
+        through = Component.products.through
+        self.insert(
+            through,
+            (
+                through(component_id=component_id, product_id=pk)
+                for pk, *_ in self.products
+                for component_id in self.random.sample(
+                    component_ids, min(3, len(component_ids))
+                )
+            ),
+            fetch_pks=False,
+        )
+        supplier_ids = self.insert(
+            Supplier,
+            [
+                Supplier(
+                    name=f"Supplier {i}",
+                    email=f"supplier{i}@example.com",
+                    address=f"{i} Industrial street",
+                    owned=i == 0,
+                )
+                for i in range(10)
+            ],
+        )
+        through = Supplier.components.through
+        self.insert(
+            through,
+            (
+                through(supplier_id=supplier_id, component_id=component_id)
+                for component_id in component_ids
+                for supplier_id in self.random.sample(supplier_ids, 2)
+            ),
+            fetch_pks=False,
+        )
+        supply_ids = self.insert(
+            Supplies,
+            (
+                Supplies(
+                    component_id=component_id,
+                    quantity=self.random.randint(10, 1000),
+                    price=self.money(1, 100),
+                    source=Supplies.SOURCES.PURCHASED,
+                    supplier_id=self.random.choice(supplier_ids),
+                )
+                for component_id in component_ids
+                for _ in range(5)
+            ),
+        )
+        if productions is None:
+            productions = max(1, len(self.products) // 10)
+        production_ids = self.insert(
+            Production,
+            (Production() for _ in range(productions)),
+        )
+
+        def made():
+            for production_id in production_ids:
+                for pk, *_ in self.random.sample(
+                    self.products, min(3, len(self.products))
+                ):
+                    plan_qty = self.random.randint(10, 100)
+                    yield ProductsMade(
+                        production_id=production_id,
+                        product_id=pk,
+                        plan_qty=plan_qty,
+                        actual_qty=plan_qty,
+                        complete=self.random.random() < 0.8,
+                    )
+
+        self.insert(ProductsMade, made(), fetch_pks=False)
+        self.insert(
+            MaterialsUsed,
+            (
+                MaterialsUsed(
+                    production_id=production_id,
+                    supply_id=supply_id,
+                    quantity=self.random.randint(1, 10),
+                )
+                for production_id in production_ids
+                for supply_id in self.random.sample(
+                    supply_ids, min(3, len(supply_ids))
+                )
+            ),
+            fetch_pks=False,
+        )
@@ -0,0 +1,309 @@
+"""
+Operations on orders that span several models. Each runs in a single
+transaction and either completes or leaves the database untouched.
+"""
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Case, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+from . import cache
+from .models import (
+    Addition,
+    Cart,
+    Order,
+    OrderDetail,
+    Product,
+    Reservation,
+    Stock,
+)
+
+
+def validate_quantity(product, quantity):
+    """
+    Return a ValidationError if `quantity` of `product` can't be ordered.
+    """
+    params = {
+        "product": product.name,
+        "minimum": product.min_order_quantity,
+        "units": product.unit_measure,
+    }
+    if not product.in_production:
+        return ValidationError(
+            _("%(product)s is no longer available."),
+            code="not_in_production",
+            params=params,
+        )
+    if quantity <= 0:
+        return ValidationError(
+            _("Quantity of %(product)s must be positive."),
+            code="non_positive",
+            params=params,
+        )
+    if quantity < product.min_order_quantity:
+        return ValidationError(
+            _("Can't order less than %(minimum)s %(units)s of %(product)s."),
+            code="too_low",
+            params=params,
+        )
+    return None
+
+
+def per_row(quantities, *fields):
+    """
+    Return a CASE expression picking a quantity from {key: qty} for each
+    row, keys being values of `fields`, or tuples of them if several.
+    """
+    whens = []
+    for key, qty in quantities.items():
+        values = key if len(fields) > 1 else (key,)
+        whens.append(When(Q(**dict(zip(fields, values))), then=Value(qty)))
+    return Case(
+        *whens,
+        default=Value(0),
+        output_field=Product._meta.get_field("quantity"),
+    )
+
+
+def lock_products(product_ids):
+    """
+    Lock rows of products in primary key order, so that transactions
+    locking several of the same products can't deadlock, and return
+    {pk: available quantity}.
+
+    Stock of a product only changes with its row locked, so the lock
+    covers its Stock rows too.
+    """
+    return dict(
+        Product.objects.select_for_update()
+        .filter(pk__in=product_ids)
+        .order_by("pk")
+        .values_list("pk", "quantity")
+    )
+
+
+def out_of_stock(available, product_id):
+    return ValidationError(
+        _("Only %(available)s left of product #%(product)s."),
+        code="out_of_stock",
+        params={"available": available, "product": product_id},
+    )
+
+
+def move_stock(warehouse, product, quantity):
+    """
+    Add `quantity` of `product` to the stock of `warehouse`, or take it
+    away if negative, e.g. on delivery from production or on shipment
+    of goods not reserved through an order. Raise ValidationError if the
+    warehouse doesn't have as much.
+    """
+    with transaction.atomic():
+        lock_products([product.pk])
+        stock, _created = Stock.objects.get_or_create(
+            warehouse=warehouse, product=product
+        )
+        updated = (
+            Stock.objects.filter(pk=stock.pk, quantity__gte=-quantity)
+            .update(quantity=F("quantity") + quantity)
+        )
+        if not updated:
+            raise out_of_stock(stock.quantity, product.pk)
+        Product.objects.filter(pk=product.pk).update(
+            quantity=F("quantity") + quantity
+        )
+
+
+def sync_quantities(product_ids):
+    """
+    Set the available quantity of products to the total of their stock,
+    e.g. after stock was edited by hand in the admin.
+    """
+    with transaction.atomic():
+        lock_products(product_ids)
+        totals = (
+            Stock.objects.filter(product=OuterRef("pk"))
+            .values("product")
+            .annotate(total=Sum("quantity"))
+            .values("total")
+        )
+        Product.objects.filter(pk__in=product_ids).update(
+            quantity=Coalesce(
+                Subquery(totals),
+                Value(0),
+                output_field=Product._meta.get_field("quantity"),
+            )
+        )
+
+
+def allocate(quantities):
+    """
+    Split {product pk: quantity} between warehouses, taking from those
+    with the most stock first to ship from as few as possible.
+    Return {(product pk, warehouse pk): quantity} and a list of errors
+    for products without enough stock. Call with the products locked.
+    """
+    stocks = (
+        Stock.objects.filter(product__in=quantities, quantity__gt=0)
+        .order_by("product", "-quantity", "pk")
+        .values_list("product_id", "warehouse_id", "quantity")
+    )
+    remaining = dict(quantities)
+    allocation = {}
+    for product_id, warehouse_id, available in stocks:
+        taken = min(remaining[product_id], available)
+        if taken:
+            allocation[product_id, warehouse_id] = taken
+            remaining[product_id] -= taken
+    errors = [
+        out_of_stock(quantities[pk] - left, pk)
+        for pk, left in remaining.items()
+        if left
+    ]
+    return allocation, errors
+
+
+def reserve(order, quantities):
+    """
+    Subtract {product pk: quantity} from stock and record reservations for
+    `order` at the warehouses the goods will be shipped from. Call in a
+    transaction. Raise ValidationError if any product doesn't have enough
+    stock.
+    """
+    available = lock_products(quantities)
+    short = [pk for pk, qty in quantities.items() if available.get(pk, 0) < qty]
+    if short:
+        raise ValidationError([
+            out_of_stock(available.get(pk, 0), pk) for pk in short
+        ])
+    allocation, errors = allocate(quantities)
+    if errors:
+        raise ValidationError(errors)
+    # Conditional on stock as well in case the database ignores FOR UPDATE.
+    rows = Q()
+    for product_id, warehouse_id in allocation:
+        rows |= Q(product_id=product_id, warehouse_id=warehouse_id)
+    taken = per_row(allocation, "product_id", "warehouse_id")
+    stocks_updated = (
+        Stock.objects.filter(rows, quantity__gte=taken)
+        .update(quantity=F("quantity") - taken)
+    )
+    wanted = per_row(quantities, "pk")
+    products_updated = (
+        Product.objects.filter(pk__in=quantities)
+        .filter(quantity__gte=wanted)
+        .update(quantity=F("quantity") - wanted)
+    )
+    if (stocks_updated, products_updated) != (len(allocation), len(quantities)):
+        raise ValidationError(
+            _("Stock changed while ordering. Try again."), code="out_of_stock"
+        )
+    Reservation.objects.bulk_create([
+        Reservation(
+            order=order,
+            product_id=product_id,
+            warehouse_id=warehouse_id,
+            quantity=qty,
+        )
+        for (product_id, warehouse_id), qty in allocation.items()
+    ])
+
+
+def release_reservations(now=None):
+    """
+    Drop reservations of paid orders, whose stock is gone for good, and
+    give back stock of cancelled orders and of expired reservations of
+    unpaid ones.
+    Return the number of reservations released back to stock.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        Reservation.objects.filter(order__purchase__payment_received=True).delete()
+        # Locked rows belong to orders being paid or released right now.
+        expired = list(
+            Reservation.objects.select_for_update(skip_locked=True, of=("self",))
+            .filter(Q(expires__lte=now) | Q(order__purchase__cancelled=True))
+            .values_list("pk", "product_id", "warehouse_id", "quantity")
+        )
+        if not expired:
+            return 0
+        quantities = {}
+        stocks = {}
+        for _pk, product_id, warehouse_id, qty in expired:
+            quantities[product_id] = quantities.get(product_id, 0) + qty
+            key = (product_id, warehouse_id)
+            stocks[key] = stocks.get(key, 0) + qty
+        lock_products(quantities)
+        returned = per_row(stocks, "product_id", "warehouse_id")
+        Stock.objects.filter(product__in=quantities).update(
+            quantity=F("quantity") + returned
+        )
+        returned = per_row(quantities, "pk")
+        Product.objects.filter(pk__in=quantities).update(
+            quantity=F("quantity") + returned
+        )
+        Reservation.objects.filter(pk__in=[pk for pk, *_ in expired]).delete()
+    return len(expired)
+
+
+def checkout(cart, order=None):
+    """
+    Order the additions of `cart` marked order_now, reserve their stock
+    and remove them from the cart. `order` is an unsaved Order to fill in,
+    by default one for the cart's user.
+
+    Takes ten queries however many products are ordered: reading and
+    locking the additions with their products, locking the products,
+    inserting the order, inserting its details, reading stock of
+    warehouses, updating it, reading the ids of products to record their
+    changes and updating their totals, inserting reservations and deleting
+    the additions. Raise ValidationError with
+    all problems found, in which case nothing is saved.
+    """
+    if order is None:
+        order = Order(user_id=cart.user_id)
+    with transaction.atomic():
+        # Lock the additions so that a concurrent checkout of the same cart
+        # waits and then finds nothing left to order.
+        additions = list(
+            Addition.objects.select_for_update(of=("self",))
+            .filter(cart=cart, order_now=True)
+            .select_related("product")
+            .order_by("pk")
+        )
+        if not additions:
+            raise ValidationError(
+                _("There is nothing to order in the cart."),
+                code="empty",
+            )
+        errors = [
+            error
+            for a in additions
+            if (error := validate_quantity(a.product, a.quantity))
+        ]
+        if errors:
+            raise ValidationError(errors)
+        order.save()
+        OrderDetail.objects.bulk_create([
+            OrderDetail(order=order, product=a.product, quantity=a.quantity)
+            for a in additions
+        ])
+        reserve(order, {a.product_id: a.quantity for a in additions})
+        Addition.objects.filter(pk__in=[a.pk for a in additions]).delete()
+        cache.invalidate(Cart.cache_tag(cart.pk), local_entries=False)
+    return order
+
+
+def order_product(order, product, quantity):
+    """
+    Save the unsaved `order` for `quantity` of a single `product`.
+    """
+    error = validate_quantity(product, quantity)
+    if error:
+        raise error
+    with transaction.atomic():
+        order.save()
+        OrderDetail.objects.create(order=order, product=product, quantity=quantity)
+        reserve(order, {product.pk: quantity})
+    return order
@@ -0,0 +1,228 @@
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import receiver
+
+from . import cache, pricing
+from .models import (
+    Addition,
+    Cart,
+    CatalogChange,
+    Category,
+    Discount,
+    Like,
+    Product,
+)
+
+CATALOG_MODELS = (Product, Category, Discount)
+# Key of the PostgreSQL advisory lock writers of catalog changes take.
+CATALOG_CHANGES_LOCK = 7_401_001
+CACHE_TAGGED_MODELS = (Product, Category, Discount, Like)
+# Models entries of the local cache are built from.
+LOCAL_CACHED_MODELS = (Product, Category, Discount)
+
+
+def record_changes(model, object_ids, operation=CatalogChange.Operation.SAVE):
+    changes = [
+        CatalogChange(
+            model=model._meta.model_name,
+            object_id=pk,
+            operation=operation,
+        )
+        for pk in object_ids
+    ]
+    if changes:
+        transaction.on_commit(lambda: save_changes(changes))
+
+
+def save_changes(changes):
+    """
+    Save changes of a committed transaction. Sequence numbers are taken
+    here rather than during the transaction, and by one writer at a time,
+    so that they follow the order in which changes become visible and
+    mirrors reading past a seq never miss a lower one.
+    """
+    with transaction.atomic():
+        if connection.vendor == "postgresql":
+            # Released when the transaction ends. SQLite serializes writes
+            # anyway.
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT pg_advisory_xact_lock(%s)", [CATALOG_CHANGES_LOCK]
+                )
+        CatalogChange.objects.bulk_create(changes)
+
+
+def record_catalog_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        record_changes(sender, [instance.pk])
+
+
+def record_catalog_delete(sender, instance, **kwargs):
+    record_changes(sender, [instance.pk], CatalogChange.Operation.DELETE)
+
+
+@receiver(pre_delete, sender=Category)
+def record_category_delete(sender, instance, **kwargs):
+    # Deleting a category removes it from its products without sending
+    # m2m_changed.
+    record_changes(Product, instance.products.values_list("pk", flat=True))
+
+
+@receiver(pre_delete, sender=Discount)
+def record_discount_delete(sender, instance, **kwargs):
+    # Product.discount is set to null with an UPDATE that sends no signals.
+    record_changes(Product, instance.product_set.values_list("pk", flat=True))
+    cache.invalidate("product")
+
+
+@receiver(m2m_changed, sender=Category.products.through)
+def record_category_products_change(sender, instance, action, reverse,
+                                    model, pk_set, **kwargs):
+    # Product categories are part of product data for mirrors.
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+    if reverse:
+        # instance is a Product.
+        record_changes(Product, [instance.pk])
+    elif action == "pre_clear":
+        # pk_set is None when clearing, so look up products beforehand.
+        record_changes(
+            Product,
+            instance.products.values_list("pk", flat=True),
+        )
+    elif pk_set:
+        record_changes(Product, pk_set)
+
+
+def invalidate_cache_tags(sender, **kwargs):
+    cache.invalidate(
+        sender._meta.model_name,
+        local_entries=sender in LOCAL_CACHED_MODELS,
+    )
+
+
+@receiver(post_save, sender=Addition)
+def invalidate_cart_summary(sender, instance, raw=False, **kwargs):
+    # Deletes of additions go through services.checkout(), which
+    # invalidates the summary itself. A post_delete receiver would make
+    # Django fetch additions before deleting them.
+    if not raw:
+        cache.invalidate(Cart.cache_tag(instance.cart_id), local_entries=False)
+
+
+@receiver(m2m_changed, sender=Category.products.through)
+@receiver(m2m_changed, sender=Discount.category.through)
+def invalidate_m2m_cache_tags(sender, instance, action, model, **kwargs):
+    if action.startswith("post_"):
+        cache.invalidate(
+            instance._meta.model_name,
+            model._meta.model_name,
+        )
+
+
+def refresh_product_prices(sender, instance, raw=False, **kwargs):
+    if not raw:
+        pricing.refresh([instance.pk])
+
+
+@receiver(pre_save, sender=Discount)
+def remember_discount_group(sender, instance, raw=False, **kwargs):
+    if not raw and instance.pk is not None:
+        instance._old_group = (
+            Discount.objects.filter(pk=instance.pk)
+            .values_list("group", flat=True)
+            .first()
+        )
+
+
+@receiver(post_save, sender=Discount)
+def refresh_discount_prices(sender, instance, raw=False, **kwargs):
+    if not raw:
+        pricing.add_group(instance.group)
+        pricing.refresh(pricing.discount_product_ids(instance))
+        pricing.drop_unused_groups(instance.__dict__.pop("_old_group", None))
+
+
+@receiver(pre_delete, sender=Discount)
+def remember_discount_products(sender, instance, **kwargs):
+    # Products lose the discount before post_delete.
+    instance._product_ids = pricing.discount_product_ids(instance)
+
+
+@receiver(post_delete, sender=Discount)
+def refresh_deleted_discount_prices(sender, instance, **kwargs):
+    pricing.refresh(instance.__dict__.pop("_product_ids", []))
+    pricing.drop_unused_groups(instance.group)
+
+
+@receiver(m2m_changed, sender=Discount.category.through)
+def refresh_discount_category_prices(sender, instance, action, reverse,
+                                     pk_set, **kwargs):
+    if reverse:
+        # instance is a Category.
+        category_ids = [instance.pk]
+    elif action == "pre_clear":
+        instance._cleared_category_ids = list(
+            instance.category.values_list("pk", flat=True)
+        )
+        return
+    elif action == "post_clear":
+        category_ids = instance.__dict__.pop("_cleared_category_ids", [])
+    else:
+        category_ids = pk_set
+    if action.startswith("post_"):
+        pricing.refresh(pricing.category_product_ids(category_ids))
+
+
+@receiver(m2m_changed, sender=Category.products.through)
+def refresh_category_product_prices(sender, instance, action, reverse,
+                                    pk_set, **kwargs):
+    if reverse:
+        product_ids = [instance.pk]
+    elif action == "pre_clear":
+        instance._cleared_product_ids = list(
+            instance.products.values_list("pk", flat=True)
+        )
+        return
+    elif action == "post_clear":
+        product_ids = instance.__dict__.pop("_cleared_product_ids", [])
+    else:
+        product_ids = pk_set
+    if action.startswith("post_"):
+        pricing.refresh(product_ids)
+
+
+@receiver(pre_delete, sender=Category)
+def remember_category_products(sender, instance, **kwargs):
+    instance._deleted_product_ids = list(
+        instance.products.values_list("pk", flat=True)
+    )
+
+
+@receiver(post_delete, sender=Category)
+def refresh_deleted_category_prices(sender, instance, **kwargs):
+    pricing.refresh(instance.__dict__.pop("_deleted_product_ids", []))
+
+
+@receiver(m2m_changed, sender=get_user_model().groups.through)
+def invalidate_price_groups(sender, action, **kwargs):
+    if action.startswith("post_"):
+        cache.invalidate("user-groups", local_entries=False)
+
+
+# Connect to the models concerned only. A delete signal receiver for all
+# senders makes Django fetch rows of every model before deleting them.
+for model in CATALOG_MODELS:
+    post_save.connect(record_catalog_save, sender=model)
+    post_delete.connect(record_catalog_delete, sender=model)
+for model in CACHE_TAGGED_MODELS:
+    post_save.connect(invalidate_cache_tags, sender=model)
+    post_delete.connect(invalidate_cache_tags, sender=model)
+post_save.connect(refresh_product_prices, sender=Product)
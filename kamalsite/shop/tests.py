@@ -1,3 +1,1350 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import decimal
+import io
+import random
+import tempfile
+import textwrap
+import threading
+import time
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.core.cache import cache as django_cache
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import DatabaseError, connection, connections, transaction
+from django.db.models import F, Sum
+from django.db.models.functions import Coalesce
+from django.http import HttpResponse
+from django.test import (
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import (
+    Addition,
+    Cart,
+    Category,
+    Discount,
+    EffectivePrice,
+    Like,
+    Order,
+    OrderDetail,
+    Product,
+    Purchase,
+    Reservation,
+    Stock,
+    Warehouse,
+)
+from diagnostics.nplusone import assert_no_n_plus_one
+from kamalsite.routers import (
+    PIN_COOKIE,
+    PrimaryPinningMiddleware,
+    PrimaryReplicaRouter,
+    _wrote,
+)
+from kamalsite.warmup import measure_startup
+
+from . import cache as tag_cache
+from . import checks
+from . import pricing
+from . import queryplans
+from . import services
+from .benchmark import get_scenarios, run_scenarios, sample_product_ids
+from .forms import get_price_extremes
+from .loadtest import LoadData, filter_catalog, parse_mix, run_mix
+from .seeding import Seeder
+from .views import CatalogView
+
+
+def create_product(name, price=100, quantity=10, warehouse=None, **kwargs):
+    kwargs.setdefault("description", f"{name} description")
+    kwargs.setdefault("min_order_quantity", 1)
+    product = Product(name=name, price=price, **kwargs)
+    product.save()
+    if quantity:
+        warehouse = warehouse or Warehouse.objects.get_or_create(name="Main")[0]
+        services.move_stock(warehouse, product, quantity)
+        product.quantity = quantity
+    return product
+
+
+def create_users(n):
+    User = get_user_model()
+    return [
+        User.objects.create(username=f"user{i}", email=f"user{i}@example.com")
+        for i in range(n)
+    ]
+
+
+class ProductDetailViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.discount = Discount.objects.create(
+            reason="sale",
+            percent=10,
+            group="",
+            start=datetime.date.today() - datetime.timedelta(days=1),
+        )
+        cls.product = create_product("Chair", discount=cls.discount)
+        colours = [
+            Category.objects.create(name="colour", value=value)
+            for value in ("red", "green", "blue")
+        ]
+        for category in colours:
+            category.products.add(cls.product)
+        for i in range(6):
+            related = create_product(f"Related {i}")
+            colours[i % 3].products.add(related)
+        for user in create_users(3):
+            Like.objects.create(user=user, product=cls.product, liked=True)
+
+    def test_constant_number_of_queries(self):
+        url = reverse("shop:product-detail", args=[self.product.pk])
+        # Discounts and profiling switches are looked up in caches.
+        django_cache.clear()
+        tag_cache.local.clear()
+        self.client.get(url)
+        # product with price and likes, categories, related products.
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        context = response.context
+        self.assertEqual(context["product"].like_count, 3)
+        self.assertEqual(len(context["product"].categories), 3)
+        self.assertEqual(context["discount"], self.discount)
+        self.assertEqual(len(context["related_products"]), 4)
+        self.assertNotIn(self.product, context["related_products"])
+
+    def test_inactive_discount_is_not_shown(self):
+        self.discount.end = datetime.date.today() - datetime.timedelta(days=1)
+        self.discount.save()
+        url = reverse("shop:product-detail", args=[self.product.pk])
+        response = self.client.get(url)
+        self.assertIsNone(response.context["discount"])
+
+
+class ProductCardActionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = create_product("Table", min_order_quantity=2)
+        cls.user = create_users(1)[0]
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_like_returns_json_when_asked(self):
+        url = reverse("shop:product-card-like", args=[self.product.pk])
+        data = {"action": "like"}
+        response = self.client.post(url, data, HTTP_ACCEPT="application/json")
+        self.assertEqual(
+            response.json(),
+            {"product": self.product.pk, "liked": True, "likes": 1},
+        )
+        response = self.client.post(
+            url,
+            data,
+            HTTP_X_REQUESTED_WITH="XMLHttpRequest",
+        )
+        self.assertEqual(response.json()["likes"], 0)
+
+    def test_like_redirects_without_js(self):
+        url = reverse("shop:product-card-like", args=[self.product.pk])
+        response = self.client.post(url, {"action": "like"})
+        self.assertRedirects(
+            response,
+            reverse("shop:catalog", kwargs={"page": 1}),
+            fetch_redirect_response=False,
+        )
+
+    def test_add_returns_json_when_asked(self):
+        url = reverse("shop:product-card-add", args=[self.product.pk])
+        response = self.client.post(
+            url,
+            {"action": "addition", "product": self.product.pk},
+            HTTP_ACCEPT="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["quantity"], "2.00")
+        addition = Addition.objects.get(product=self.product)
+        self.assertEqual(addition.cart.user, self.user)
+
+    def test_add_looks_products_up_in_cache(self):
+        django_cache.clear()
+        url = reverse("shop:product-card-add", args=[self.product.pk])
+        data = {"action": "addition", "product": self.product.pk}
+        self.client.post(url, data)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(url, data)
+        self.assertFalse(
+            [q for q in queries if 'FROM "shop_product"' in q["sql"]]
+        )
+        response = self.client.post(url, {**data, "product": 0})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Addition.objects.count(), 1)
+
+
+class CheckoutTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.products = [
+            create_product(f"Product {i}", min_order_quantity=2)
+            for i in range(10)
+        ]
+        cls.user, cls.other = create_users(2)
+
+    def fill_cart(self, user, products, quantity=2, **kwargs):
+        cart = Cart.objects.get_or_create(user=user)[0]
+        for product in products:
+            Addition.objects.create(
+                cart=cart, product=product, quantity=quantity, **kwargs
+            )
+        return cart
+
+    def test_queries_dont_grow_with_cart_size(self):
+        for user, size in ((self.user, 1), (self.other, 10)):
+            cart = self.fill_cart(user, self.products[:size])
+            with self.assertNumQueries(10 + 2):  # With SAVEPOINT and RELEASE.
+                order = services.checkout(cart)
+            self.assertEqual(order.order_details.count(), size)
+            self.assertFalse(cart.addition_set.exists())
+
+    def test_only_own_order_now_additions_are_ordered(self):
+        cart = self.fill_cart(self.user, self.products[:2])
+        later = self.fill_cart(self.user, self.products[2:3], order_now=False)
+        self.fill_cart(self.other, self.products[:3])
+        order = services.checkout(cart)
+        self.assertEqual(
+            set(order.products.all()), set(self.products[:2])
+        )
+        self.assertEqual(
+            list(later.addition_set.values_list("product", flat=True)),
+            [self.products[2].pk],
+        )
+        self.assertEqual(Addition.objects.filter(cart__user=self.other).count(), 3)
+
+    def test_invalid_cart_is_left_untouched(self):
+        cart = self.fill_cart(self.user, self.products[:1])
+        self.fill_cart(self.user, self.products[1:2], quantity=1)
+        with self.assertRaises(ValidationError) as cm:
+            services.checkout(cart)
+        self.assertEqual(cm.exception.error_list[0].code, "too_low")
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(cart.addition_set.count(), 2)
+
+    def test_checkout_view(self):
+        self.client.force_login(self.user)
+        self.fill_cart(self.user, self.products[:3])
+        url = reverse("shop:checkout")
+        response = self.client.post(url, HTTP_ACCEPT="application/json")
+        self.assertEqual(response.json()["products"], 3)
+        response = self.client.post(url, HTTP_ACCEPT="application/json")
+        self.assertEqual(response.status_code, 400)
+
+    def test_checkout_reserves_stock(self):
+        cart = self.fill_cart(self.user, self.products[:2], quantity=4)
+        order = services.checkout(cart)
+        self.assertEqual(
+            list(order.reservations.values_list("product", "quantity")),
+            [(self.products[0].pk, 4), (self.products[1].pk, 4)],
+        )
+        self.products[0].refresh_from_db()
+        self.assertEqual(self.products[0].quantity, 6)
+
+    def test_out_of_stock_cart_is_left_untouched(self):
+        cart = self.fill_cart(self.user, self.products[:1], quantity=8)
+        services.checkout(cart)
+        cart = self.fill_cart(self.other, self.products[:2], quantity=3)
+        with self.assertRaises(ValidationError) as cm:
+            services.checkout(cart)
+        self.assertEqual(cm.exception.error_list[0].code, "out_of_stock")
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(cart.addition_set.count(), 2)
+        self.products[1].refresh_from_db()
+        self.assertEqual(self.products[1].quantity, 10)
+
+
+class CartViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        discount = Discount.objects.create(
+            reason="sale",
+            percent=10,
+            group="",
+            start=datetime.date.today() - datetime.timedelta(days=1),
+        )
+        cls.products = [
+            create_product(f"Product {i}", discount=discount if i == 0 else None)
+            for i in range(5)
+        ]
+        cls.user, cls.other = create_users(2)
+
+    def setUp(self):
+        django_cache.clear()
+        tag_cache.local.clear()
+
+    def fill_cart(self, user, products):
+        cart = Cart.objects.create(user=user)
+        for product in products:
+            Addition.objects.create(cart=cart, product=product, quantity=2)
+        return cart
+
+    def get_queries(self, user):
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("shop:cart"))
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_queries_dont_grow_with_cart_size(self):
+        self.fill_cart(self.user, self.products[:1])
+        self.fill_cart(self.other, self.products)
+        # Load per-process caches.
+        self.client.get(reverse("shop:cart"))
+        Discount.objects.all_cached()
+        response, small = self.get_queries(self.user)
+        response, large = self.get_queries(self.other)
+        self.assertEqual(small, large)
+        self.assertEqual(response.content.decode().count('class="cart-item"'), 5)
+        # Discounted price of the first product.
+        self.assertEqual(response.context["summary"]["amount"], 180 + 4 * 200)
+
+    def test_summary_is_cached_until_additions_change(self):
+        cart = self.fill_cart(self.user, self.products[:2])
+        self.assertEqual(cart.summary(), {"items": 2, "amount": 380})
+        with self.assertNumQueries(0):
+            cart.summary()
+        addition = cart.addition_set.get(product=self.products[1])
+        addition.order_now = False
+        addition.save()
+        self.assertEqual(cart.amount(), 180)
+        services.checkout(cart)
+        self.assertEqual(cart.summary(), {"items": 1, "amount": 0})
+
+    def test_catalog_links_to_cart(self):
+        self.fill_cart(self.user, self.products[:1])
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("shop:catalog", args=[1]))
+        content = response.content.decode()
+        self.assertIn(f'href="{reverse("shop:cart")}"', content)
+        self.assertNotIn("/link-to-cart-will-be-here/", content)
+
+
+class EffectivePriceTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.today = datetime.date.today()
+        yesterday = cls.today - datetime.timedelta(days=1)
+        cls.chairs = Category.objects.create(name="type", value="chair")
+        cls.sale = Discount.objects.create(
+            reason="sale", percent=10, group="", start=yesterday
+        )
+        cls.bulk = Discount.objects.create(
+            reason="bulk", percent=20, group="wholesale", start=yesterday
+        )
+        cls.bulk.category.add(cls.chairs)
+        cls.chair = create_product("Chair", price=200, discount=cls.sale)
+        cls.chairs.products.add(cls.chair)
+        cls.table = create_product("Table", price=170)
+        cls.user = create_users(1)[0]
+        cls.user.groups.add(Group.objects.create(name="wholesale"))
+
+    def setUp(self):
+        django_cache.clear()
+
+    def prices(self, product):
+        return dict(product.effective_prices.values_list("group", "price"))
+
+    def test_best_discount_per_group(self):
+        self.assertEqual(self.prices(self.chair), {"": 180, "wholesale": 160})
+        self.assertEqual(self.prices(self.table), {"": 170, "wholesale": 170})
+        self.assertEqual(pricing.customer_group(self.user), "wholesale")
+
+    def test_discount_changes_refresh_prices(self):
+        self.sale.percent = 30
+        self.sale.save()
+        self.assertEqual(self.prices(self.chair), {"": 140, "wholesale": 140})
+        self.bulk.percent = 80  # Out of range.
+        self.bulk.save()
+        self.sale.delete()
+        self.assertEqual(self.prices(self.chair), {"": 200, "wholesale": 200})
+
+    def test_bulk_writes_resolve_prices(self):
+        stool, = Product.objects.bulk_create(
+            [Product(name="Stool", price=50, min_order_quantity=1)]
+        )
+        self.assertEqual(self.prices(stool), {"": 50, "wholesale": 50})
+        Product.objects.filter(pk__in=[stool.pk, self.chair.pk]).update(price=100)
+        self.assertEqual(self.prices(stool), {"": 100, "wholesale": 100})
+        self.assertEqual(self.prices(self.chair), {"": 90, "wholesale": 80})
+        response = self.client.get(reverse("shop:catalog", args=[1]))
+        self.assertIn(stool, response.context["paginator"].object_list)
+        cart = Cart.objects.create(user=self.user)
+        Addition.objects.create(cart=cart, product=stool, quantity=2)
+        Addition.objects.create(cart=cart, product=self.chair, quantity=1)
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("shop:cart"))
+        self.assertEqual(
+            [a.price for a in response.context["additions"]], [100, 80]
+        )
+        self.assertEqual(response.context["summary"]["amount"], 2 * 100 + 80)
+
+    def test_new_group_gets_rows_of_every_product(self):
+        vip = Discount.objects.create(
+            reason="vip", percent=50, group="vip", start=self.today
+        )
+        self.assertEqual(
+            self.prices(self.chair), {"": 180, "wholesale": 160, "vip": 180}
+        )
+        self.table.discount = vip
+        self.table.save()
+        self.assertEqual(
+            dict(
+                Product.objects.with_effective_price("vip")
+                .values_list("name", "effective_price")
+            ),
+            {"Chair": 180, "Table": 85},
+        )
+
+    def test_discount_changes_refresh_affected_products_only(self):
+        with mock.patch.object(pricing, "refresh") as refresh:
+            self.bulk.save()
+            refresh.assert_called_once_with({self.chair.pk})
+            refresh.reset_mock()
+            tables = Category.objects.create(name="type", value="table")
+            tables.products.add(self.table)
+            refresh.reset_mock()
+            self.bulk.category.add(tables)
+            refresh.assert_called_once_with({self.table.pk})
+            refresh.reset_mock()
+            self.bulk.category.clear()
+            refresh.assert_called_once_with({self.chair.pk, self.table.pk})
+
+    def test_rows_of_unused_groups_are_dropped(self):
+        self.bulk.group = "partners"
+        self.bulk.save()
+        self.assertEqual(self.prices(self.chair), {"": 180, "partners": 160})
+        self.assertEqual(self.prices(self.table), {"": 170, "partners": 170})
+        self.assertFalse(EffectivePrice.objects.filter(group="wholesale").exists())
+
+    def test_detail_page_and_filter_show_customer_prices(self):
+        url = reverse("shop:product-detail", args=[self.chair.pk])
+        self.client.force_login(self.user)
+        response = self.client.get(url)
+        self.assertEqual(response.context["product"].effective_price, 160)
+        self.assertEqual(response.context["discount"], self.bulk)
+        self.assertEqual(get_price_extremes("wholesale"), (160, 170))
+        self.assertEqual(get_price_extremes(), (170, 180))
+
+    def test_prices_follow_discount_dates(self):
+        start = self.today + datetime.timedelta(days=3)
+        later = Discount.objects.create(
+            reason="later", percent=50, group="", start=start
+        )
+        later.category.add(self.chairs)
+        self.assertEqual(self.prices(self.chair), {"": 180, "wholesale": 160})
+        self.assertEqual(
+            set(self.chair.effective_prices.values_list("valid_until", flat=True)),
+            {start},
+        )
+        self.assertEqual(pricing.refresh_expired(self.today), 0)
+        self.assertEqual(pricing.refresh_expired(start), 2)
+        self.assertEqual(self.prices(self.chair), {"": 100, "wholesale": 100})
+
+    def test_catalog_sorts_by_customer_price(self):
+        def sorted_catalog(ascending="on"):
+            response = self.client.get(reverse("shop:catalog", args=[1]), {
+                "action": "sort_catalog",
+                "sort_by": "price",
+                "ascending": ascending,
+            })
+            return list(response.context["catalog"])
+
+        self.assertEqual(sorted_catalog(), [self.table, self.chair])
+        self.client.force_login(self.user)
+        self.assertEqual(sorted_catalog(), [self.chair, self.table])
+        self.assertEqual(sorted_catalog(ascending=""), [self.table, self.chair])
+
+    def test_api_filters_by_customer_price(self):
+        self.client.force_login(self.user)
+        response = self.client.get(
+            reverse("shop:api-products"),
+            {"price_max": 165, "fields": "id,effective_price"},
+        )
+        # SQLite drops trailing zeros of computed decimals.
+        self.assertEqual(
+            [
+                (row["id"], decimal.Decimal(row["effective_price"]))
+                for row in response.json()["results"]
+            ],
+            [(self.chair.pk, 160)],
+        )
+
+
+class ReservationReleaseTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = create_product("Product")
+        cls.user = create_users(1)[0]
+
+    def order(self, quantity=3):
+        return services.order_product(
+            Order(user=self.user), self.product, quantity
+        )
+
+    def stock(self):
+        self.product.refresh_from_db()
+        return self.product.quantity
+
+    def test_expired_unpaid_reservations_return_stock(self):
+        self.order()
+        self.order(2)
+        self.assertEqual(self.stock(), 5)
+        self.assertEqual(services.release_reservations(), 0)
+        later = datetime.timedelta(minutes=settings.STOCK_RESERVATION_MINUTES)
+        released = services.release_reservations(timezone.now() + later)
+        self.assertEqual(released, 2)
+        self.assertEqual(self.stock(), 10)
+        self.assertFalse(Reservation.objects.exists())
+
+    def test_paid_reservations_keep_stock(self):
+        Purchase.objects.create(order=self.order(), payment_received=True)
+        later = datetime.timedelta(minutes=settings.STOCK_RESERVATION_MINUTES)
+        self.assertEqual(services.release_reservations(timezone.now() + later), 0)
+        self.assertEqual(self.stock(), 7)
+        self.assertFalse(Reservation.objects.exists())
+
+    def test_cancelled_reservations_return_stock_at_once(self):
+        Purchase.objects.create(order=self.order(), cancelled=True)
+        self.order()
+        call_command("release_reservations", stdout=io.StringIO())
+        self.assertEqual(self.stock(), 7)
+        self.assertEqual(Reservation.objects.count(), 1)
+
+
+class WarehouseStockTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.north, cls.south = Warehouse.objects.bulk_create(
+            [Warehouse(name="North"), Warehouse(name="South")]
+        )
+        cls.product = create_product("Product", quantity=6, warehouse=cls.north)
+        services.move_stock(cls.south, cls.product, 4)
+        cls.user = create_users(1)[0]
+
+    def stocks(self):
+        self.product.refresh_from_db()
+        return self.product.quantity, dict(
+            Stock.objects.filter(product=self.product)
+            .values_list("warehouse__name", "quantity")
+        )
+
+    def test_total_follows_movements(self):
+        self.assertEqual(self.stocks(), (10, {"North": 6, "South": 4}))
+        services.move_stock(self.south, self.product, -3)
+        self.assertEqual(self.stocks(), (7, {"North": 6, "South": 1}))
+        with self.assertRaises(ValidationError):
+            services.move_stock(self.south, self.product, -2)
+        self.assertEqual(self.stocks(), (7, {"North": 6, "South": 1}))
+
+    def test_reservations_take_from_fullest_warehouses(self):
+        order = services.order_product(Order(user=self.user), self.product, 8)
+        self.assertEqual(
+            dict(order.reservations.values_list("warehouse__name", "quantity")),
+            {"North": 6, "South": 2},
+        )
+        self.assertEqual(self.stocks(), (2, {"North": 0, "South": 2}))
+        Purchase.objects.create(order=order, cancelled=True)
+        services.release_reservations()
+        self.assertEqual(self.stocks(), (10, {"North": 6, "South": 4}))
+
+    def test_admin_edits_update_totals(self):
+        admin = get_user_model().objects.create_superuser("admin")
+        self.client.force_login(admin)
+        north_stock = Stock.objects.get(warehouse=self.north)
+        response = self.client.post(
+            reverse("kamaladmin:shop_warehouse_change", args=[self.north.pk]),
+            {
+                "name": "North",
+                "address": "",
+                "stocks-TOTAL_FORMS": "1",
+                "stocks-INITIAL_FORMS": "1",
+                "stocks-0-id": north_stock.pk,
+                "stocks-0-warehouse": self.north.pk,
+                "stocks-0-product": self.product.pk,
+                "stocks-0-quantity": "9",
+            },
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.stocks(), (13, {"North": 9, "South": 4}))
+
+
+class ConcurrentCheckoutTests(TransactionTestCase):
+    threads = 12
+
+    def test_stock_is_never_oversold(self):
+        product = create_product("Product", quantity=10)
+        carts = []
+        for user in create_users(self.threads):
+            cart = Cart.objects.create(user=user)
+            Addition.objects.create(cart=cart, product=product, quantity=3)
+            carts.append(cart)
+        barrier = threading.Barrier(self.threads)
+        outcomes = []
+
+        def checkout(cart):
+            barrier.wait()
+            try:
+                services.checkout(cart)
+                outcomes.append("ordered")
+            except ValidationError:
+                outcomes.append("out_of_stock")
+            except DatabaseError:
+                # SQLite can't lock rows and refuses concurrent writers.
+                outcomes.append("lock_error")
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=checkout, args=[cart]) for cart in carts
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        ordered = outcomes.count("ordered")
+        if connection.features.has_select_for_update:
+            self.assertEqual(ordered, 3)
+            self.assertEqual(outcomes.count("out_of_stock"), self.threads - 3)
+        self.assertTrue(1 <= ordered <= 3)
+        product.refresh_from_db()
+        self.assertEqual(product.quantity, 10 - 3 * ordered)
+        self.assertEqual(Reservation.objects.count(), ordered)
+        self.assertEqual(Order.objects.count(), ordered)
+
+
+class CatalogViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.products = [create_product(f"Product {i}") for i in range(6)]
+        cls.user = create_users(1)[0]
+        cart = Cart.objects.create(user=cls.user)
+        Addition.objects.create(cart=cart, product=cls.products[0], quantity=1)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.url = reverse("shop:catalog", kwargs={"page": 1})
+
+    def test_cards_are_limited_to_page(self):
+        response = self.client.get(self.url)
+        content = response.content.decode()
+        self.assertEqual(content.count('class="product-card"'), 4)
+        self.assertEqual(content.count('class="add-incard"'), 3)
+
+    def test_no_repeated_queries_per_card(self):
+        with assert_no_n_plus_one(threshold=2):
+            self.client.get(self.url)
+
+    def test_streaming_matches_regular_response(self):
+        regular = self.client.get(self.url).content.decode()
+        with mock.patch.object(CatalogView, "streaming", True):
+            response = self.client.get(self.url)
+        self.assertTrue(response.streaming)
+        chunks = [chunk.decode() for chunk in response.streaming_content]
+        self.assertIn('class="catalog-filter"', chunks[0])
+        self.assertNotIn('class="product-card"', chunks[0])
+        self.assertEqual(
+            "".join(chunks).count('class="product-card"'),
+            regular.count('class="product-card"'),
+        )
+
+
+class CatalogApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.products = [
+            create_product(f"Product {i}", price=10 * (i + 1)) for i in range(5)
+        ]
+        cls.red = Category.objects.create(name="colour", value="red")
+        cls.red.products.add(*cls.products[:2])
+
+    def test_cursor_pagination(self):
+        url = reverse("shop:api-products")
+        response = self.client.get(url, {"limit": 3, "fields": "id,name"})
+        page = response.json()
+        self.assertEqual(len(page["results"]), 3)
+        self.assertEqual(set(page["results"][0]), {"id", "name"})
+        response = self.client.get(url, {"limit": 3, "cursor": page["next"]})
+        page = response.json()
+        self.assertEqual(len(page["results"]), 2)
+        self.assertIsNone(page["next"])
+        response = self.client.get(url, {"cursor": "!"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("cursor", response.json()["errors"])
+
+    def test_filters_and_categories(self):
+        url = reverse("shop:api-products")
+        response = self.client.get(
+            url,
+            {"colour": "red", "price_max": 10, "fields": "id,categories"},
+        )
+        self.assertEqual(
+            response.json()["results"],
+            [{"id": self.products[0].pk, "categories": [self.red.pk]}],
+        )
+
+    def test_price_range_beyond_current_prices(self):
+        url = reverse("shop:api-products")
+        response = self.client.get(url, {"price_max": 1000, "fields": "id"})
+        self.assertEqual(len(response.json()["results"]), 5)
+        for params in ({"price_min": -1}, {"price_min": 30, "price_max": 20}):
+            with self.subTest(**params):
+                response = self.client.get(url, params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("price", response.json()["errors"])
+
+    def test_unknown_field(self):
+        url = reverse("shop:api-categories")
+        response = self.client.get(url, {"fields": "id,secret"})
+        self.assertEqual(response.status_code, 400)
+
+
+class CatalogChangeTests(TestCase):
+    def get_changes(self, since=0):
+        url = reverse("shop:api-changes")
+        return self.client.get(url, {"since": since}).json()
+
+    def test_changes_since(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            product = create_product("Chair")
+            category = Category.objects.create(name="colour", value="red")
+        first = self.get_changes()
+        self.assertEqual(
+            [(c["model"], c["operation"]) for c in first["results"]],
+            [("product", "save"), ("category", "save")],
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            category.products.add(product)
+            category_id = category.pk
+            category.delete()
+        changes = self.get_changes(first["next"])["results"]
+        self.assertEqual(
+            [(c["model"], c["id"], c["operation"]) for c in changes],
+            [("product", product.pk, "save"), ("category", category_id, "delete")],
+        )
+        self.assertEqual(changes[0]["data"]["categories"], [])
+        self.assertIsNone(changes[1]["data"])
+
+    def test_changes_are_recorded_on_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            create_product("Chair")
+            self.assertEqual(self.get_changes()["results"], [])
+        for callback in callbacks:
+            callback()
+        self.assertEqual(len(self.get_changes()["results"]), 1)
+
+    def test_bulk_writes_are_recorded(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            chair = create_product("Chair", quantity=5)
+            table = create_product("Table")
+        since = self.get_changes()["next"]
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(pk=table.pk).update(price=5)
+        changes = self.get_changes(since)
+        self.assertEqual(
+            [
+                (c["id"], decimal.Decimal(c["data"]["price"]))
+                for c in changes["results"]
+            ],
+            [(table.pk, 5)],
+        )
+        cart = Cart.objects.create(user=create_users(1)[0])
+        Addition.objects.create(cart=cart, product=chair, quantity=2)
+        with self.captureOnCommitCallbacks(execute=True):
+            services.checkout(cart)
+        self.assertEqual(
+            [
+                (c["id"], decimal.Decimal(c["data"]["quantity"]))
+                for c in self.get_changes(changes["next"])["results"]
+            ],
+            [(chair.pk, 3)],
+        )
+
+    def test_invalid_parameters(self):
+        response = self.client.get(
+            reverse("shop:api-changes"), {"since": "1", "limit": "many"}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json(), {"errors": {"limit": ["Enter a whole number."]}}
+        )
+
+
+class AsyncViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = create_product("Sofa", min_order_quantity=3)
+        cls.user = create_users(1)[0]
+
+    async def test_catalog_and_detail(self):
+        response = await self.async_client.get(
+            reverse("shop:async-catalog", kwargs={"page": 1}),
+        )
+        self.assertContains(response, "Sofa")
+        response = await self.async_client.get(
+            reverse("shop:async-product-detail", args=[self.product.pk]),
+        )
+        self.assertContains(response, "Sofa")
+
+    async def test_catalog_is_sorted_like_sync_one(self):
+        await Product.objects.acreate(
+            name="Armchair", price=50, min_order_quantity=1
+        )
+        path = reverse("shop:async-catalog", kwargs={"page": 1})
+        response = await self.async_client.get(
+            path,
+            {"action": "sort_catalog", "sort_by": "price", "ascending": "on"},
+        )
+        self.assertEqual(
+            [p.name for p in response.context["catalog"]],
+            ["Armchair", "Sofa"],
+        )
+        # The setting is kept in the session.
+        response = await self.async_client.get(path)
+        self.assertEqual(
+            [p.effective_price for p in response.context["catalog"]],
+            [50, 100],
+        )
+
+    async def test_like_and_add(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.post(
+            reverse("shop:async-product-card-like", args=[self.product.pk]),
+            {"action": "like"},
+            headers={"accept": "application/json"},
+        )
+        self.assertEqual(response.json()["likes"], 1)
+        response = await self.async_client.post(
+            reverse("shop:async-product-card-add", args=[self.product.pk]),
+            {"action": "addition", "product": self.product.pk},
+            headers={"accept": "application/json"},
+        )
+        self.assertEqual(response.json()["quantity"], "3.00")
+
+
+@override_settings(DATABASE_REPLICAS=["replica"])
+class PrimaryReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        # Writes of other tests outside requests pin reads to the primary.
+        self.addCleanup(_wrote.reset, _wrote.set(False))
+
+    def test_catalog_reads_go_to_replica(self):
+        router = PrimaryReplicaRouter()
+        self.assertEqual(router.db_for_read(Product), "replica")
+        self.assertEqual(router.db_for_read(Cart), "default")
+        self.assertEqual(router.db_for_write(Product), "default")
+
+    def test_pinned_after_write(self):
+        router = PrimaryReplicaRouter()
+        reads = []
+
+        def view(request):
+            reads.append(router.db_for_read(Product))
+            if request.method == "POST":
+                router.db_for_write(Like)
+            return HttpResponse()
+
+        middleware = PrimaryPinningMiddleware(view)
+        factory = RequestFactory()
+        response = middleware(factory.post("/"))
+        cookie = response.cookies[PIN_COOKIE].value
+        middleware(factory.get("/"))
+        factory.cookies[PIN_COOKIE] = cookie
+        middleware(factory.get("/"))
+        self.assertEqual(reads, ["replica", "replica", "default"])
+
+    def test_reads_after_writes_and_in_transactions_go_to_primary(self):
+        router = PrimaryReplicaRouter()
+        reads = []
+
+        def view(request):
+            reads.append(router.db_for_read(Product))
+            router.db_for_write(Like)
+            reads.append(router.db_for_read(Product))
+            return HttpResponse()
+
+        PrimaryPinningMiddleware(view)(RequestFactory().post("/"))
+        self.assertEqual(reads, ["replica", "default"])
+        with mock.patch.object(
+            connections["default"], "in_atomic_block", True
+        ):
+            self.assertEqual(router.db_for_read(Product), "default")
+
+
+@override_settings(DATABASE_REPLICAS=["replica"])
+class ReplicaMirrorTests(TransactionTestCase):
+    """
+    Route queries through a "replica" alias mirroring the test database.
+    It's added once the test database exists, as the test runner checks
+    declared databases before.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        connections.settings["replica"] = {
+            **connections["default"].settings_dict,
+            "TEST": {"MIRROR": "default"},
+        }
+        cls.addClassCleanup(cls.remove_replica)
+
+    @classmethod
+    def remove_replica(cls):
+        connections["replica"].close()
+        del connections["replica"]
+        del connections.settings["replica"]
+
+    def test_reads_after_writes_see_them(self):
+        product = create_product("Chair", quantity=0)
+
+        def view(request):
+            Product.objects.get(pk=product.pk)
+            with transaction.atomic():
+                Product.objects.get(pk=product.pk)
+            if request.method == "POST":
+                Like.objects.create(product=product, liked=True)
+                Product.objects.with_like_count().get(pk=product.pk)
+            return HttpResponse()
+
+        middleware = PrimaryPinningMiddleware(view)
+        factory = RequestFactory()
+        for method, replica_reads in (("get", 1), ("post", 1)):
+            with self.subTest(method):
+                with CaptureQueriesContext(connections["replica"]) as reads:
+                    middleware(getattr(factory, method)("/"))
+                self.assertEqual(len(reads), replica_reads)
+
+
+class CacheTagTests(TestCase):
+    def setUp(self):
+        django_cache.clear()
+        self.product = create_product("Bench")
+
+    def cached_names(self):
+        return tag_cache.get_or_set_tagged(
+            "names",
+            lambda: list(Product.objects.values_list("name", flat=True)),
+            ["product"],
+        )
+
+    def test_save_invalidates(self):
+        self.assertEqual(self.cached_names(), ["Bench"])
+        self.product.name = "Stool"
+        self.product.save()
+        self.assertEqual(self.cached_names(), ["Stool"])
+
+    def test_bulk_writes_invalidate(self):
+        self.cached_names()
+        Product.objects.update(name="Stool")
+        self.assertEqual(self.cached_names(), ["Stool"])
+        Product.objects.bulk_create(
+            [Product(name="Shelf", price=1, min_order_quantity=1)]
+        )
+        self.assertEqual(sorted(self.cached_names()), ["Shelf", "Stool"])
+
+    def test_unrelated_tag_is_kept(self):
+        tag_cache.set_tagged("colours", ["red"], ["category"])
+        Product.objects.update(name="Stool")
+        self.assertEqual(tag_cache.get_tagged("colours"), ["red"])
+
+
+class LocalCacheTests(TestCase):
+    def setUp(self):
+        django_cache.clear()
+
+    def test_lru_and_stats(self):
+        local = tag_cache.LocalCache(maxsize=2)
+        local.set("a", 1)
+        local.set("b", 2)
+        local.get("a")
+        local.set("c", 3)
+        self.assertIsNone(local.get("b"))
+        self.assertEqual(local.get("a"), 1)
+        stats = local.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (2, 1))
+        self.assertEqual(stats["evictions"], 1)
+
+    def test_ttl(self):
+        local = tag_cache.LocalCache(ttl=0)
+        local.set("a", 1)
+        self.assertIsNone(local.get("a"))
+
+    def test_clear_reads_global_version_again(self):
+        local = tag_cache.LocalCache()
+        local.set("a", 1)
+        tag_cache.bump(tag_cache.GLOBAL_TAG)
+        local.clear()
+        local.set("a", 2)
+        later = time.monotonic() + local.check_interval + 1
+        with mock.patch.object(time, "monotonic", return_value=later):
+            self.assertEqual(local.get("a"), 2)
+
+    def test_cleared_by_another_process(self):
+        local = tag_cache.LocalCache(check_interval=0)
+        local.set("a", 1)
+        self.assertEqual(local.get("a"), 1)
+        # Another process only bumps the global version in the shared cache.
+        tag_cache.bump(tag_cache.GLOBAL_TAG)
+        self.assertIsNone(local.get("a"))
+
+    def test_get_cached(self):
+        product = create_product("Lamp")
+        with self.assertNumQueries(1):
+            Product.objects.get_cached(product.pk)
+            Product.objects.get_cached(product.pk)
+        product.name = "Desk lamp"
+        product.save()
+        self.assertEqual(Product.objects.get_cached(product.pk).name, "Desk lamp")
+
+    def test_frequent_writes_keep_local_caches(self):
+        product = create_product("Lamp")
+        user = create_users(1)[0]
+
+        def global_version():
+            return tag_cache.get_tag_versions([tag_cache.GLOBAL_TAG])
+
+        before = global_version()
+        Like.objects.create(user=user, product=product, liked=True)
+        Product.objects.filter(pk=product.pk).update(quantity=F("quantity") - 1)
+        self.assertEqual(global_version(), before)
+        # Entries of the shared cache are still invalidated.
+        tag_cache.set_tagged("names", ["Lamp"], ["product"])
+        Product.objects.filter(pk=product.pk).update(quantity=1)
+        self.assertIsNone(tag_cache.get_tagged("names"))
+        Product.objects.filter(pk=product.pk).update(name="Desk lamp")
+        self.assertNotEqual(global_version(), before)
+
+
+class SingleFlightTests(SimpleTestCase):
+    def setUp(self):
+        django_cache.clear()
+
+    def test_one_recomputation_under_concurrency(self):
+        calls = []
+        start = threading.Barrier(20)
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return 42
+
+        def worker(results):
+            start.wait()
+            results.append(
+                tag_cache.get_or_recompute("answer", compute, ["product"])
+            )
+
+        results = []
+        threads = [
+            threading.Thread(target=worker, args=(results,)) for _ in range(20)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [42] * 20)
+
+    def test_stale_value_served_while_recomputing(self):
+        tag_cache.get_or_recompute("answer", lambda: 1, ["product"])
+        tag_cache.bump("product")
+        # Another caller holds the lock.
+        django_cache.add("answer:lock", True)
+        value = tag_cache.get_or_recompute("answer", lambda: 2, ["product"])
+        self.assertEqual(value, 1)
+        django_cache.delete("answer:lock")
+        value = tag_cache.get_or_recompute("answer", lambda: 2, ["product"])
+        self.assertEqual(value, 2)
+
+
+class StartupTests(SimpleTestCase):
+    def test_imports_do_no_database_io(self):
+        report = measure_startup()
+        self.assertIsNone(report["import_db_io"])
+        self.assertIn("shop", report["warm_up"])
+
+
+class SeedDataTests(TestCase):
+    def test_seed_data_is_reproducible_and_consistent(self):
+        for _ in range(2):
+            call_command(
+                "seed_data",
+                products=20,
+                users=10,
+                order_share=1,
+                stdout=io.StringIO(),
+            )
+        prices = list(Product.objects.order_by("pk").values_list("price", flat=True))
+        self.assertEqual(prices[:20], prices[20:])
+        self.assertEqual(Order.objects.count(), 20)
+        self.assertFalse(
+            OrderDetail.objects.filter(order__user__isnull=True).exists()
+        )
+        self.assertFalse(
+            Product.objects.alias(total=Coalesce(Sum("stocks__quantity"), 0))
+            .exclude(quantity=F("total"))
+            .exists()
+        )
+        # Carts hold min_order_quantity multiples of their products.
+        for addition in Addition.objects.select_related("product"):
+            self.assertEqual(
+                addition.quantity % addition.product.min_order_quantity, 0
+            )
+
+
+class BenchmarkTests(TestCase):
+    def test_seeded_catalog_is_benchmarked_without_errors(self):
+        counts = Seeder(seed=1).seed_catalog(30, users=5, likes_per_user=3)
+        self.assertEqual(counts["shop.Product"], 30)
+        self.assertEqual(counts["shop.Like"], 15)
+        self.assertEqual(Like.objects.count(), 15)
+        user = get_user_model().objects.first()
+        product_ids = list(
+            Product.objects.filter(in_production=True).values_list("pk", flat=True)
+        )
+        results = run_scenarios(user, product_ids, repeat=2, allocation_repeat=1)
+        self.assertEqual(
+            set(results),
+            {"catalog", "catalog-filter", "product-detail", "like", "add"},
+        )
+        for stats in results.values():
+            self.assertEqual(stats["errors"], 0)
+            self.assertGreater(stats["queries"], 0)
+
+    def test_products_are_sampled_with_seed(self):
+        Seeder(seed=1).seed_catalog(30, users=1, likes_per_user=0)
+        sample = sample_product_ids(10, seed=3)
+        self.assertEqual(len(set(sample)), 10)
+        self.assertEqual(sample_product_ids(10, seed=3), sample)
+        self.assertEqual(
+            Product.objects.filter(pk__in=sample, in_production=True).count(),
+            10,
+        )
+
+    def test_filter_scenario_narrows_catalog(self):
+        category = Category.objects.create(name="colour", value="red")
+        for price in (5, 100, 900):
+            category.products.add(create_product(f"Chair {price}", price=price))
+        scenario = {s.name: s for s in get_scenarios()}["catalog-filter"]
+        path, data = scenario.request(None)
+        response = self.client.get(path, data)
+        self.assertEqual(
+            [p.name for p in response.context["paginator"].object_list],
+            ["Chair 100"],
+        )
+
+
+class LoadTestTests(SimpleTestCase):
+    def test_parse_mix(self):
+        self.assertEqual(parse_mix("browse=3,like"), {"browse": 3, "like": 1})
+        with self.assertRaisesMessage(ValueError, "Unknown scenario"):
+            parse_mix("browse=1,teleport=2")
+        with self.assertRaises(ValueError):
+            parse_mix("browse=0")
+
+    def test_results_are_summarized_per_scenario(self):
+        sent = []
+
+        async def send(method, path, query_string="", body=b"", headers=()):
+            sent.append((method, path))
+            return 403 if method == "POST" and not headers else 200
+
+        data = LoadData(product_ids=[1, 2], pages=3, filters=[("colour", "red")])
+        results = asyncio.run(
+            run_mix(send, data, {"browse": 1, "like": 1}, 40, 4, seed=0)
+        )
+        self.assertEqual(results["requests"], 40)
+        self.assertEqual(results["errors"], 0)
+        self.assertEqual(set(results["labels"]), {"browse", "like"})
+        self.assertEqual(
+            sum(stats["requests"] for stats in results["labels"].values()), 40
+        )
+        self.assertIn(("POST", "/shop/like-1/"), sent)
+
+
+class LoadDataTests(TestCase):
+    def test_filters_are_accepted(self):
+        for price in (5, 100, 900):
+            create_product(f"Chair {price}", price=price)
+        data = LoadData.load()
+        self.assertEqual(data.price_range, (0, 900))
+        rng = random.Random(0)
+        path = reverse("shop:catalog-filter")
+        for _ in range(10):
+            query = filter_catalog(rng, data)[2]
+            with self.subTest(query):
+                response = self.client.get(f"{path}?{query}")
+                self.assertEqual(response.status_code, 200)
+
+
+class QueryPlanTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seeder = Seeder(seed=0)
+        products = (
+            queryplans.BASELINE_PRODUCTS
+            if connection.vendor == "postgresql" else 20
+        )
+        seeder.seed_catalog(products)
+        seeder.seed_orders()
+
+    def test_registered_queries_run(self):
+        for query in queryplans.registry.values():
+            with self.subTest(query.name):
+                list(query.get_queryset())
+
+    def test_plan_summary(self):
+        plan = {
+            "Node Type": "Nested Loop",
+            "Total Cost": 42.5,
+            "Plans": [
+                {"Node Type": "Seq Scan", "Relation Name": "shop_product"},
+                {"Node Type": "Index Scan", "Relation Name": "shop_like"},
+            ],
+        }
+        self.assertEqual(
+            queryplans.summarize_plan(plan),
+            {"cost": 42.5, "seq_scans": ["shop_product"]},
+        )
+
+    def test_cost_jumps_are_reported(self):
+        query = queryplans.registry["cart"]
+        plans = {"cart": {"cost": 50.0, "seq_scans": ["shop_addition"]}}
+        sizes = {"shop_addition": 100}
+        with mock.patch.object(
+            queryplans, "capture_plans", return_value=plans
+        ), mock.patch.object(queryplans, "table_sizes", return_value=sizes):
+            self.assertEqual(
+                queryplans.check_plans(
+                    baseline={"cart": {"cost": 20.0}}, queries=[query]
+                ),
+                ["cart: estimated cost 50 is more than 2.0 times the "
+                 "baseline 20"],
+            )
+            self.assertEqual(
+                queryplans.check_plans(
+                    baseline={"cart": {"cost": 30.0}}, queries=[query]
+                ),
+                [],
+            )
+
+    @skipUnless(connection.vendor == "postgresql", "EXPLAIN JSON of PostgreSQL")
+    def test_no_plan_regressions(self):
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        self.assertEqual(queryplans.check_plans(), [])
+
+
+class PerformanceCheckTests(SimpleTestCase):
+    source = textwrap.dedent("""
+        import functools
+
+        from django import forms
+
+        from . import models
+
+
+        def get_extremes():
+            return models.Product.objects.aggregate(forms.Max("price"))
+
+
+        class FilterForm(forms.Form):
+            top = forms.IntegerField(initial=get_extremes())
+            first = models.Category.objects.first()
+            lazy = forms.IntegerField(initial=get_extremes)
+
+
+        @functools.cache
+        def category_names():
+            return list(models.Category.objects.values_list("name"))
+
+
+        @functools.lru_cache(maxsize=128)
+        def bounded_names():
+            return list(models.Category.objects.values_list("name"))
+
+
+        def catalog(request):
+            products = models.Product.objects.filter(
+                price__lte=10, in_production=True, discount=None,
+            ).order_by("-date_created", "pk")
+            silenced = models.Product.objects.filter(price=1)  # noqa: shop.W001
+            return models.Product.objects.filter(forms.Q(name="x") | forms.Q(pk=1))
+    """)
+
+    def run_checks(self, check):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "views.py"
+            path.write_text(self.source)
+            shop = django_apps.get_app_config("shop")
+            with mock.patch.object(
+                checks, "project_modules", return_value=[(shop, path)]
+            ):
+                return [(w.id, w.msg) for w in check()]
+
+    def test_unindexed_lookups(self):
+        self.assertCountEqual(
+            [msg for _, msg in self.run_checks(checks.check_unindexed_lookups)],
+            [
+                "Product.price is used in filter() without an index.",
+                "Product.date_created is used in order_by() without an index.",
+                "Product.name is used in filter() without an index.",
+            ],
+        )
+
+    def test_import_time_queries(self):
+        self.assertCountEqual(
+            [msg for _, msg in self.run_checks(checks.check_import_time_queries)],
+            [
+                "get_extremes() queries the database on import.",
+                "models.Category.objects.first() queries the database on import.",
+            ],
+        )
+
+    def test_unbounded_orm_caches(self):
+        self.assertEqual(
+            [msg for _, msg in self.run_checks(checks.check_unbounded_orm_caches)],
+            [
+                "category_names() caches ORM results without bounds and never "
+                "sees changes to them."
+            ],
+        )
+
+    def test_process_local_cache(self):
+        self.assertEqual(
+            [w.id for w in checks.check_shared_cache()], ["shop.W004"]
+        )
+        redis = {
+            "default": {
+                "BACKEND": "django.core.cache.backends.redis.RedisCache",
+                "LOCATION": "redis://localhost:6379/0",
+            }
+        }
+        with override_settings(CACHES=redis):
+            self.assertEqual(checks.check_shared_cache(), [])
+
+    def test_project_passes(self):
+        self.assertEqual(checks.check_unindexed_lookups(), [])
+        self.assertEqual(checks.check_import_time_queries(), [])
+        self.assertEqual(checks.check_unbounded_orm_caches(), [])
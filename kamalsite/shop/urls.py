@@ -1,6 +1,7 @@
 from django.urls import path
 from django.views.generic.base import RedirectView
 
+from . import api
 from . import views
 
 app_name = "shop"
@@ -20,4 +21,46 @@ urlpatterns = [
         name="product-card-add",
     ),
     path("product<int:pk>/", views.ProductDetailView.as_view(), name="product-detail"),
+    path("cart/", views.CartView.as_view(), name="cart"),
+    path("checkout/", views.CheckoutView.as_view(), name="checkout"),
+    path(
+        "async/page<int:page>/",
+        views.AsyncCatalogView.as_view(),
+        name="async-catalog",
+    ),
+    path(
+        "async/product<int:pk>/",
+        views.AsyncProductDetailView.as_view(),
+        name="async-product-detail",
+    ),
+    path(
+        "async/like-<int:product_id>/",
+        views.AsyncProductCardLikeView.as_view(),
+        name="async-product-card-like",
+    ),
+    path(
+        "async/add-<int:product_id>/",
+        views.AsyncProductCardAdditionView.as_view(),
+        name="async-product-card-add",
+    ),
+    path(
+        "api/v1/products/",
+        api.ProductListApiView.as_view(),
+        name="api-products",
+    ),
+    path(
+        "api/v1/categories/",
+        api.CategoryListApiView.as_view(),
+        name="api-categories",
+    ),
+    path(
+        "api/v1/discounts/",
+        api.DiscountListApiView.as_view(),
+        name="api-discounts",
+    ),
+    path(
+        "api/v1/changes/",
+        api.ChangeListApiView.as_view(),
+        name="api-changes",
+    ),
 ]
@@ -1,11 +1,18 @@
+import itertools
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
 from django.db import IntegrityError
 from django.db.models import F, Q
+from django.middleware.csrf import get_token
 from django.shortcuts import render, get_object_or_404
 from django.http import (
     HttpResponse,
     Http404,
     HttpResponseForbidden,
     HttpResponseRedirect,
+    JsonResponse,
+    StreamingHttpResponse,
 )
 from django.template import loader
 from django.urls import reverse
@@ -14,8 +21,30 @@ from django.views import View
 from django.views.generic import DetailView, ListView
 from django.views.generic.base import RedirectView
 
+from . import cache
 from . import forms
 from . import models
+from . import pricing
+from . import services
+
+
+def get_cart_id(request):
+    """
+    Return the pk of the request's cart or None if there is none yet.
+    A user's cart pk is remembered in the session, so usually no query is
+    made.
+    """
+    user = request.user
+    if not user.is_authenticated:
+        return request.session.get("cart_id")
+    # Sessions keep their data on login, so remember whose cart it is.
+    remembered = request.session.get("user_cart")
+    if remembered and remembered[0] == user.pk:
+        return remembered[1]
+    pk = models.Cart.objects.filter(user=user).values_list("pk", flat=True).first()
+    if pk is not None:
+        request.session["user_cart"] = [user.pk, pk]
+    return pk
 
 
 class NoPageRedirectView(RedirectView):
@@ -26,45 +55,105 @@ class NoPageRedirectView(RedirectView):
         return super().get_redirect_url(*args, **kwargs)
 
 
-class CatalogView(ListView):
+class CatalogQuerysetMixin:
+    """
+    Build the catalog queryset with prices of the user's group, filter
+    conditions and sort settings kept in the session.
+    """
+    # pk breaks ties so that pages don't overlap.
+    ordering = ("-like_count", "pk")
+    sort_fields = {
+        "name": "name",
+        "popularity": "like_count",
+        "price": "effective_price",
+        "novelty": "date_created",
+    }
+    queryset = models.Product.objects.filter(in_production=True)
+
+    def get_queryset(self):
+        queryset = self.queryset.with_effective_price(
+            pricing.customer_group(self.request.user)
+        )
+        # Source for `conditions` key in self.kwargs is method get() of
+        # class CatalogFilterView.
+        for cond in self.kwargs.get("conditions", ()):
+            queryset = queryset.filter(cond)
+        return queryset.with_like_count().order_by(*self.get_ordering())
+
+    def get_ordering(self):
+        self.update_sort_settings()
+        params = self.request.session.get("catalog_sort", {})
+        field = self.sort_fields.get(params.get("sort_by"))
+        if field is None:
+            return self.ordering
+        return (field if params.get("ascending") else f"-{field}", "pk")
+
+    def update_sort_settings(self):
+        if self.request.GET.get("action") == "sort_catalog":
+            self.request.session["catalog_sort"] = {
+                "sort_by": self.request.GET.get("sort_by"),
+                "ascending": bool(self.request.GET.get("ascending")),
+            }
+
+
+class CatalogView(CatalogQuerysetMixin, ListView):
     """
     Display products.
     """
     context_object_name = "catalog"
-    ordering = "-likes"
     paginate_by = 4
-    queryset = models.Product.objects.filter(in_production=True)
     template_name = "shop/catalog.html"
     like_form = forms.LikeForm
     add_form = forms.CreateAdditionForm
     filter_form = forms.CatalogFilterForm
     sort_form = forms.CatalogSortForm
 
+    # Set streaming=True (e.g. through as_view()) to send the filter block
+    # before product cards are rendered. Cards are then rendered and sent
+    # in chunks of stream_chunk_size.
+    streaming = False
+    stream_chunk_size = 4
+    head_template_name = "shop/catalog_filters.html"
+    card_template_name = "shop/product_card.html"
+
     def get(self, request, *args, **kwargs):
-        # TODO: Make this method work with not authenticated users.
-        like_forms = []
-        add_forms = []
-        addition_ = models.Addition
-
-        qs = self.get_queryset()
-        for product in qs:
-            like_forms.append(self.like_form())
-            if addition_.objects.filter(
-                cart=request.user.cart,
-                product=product,
-            ).exists():
-                add_forms.append(True)
-            else:
-                add_forms.append(
-                    self.add_form(initial={"product": product.id})
-                )
-        self.product_cards = zip(qs, like_forms, add_forms)
         request.session["page"] = kwargs.get("page", 1)
         return super().get(request, *args, **kwargs)
 
+    def get_cart_product_ids(self):
+        """
+        Return ids of products already in the user's cart in a single query.
+        """
+        additions = models.Addition.objects.all()
+        if self.request.user.is_authenticated:
+            additions = additions.filter(cart__user=self.request.user)
+        elif "cart_id" in self.request.session:
+            additions = additions.filter(cart_id=self.request.session["cart_id"])
+        else:
+            return set()
+        return set(additions.values_list("product_id", flat=True))
+
+    def get_product_cards(self, products):
+        """
+        Lazily yield (product, like_form, add_form) for each product.
+        add_form is True for products that are already in the cart.
+        """
+        in_cart = None
+        for product in products:
+            if in_cart is None:
+                in_cart = self.get_cart_product_ids()
+            if product.pk in in_cart:
+                add_form = True
+            else:
+                add_form = self.add_form(initial={"product": product.pk})
+            yield product, self.like_form(), add_form
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context["filter_form"] = self.filter_form()
+        context["product_cards"] = self.get_product_cards(context["catalog"])
+        context["filter_form"] = self.filter_form(
+            group=pricing.customer_group(self.request.user)
+        )
         context["sort_form"] = self.sort_form()
         context["apply_button"] = _("Apply")
         context["like_button"] = _("Like")
@@ -72,41 +161,87 @@ class CatalogView(ListView):
         context["link_to_cart"] = _("To cart")
         return context
 
-    def get_queryset(self):
-        # Source for `conditions` key in self.kwargs is method get() of
-        # class CatalogFilterView.
-        if self.kwargs.get("conditions", False):
-            for cond in self.kwargs["conditions"]:
-                self.queryset = self.queryset.filter(cond)
-        return self.queryset
+    def render_to_response(self, context, **response_kwargs):
+        if not self.streaming:
+            return super().render_to_response(context, **response_kwargs)
+        # Response middleware runs before the body is produced, so make sure
+        # the CSRF cookie for the card forms is set beforehand.
+        get_token(self.request)
+        return StreamingHttpResponse(
+            self.stream_catalog(context),
+            content_type=response_kwargs.get("content_type"),
+        )
 
-    def get_ordering(self):
-        self.update_sort_settings()
-        try:
-            params = self.request.session["sort_settings"]
-            sort_by = params["sort_by"][0]
-            ascending = params["ascending"]
-            # TODO: Work on what to sort on when popularity is chosen.
-            cases = {
-                "name": "name",
-                "popularity": "likes",
-                "price": "price",
-                "novelty": "date_created"
-            }
-            if ascending:
-                self.ordering = cases.get(sort_by, self.ordering)
-            else:
-                self.ordering = "-" + cases.get(sort_by, self.ordering)
-        except KeyError:
-            pass
-        return self.ordering
+    def stream_catalog(self, context):
+        yield loader.render_to_string(
+            self.head_template_name,
+            context,
+            self.request,
+        )
+        card_template = loader.get_template(self.card_template_name)
+        cards = iter(context["product_cards"])
+        while chunk := list(itertools.islice(cards, self.stream_chunk_size)):
+            yield "".join(
+                card_template.render(
+                    {
+                        **context,
+                        "product": product,
+                        "like_form": like_form,
+                        "add_form": add_form,
+                    },
+                    self.request,
+                )
+                for product, like_form, add_form in chunk
+            )
 
-    def update_sort_settings(self):
-        if self.request.GET.get("action") == "sort_catalog":
-            self.request.session["sort_settings"] = self.request.GET
+    def get_paginator(self, queryset, *args, **kwargs):
+        paginator = super().get_paginator(queryset, *args, **kwargs)
+        if not self.kwargs.get("conditions"):
+            # Paginator.count is a cached_property, so this replaces the
+            # COUNT(*) over the whole catalog on every page.
+            paginator.count = cache.get_or_recompute(
+                "shop:catalog-count",
+                queryset.count,
+                ["product"],
+            )
+        return paginator
+
+
+class ProductCardActionView(View):
+    """
+    Base view for actions taken from a product card.
+    Answer with JSON when the request comes from a script (fetch/XHR) so the
+    page only has to update a single card. Otherwise redirect back to the
+    catalog page the user came from.
+    """
+
+    def wants_json(self):
+        headers = self.request.headers
+        return (
+            headers.get("X-Requested-With") == "XMLHttpRequest"
+            or "application/json" in headers.get("Accept", "")
+        )
+
+    def action_response(self, data, form=None):
+        if self.wants_json():
+            if form is not None and form.errors:
+                return JsonResponse({"errors": form.errors}, status=400)
+            return JsonResponse(data)
+        page = self.request.session.get("page", 1)
+        return HttpResponseRedirect(
+            reverse("shop:catalog", kwargs={"page": page})
+        )
+
+    def remember(self, key, product_id, value):
+        """
+        Keep an anonymous user's action on a product in their session.
+        """
+        self.request.session.setdefault(key, {})
+        self.request.session[key][product_id] = value
+        self.request.session.modified = True
 
 
-class ProductCardLikeView(View):
+class ProductCardLikeView(ProductCardActionView):
     form_class = forms.LikeForm
 
     def post(self, request, *args, **kwargs):
@@ -122,7 +257,7 @@ class ProductCardLikeView(View):
             like = like_(product_id=product_id)
             like.save()
         except IntegrityError:
-            return Http404("Product does not exist.")
+            raise Http404("Product does not exist.")
         form = self.form_class(request.POST, instance=like)
         if form.is_valid():
             form.save()
@@ -130,21 +265,22 @@ class ProductCardLikeView(View):
                 request.session.setdefault("likes", {})
                 request.session["likes"][product_id] = like.liked
                 request.session.modified = True
-        page = request.session.get("page", 1)
-        return HttpResponseRedirect(
-            reverse("shop:catalog", kwargs={"page": page})
-        )
+        data = {"product": product_id, "liked": like.liked}
+        if self.wants_json():
+            data["likes"] = like_.objects.filter(product_id=product_id).qty()
+        return self.action_response(data, form)
 
     post.alters_data = True
 
 
-class ProductCardAdditionView(View):
+class ProductCardAdditionView(ProductCardActionView):
     form_class = forms.CreateAdditionForm
 
     def post(self, request, *args, **kwargs):
         product_id = kwargs["product_id"]
         try:
             cart = models.Cart.objects.get_or_create(user=self.request.user)[0]
+            request.session["user_cart"] = [request.user.pk, cart.pk]
         except TypeError:
             # request.user is an AnonymousUser instance.
             try:
@@ -154,20 +290,84 @@ class ProductCardAdditionView(View):
                 cart = models.Cart()
                 cart.save()
                 self.request.session["cart_id"] = cart.pk
-        addition = models.Addition.objects.get_or_create(
-            cart=cart,
-            product_id=product_id,
-        )
+        # Addition.quantity can't be null, so a new instance is only saved
+        # by the form once it has set quantity to min_order_quantity.
+        addition = (
+            models.Addition.objects.filter(cart=cart, product_id=product_id)
+            .first()
+        ) or models.Addition(cart=cart)
         form = self.form_class(request.POST, instance=addition)
         if form.is_valid():
-            form.save()
+            addition = form.save()
             if not request.user.is_authenticated:
                 request.session.setdefault("additions", {})
-                request.session["additions"][product_id] = addition.quantity
+                request.session["additions"][product_id] = str(addition.quantity)
                 request.session.modified = True
-        page = request.session.get("page", 1)
-        return HttpResponseRedirect(
-            reverse("shop:catalog", kwargs={"page": page})
+        data = {
+            "product": product_id,
+            "quantity": str(addition.quantity),
+            "cart": cart.pk,
+        }
+        return self.action_response(data, form)
+
+    post.alters_data = True
+
+
+class CartView(View):
+    """
+    Display products in the cart with their discounted prices and totals.
+    Takes the same number of queries however many products there are.
+    """
+    template_name = "shop/cart.html"
+
+    def get(self, request, *args, **kwargs):
+        cart_id = get_cart_id(request)
+        group = pricing.customer_group(request.user)
+        additions = (
+            models.Addition.objects.filter(
+                cart_id=cart_id,
+                product__effective_prices__group=group,
+            )
+            .select_related("product")
+            .annotate(price=F("product__effective_prices__price"))
+            .annotate(amount=F("quantity") * F("price"))
+            .order_by("pk")
+        )
+        context = {
+            "additions": additions if cart_id else [],
+            "summary": (
+                models.Cart.get_summary(cart_id, group) if cart_id else None
+            ),
+            "checkout_button": _("Order"),
+        }
+        return render(request, self.template_name, context)
+
+
+class CheckoutView(ProductCardActionView):
+    """
+    Order everything in the cart marked to be ordered now.
+    """
+
+    def get_cart(self):
+        cart_id = get_cart_id(self.request)
+        return models.Cart.objects.filter(id=cart_id).first() if cart_id else None
+
+    def post(self, request, *args, **kwargs):
+        cart = self.get_cart()
+        try:
+            if cart is None:
+                raise ValidationError(
+                    _("There is nothing to order in the cart."), code="empty"
+                )
+            order = services.checkout(cart)
+        except ValidationError as e:
+            if self.wants_json():
+                return JsonResponse({"errors": e.messages}, status=400)
+            return self.action_response({})
+        if not request.user.is_authenticated:
+            request.session.pop("additions", None)
+        return self.action_response(
+            {"order": order.pk, "products": order.order_details.count()}
         )
 
     post.alters_data = True
@@ -180,28 +380,31 @@ class CatalogFilterView(View):
     form_class = forms.CatalogFilterForm
 
     def get(self, request, *args, **kwargs):
-        form = self.form_class(request.GET)
+        form = self.form_class(
+            request.GET,
+            group=pricing.customer_group(request.user),
+        )
         if form.is_valid():
-            price = form.cleaned_data["price"]
-            retail = form.cleaned_data["retail"]
-            categories = [form.cleaned_data[cat] for cat in form.categories]
-            conditions = self._get_query_conditions(price, retail, *categories)
-            kwargs["conditions"] = conditions
+            kwargs["conditions"] = form.get_query_conditions()
             view = CatalogView.as_view()
             return view(request, *args, **kwargs)
         else:
             # TODO: handle invalid form.
             pass
 
-    def _get_query_conditions(self, price, retail, *categories):
-        # Use lookups for Product instances.
-        q1 = Q(price__range=price)
-        conditions = [Q(category__in=cat) for cat in categories if cat.exists()]
-        if retail:
-            q2 = Q(min_order_quantity__lte=F("quantity")) & Q(quantity__gt=0)
-            conditions.append(q2)
-        conditions.append(q1)
-        return conditions
+
+def get_effective_discount(product):
+    """
+    Return the discount taken off the effective price of `product`, which
+    must be annotated with_effective_price(), or None.
+    """
+    if product.effective_discount_id is None:
+        return None
+    discounts = models.Discount.objects.all_cached()
+    return next(
+        (d for d in discounts if d.pk == product.effective_discount_id),
+        None,
+    )
 
 
 class ProductDetailView(DetailView):
@@ -210,10 +413,220 @@ class ProductDetailView(DetailView):
     """
     context_object_name = "product"
     queryset = models.Product.objects.filter(in_production=True)
+    related_products_limit = 4
+
+    def get_queryset(self):
+        self.group = pricing.customer_group(self.request.user)
+        return (
+            super().get_queryset()
+            .for_detail_page()
+            .with_effective_price(self.group)
+        )
+
+    def get_related_products(self):
+        return list(
+            models.Product.objects.filter(in_production=True)
+            .with_effective_price(self.group)
+            .with_like_count()
+            .related_to(self.object, limit=self.related_products_limit)
+        )
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
+        context["discount"] = get_effective_discount(self.object)
+        context["related_products"] = self.get_related_products()
         context["like"] = _("Like")
         context["add_to_cart_button"] = _("Add to cart")
         context["buy_now_button"] = _("Buy now")
         return context
+
+
+# Async counterparts of the views above for use under ASGI. They use the
+# async ORM so that a request doesn't occupy a thread while it waits for
+# the database. Sessions have no async API in this Django version and are
+# accessed through sync_to_async().
+
+
+class AsyncCatalogView(CatalogQuerysetMixin, View):
+    """
+    Display products. Async version of CatalogView without filters.
+    """
+    paginate_by = CatalogView.paginate_by
+    template_name = CatalogView.template_name
+    like_form = CatalogView.like_form
+    add_form = CatalogView.add_form
+    filter_form = CatalogView.filter_form
+    sort_form = CatalogView.sort_form
+
+    async def get(self, request, *args, **kwargs):
+        page = kwargs.get("page", 1)
+        await sync_to_async(request.session.__setitem__)("page", page)
+        # Looking up the user's price group and sort settings queries the
+        # cache and the session.
+        products = await sync_to_async(self.get_queryset)()
+        offset = (page - 1) * self.paginate_by
+        catalog = [p async for p in products[offset:offset + self.paginate_by]]
+        if not catalog and page != 1:
+            raise Http404("Invalid page.")
+        in_cart = await self.aget_cart_product_ids()
+        product_cards = [
+            (
+                product,
+                self.like_form(),
+                True if product.pk in in_cart
+                else self.add_form(initial={"product": product.pk}),
+            )
+            for product in catalog
+        ]
+        context = {
+            "view": self,
+            "catalog": catalog,
+            "product_cards": product_cards,
+            "sort_form": self.sort_form(),
+            "apply_button": _("Apply"),
+            "like_button": _("Like"),
+            "add_to_cart_button": _("Add to cart"),
+            "link_to_cart": _("To cart"),
+        }
+        # The filter form queries categories while being built and rendered.
+        return await sync_to_async(self.render_with_filter_form)(context)
+
+    async def aget_cart_product_ids(self):
+        user = await self.request.auser()
+        additions = models.Addition.objects.all()
+        if user.is_authenticated:
+            additions = additions.filter(cart__user=user)
+        else:
+            cart_id = await sync_to_async(self.request.session.get)("cart_id")
+            if cart_id is None:
+                return set()
+            additions = additions.filter(cart_id=cart_id)
+        return {
+            pk async for pk in additions.values_list("product_id", flat=True)
+        }
+
+    def render_with_filter_form(self, context):
+        context["filter_form"] = self.filter_form(
+            group=pricing.customer_group(self.request.user)
+        )
+        return render(self.request, self.template_name, context)
+
+
+class AsyncProductDetailView(View):
+    """
+    Display a product page. Async version of ProductDetailView.
+    """
+    template_name = "shop/product_detail.html"
+    related_products_limit = ProductDetailView.related_products_limit
+
+    async def get(self, request, *args, **kwargs):
+        user = await request.auser()
+        group = await sync_to_async(pricing.customer_group)(user)
+        products = models.Product.objects.filter(
+            in_production=True
+        ).with_effective_price(group)
+        try:
+            product = await products.for_detail_page().aget(pk=kwargs["pk"])
+        except models.Product.DoesNotExist:
+            raise Http404("Product does not exist.")
+        related = products.with_like_count().related_to(
+            product,
+            limit=self.related_products_limit,
+        )
+        discount = await sync_to_async(get_effective_discount)(product)
+        context = {
+            "view": self,
+            "product": product,
+            "discount": discount,
+            "related_products": [p async for p in related],
+            "like": _("Like"),
+            "add_to_cart_button": _("Add to cart"),
+            "buy_now_button": _("Buy now"),
+        }
+        # Templates may still query, e.g. through the user of the request.
+        return await sync_to_async(render)(request, self.template_name, context)
+
+
+class AsyncProductCardLikeView(ProductCardActionView):
+    form_class = forms.LikeForm
+
+    async def post(self, request, *args, **kwargs):
+        like_ = models.Like
+        product_id = kwargs["product_id"]
+        user = await request.auser()
+        try:
+            if user.is_authenticated:
+                like = (
+                    await like_.objects.aget_or_create(
+                        user=user,
+                        product_id=product_id,
+                    )
+                )[0]
+            else:
+                like = like_(product_id=product_id)
+                await like.asave()
+        except IntegrityError:
+            raise Http404("Product does not exist.")
+        form = self.form_class(request.POST, instance=like)
+        if form.is_valid():
+            like.liked = ~F("liked")
+            await like.asave(update_fields=["liked"])
+            await like.arefresh_from_db(fields=["liked"])
+            if not user.is_authenticated:
+                await sync_to_async(self.remember)("likes", product_id, like.liked)
+        data = {"product": product_id, "liked": like.liked}
+        if self.wants_json():
+            data["likes"] = await like_.objects.filter(
+                product_id=product_id,
+                liked=True,
+            ).acount()
+        return await sync_to_async(self.action_response)(data, form)
+
+    post.alters_data = True
+
+
+class AsyncProductCardAdditionView(ProductCardActionView):
+    form_class = forms.CreateAdditionForm
+
+    async def post(self, request, *args, **kwargs):
+        product_id = kwargs["product_id"]
+        user = await request.auser()
+        if user.is_authenticated:
+            cart = (await models.Cart.objects.aget_or_create(user=user))[0]
+        else:
+            cart_id = await sync_to_async(request.session.get)("cart_id")
+            cart = await models.Cart.objects.filter(id=cart_id).afirst()
+            if cart is None:
+                cart = models.Cart()
+                await cart.asave()
+                await sync_to_async(request.session.__setitem__)(
+                    "cart_id",
+                    cart.pk,
+                )
+        addition = (
+            await models.Addition.objects.filter(
+                cart=cart,
+                product_id=product_id,
+            ).afirst()
+        ) or models.Addition(cart=cart)
+        # Validating the product field may query the cache or the database.
+        form = self.form_class(request.POST, instance=addition)
+        if await sync_to_async(form.is_valid)():
+            # The product is cached on the instance by now, so saving with
+            # commit=False doesn't touch the database.
+            addition = form.save(commit=False)
+            await addition.asave()
+            if not user.is_authenticated:
+                await sync_to_async(self.remember)(
+                    "additions",
+                    product_id,
+                    str(addition.quantity),
+                )
+        data = {
+            "product": product_id,
+            "quantity": str(addition.quantity),
+            "cart": cart.pk,
+        }
+        return await sync_to_async(self.action_response)(data, form)
+
+    post.alters_data = True